@@ -0,0 +1,324 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+
+from runtime_state import STATE_DIR
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = os.path.join(STATE_DIR, 'admission.sqlite3')
+# OpenAI runs in flight at once on this machine, across all workers and scripts
+MAX_IN_FLIGHT = int(os.getenv('LLM_MAX_IN_FLIGHT', '32'))
+# Requests waiting for a slot, per process; beyond this new requests are shed right away
+MAX_QUEUED = int(os.getenv('LLM_MAX_QUEUED', '64'))
+# Slots batch work may never take, so interactive requests always have room
+BATCH_RESERVE = int(os.getenv('LLM_BATCH_RESERVE', '4'))
+# A lease not refreshed for this long belongs to a process that died without releasing it
+LEASE_TIMEOUT_SECONDS = 300
+# Leases are refreshed this often while held, however long the run holding them goes on
+LEASE_REFRESH_SECONDS = 60
+POLL_SECONDS = 0.2
+# How long a lease query waits on another process's write lock before giving up; a lease that
+# can't be taken now is retried by the poller, and a release a few times right away
+BUSY_TIMEOUT_SECONDS = 0.25
+RELEASE_ATTEMPTS = 5
+
+# Lower runs first
+FOLLOW_UP, INTERACTIVE, BATCH = 0, 1, 2
+PRIORITY_NAMES = {FOLLOW_UP: 'follow_up', INTERACTIVE: 'interactive', BATCH: 'batch'}
+# How long each kind of work may wait for a slot before it is shed
+WAIT_SECONDS = {FOLLOW_UP: 20, INTERACTIVE: 10, BATCH: 600}
+
+
+class Overloaded(Exception):
+    """No slot became free in time; the caller should retry after ``retry_after`` seconds."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Too many requests in flight, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class AdmissionControl:
+    """Caps the OpenAI runs in flight on this machine and queues the rest by priority.
+
+    Each holder of a slot has a lease row in a shared SQLite table, so every gunicorn worker and
+    the news script count against one limit. Inside a process, waiters are served in priority
+    order (follow-ups, then other interactive requests, then batch work). A waiter that finds
+    the queue full, or whose wait runs out, raises Overloaded instead of timing out later.
+    The SQLite work runs on worker threads, so lock contention never stalls the event loop.
+    """
+
+    def __init__(self, path=DB_PATH, max_in_flight=MAX_IN_FLIGHT, max_queued=MAX_QUEUED,
+                 batch_reserve=BATCH_RESERVE):
+        self.path = path
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.batch_reserve = batch_reserve
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+        self._held = set()  # IDs of this process's leases, kept fresh by the refresher thread
+        self._refresher = None
+        self._pid = None
+        self._loop = None
+        self._waiters = []  # heap of [priority, seq, future]
+        self._seq = itertools.count()
+        self._poller = None
+        self._dispatching = False
+        self._dispatch_again = False
+        self._hold_seconds = 10.0  # moving average of how long a slot is held
+        self.admitted = {name: 0 for name in PRIORITY_NAMES.values()}
+        self.shed = {name: 0 for name in PRIORITY_NAMES.values()}
+
+    def _for_this_process(self):
+        # Waiters and the poller belong to the loop of the process that created them
+        if self._pid != os.getpid():
+            self._waiters, self._poller, self._dispatching = [], None, False
+            self._pid = os.getpid()
+
+    def _connection(self):
+        # One connection per process; connections must not be carried across a fork
+        if self._conn is None or self._conn_pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_SECONDS, check_same_thread=False,
+                                   isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS leases (
+                    lease_id TEXT PRIMARY KEY,
+                    pid INTEGER NOT NULL,
+                    priority INTEGER NOT NULL,
+                    acquired_at REAL NOT NULL  -- refreshed while the lease is held
+                )''')
+            self._conn, self._conn_pid = conn, os.getpid()
+            # Leases held before a fork are the parent's to refresh and release
+            self._held, self._refresher = set(), None
+        return self._conn
+
+    def _try_lease(self, priority):
+        """Take a slot if one is free for this priority; the lease (id, acquired_at), or None.
+
+        Blocking: call it from a worker thread, not the event loop.
+        """
+        limit = self.max_in_flight - (self.batch_reserve if priority == BATCH else 0)
+        now = time.time()
+        with self._lock:
+            try:
+                conn = self._connection()
+                # Count and insert in one write transaction, so two processes can't take the last slot
+                conn.execute('BEGIN IMMEDIATE')
+            except sqlite3.OperationalError as e:
+                # Another process holds the write lock: no slot for now, the caller retries
+                logger.debug(f"Lease table busy: {str(e)}")
+                return None
+            try:
+                conn.execute('DELETE FROM leases WHERE acquired_at < ?', (now - LEASE_TIMEOUT_SECONDS,))
+                in_flight = conn.execute('SELECT COUNT(*) FROM leases').fetchone()[0]
+                lease = None
+                if in_flight < limit:
+                    lease = (uuid.uuid4().hex, now)
+                    conn.execute('INSERT INTO leases (lease_id, pid, priority, acquired_at) VALUES (?, ?, ?, ?)',
+                                 (lease[0], os.getpid(), priority, now))
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            if lease is not None:
+                self.admitted[PRIORITY_NAMES[priority]] += 1
+                self._held.add(lease[0])
+                if self._refresher is None or not self._refresher.is_alive():
+                    self._refresher = threading.Thread(target=self._refresh_held, name='lease-refresh', daemon=True)
+                    self._refresher.start()
+        return lease
+
+    def _refresh_held(self):
+        """Keep this process's leases from being reaped as abandoned while their runs go on."""
+        while True:
+            time.sleep(LEASE_REFRESH_SECONDS)
+            with self._lock:
+                held = list(self._held)
+                if not held:
+                    continue
+                try:
+                    self._connection().execute(
+                        f"UPDATE leases SET acquired_at = ? WHERE lease_id IN ({', '.join('?' * len(held))})",
+                        (time.time(), *held))
+                except sqlite3.OperationalError as e:
+                    # Retried on the next round, well within LEASE_TIMEOUT_SECONDS
+                    logger.warning(f"Could not refresh leases: {str(e)}")
+
+    async def _lease(self, priority):
+        """``_try_lease`` on a worker thread; a slot taken for a caller cancelled meanwhile is given back."""
+        attempt = asyncio.ensure_future(asyncio.to_thread(self._try_lease, priority))
+        try:
+            return await asyncio.shield(attempt)
+        except asyncio.CancelledError:
+            attempt.add_done_callback(self._release_unclaimed)
+            raise
+
+    def _release_unclaimed(self, attempt):
+        if not attempt.cancelled() and attempt.exception() is None and attempt.result() is not None:
+            self.release(attempt.result())
+
+    def retry_after(self):
+        """Seconds a shed request should wait, from the queue length and how long slots are held."""
+        backlog = (len(self._waiters) + 1) / max(self.max_in_flight, 1)
+        return min(max(math.ceil(self._hold_seconds * backlog), 1), 60)
+
+    def _overloaded(self, priority):
+        self.shed[PRIORITY_NAMES[priority]] += 1
+        return Overloaded(self.retry_after())
+
+    async def acquire(self, priority, wait=None):
+        """Wait for a slot, at most ``wait`` seconds (by default the priority's limit); returns a lease."""
+        self._for_this_process()
+        self._loop = asyncio.get_running_loop()
+        wait = WAIT_SECONDS[priority] if wait is None else wait
+        # Nobody is queued ahead: take a free slot right away
+        if not self._waiters:
+            lease = await self._lease(priority)
+            if lease is not None:
+                return lease
+        if len(self._waiters) >= self.max_queued:
+            raise self._overloaded(priority)
+
+        future = self._loop.create_future()
+        entry = [priority, next(self._seq), future]
+        heapq.heappush(self._waiters, entry)
+        if self._poller is None or self._poller.done():
+            # Slots freed by other processes are only noticed by polling
+            self._poller = asyncio.ensure_future(self._poll())
+        try:
+            return await asyncio.wait_for(future, wait)
+        except asyncio.TimeoutError:
+            raise self._overloaded(priority) from None
+        except BaseException:
+            # Cancelled just after being handed a slot: give it back
+            if future.done() and not future.cancelled():
+                self.release(future.result())
+            raise
+        finally:
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+
+    def _next_waiter(self):
+        """The highest-priority waiter still waiting, or None."""
+        while self._waiters and self._waiters[0][2].done():
+            heapq.heappop(self._waiters)
+        return self._waiters[0] if self._waiters else None
+
+    async def _dispatch(self):
+        """Hand free slots to queued waiters, highest priority first."""
+        if self._dispatching:
+            # A pass is already running; have it look again once it's done
+            self._dispatch_again = True
+            return
+        self._dispatching = True
+        try:
+            while True:
+                self._dispatch_again = False
+                waiter = self._next_waiter()
+                if waiter is None:
+                    return
+                priority = waiter[0]
+                lease = await self._lease(priority)
+                if lease is None:
+                    if self._dispatch_again:
+                        continue
+                    return
+                # Waiters may have timed out or arrived while the lease was being taken; a lower
+                # priority than the lease was taken for might not be entitled to it (batch reserve)
+                waiter = self._next_waiter()
+                if waiter is None or waiter[0] > priority:
+                    self.release(lease)
+                    if waiter is None:
+                        return
+                    continue
+                heapq.heappop(self._waiters)
+                waiter[2].set_result(lease)
+        finally:
+            self._dispatching = False
+
+    def _schedule_dispatch(self):
+        asyncio.ensure_future(self._dispatch())
+
+    async def _poll(self):
+        while self._waiters:
+            await asyncio.sleep(POLL_SECONDS)
+            await self._dispatch()
+
+    def _delete_lease(self, lease):
+        with self._lock:
+            self._held.discard(lease[0])
+        for attempt in range(RELEASE_ATTEMPTS):
+            try:
+                with self._lock:
+                    self._connection().execute('DELETE FROM leases WHERE lease_id = ?', (lease[0],))
+                break
+            except sqlite3.OperationalError as e:
+                if attempt == RELEASE_ATTEMPTS - 1:
+                    # The lease runs out after LEASE_TIMEOUT_SECONDS anyway
+                    logger.warning(f"Could not release lease {lease[0]}: {str(e)}")
+                    return
+                time.sleep(BUSY_TIMEOUT_SECONDS)
+        self._hold_seconds = 0.9 * self._hold_seconds + 0.1 * (time.time() - lease[1])
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._schedule_dispatch)
+
+    def release(self, lease):
+        """Give a slot back; safe to call from any thread, and from the event loop without blocking it."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._delete_lease(lease)
+        else:
+            loop.run_in_executor(None, self._delete_lease, lease)
+
+    @asynccontextmanager
+    async def slot(self, priority, wait=None):
+        with span('admission_wait', priority=PRIORITY_NAMES[priority]):
+            lease = await self.acquire(priority, wait)
+        try:
+            yield
+        finally:
+            self.release(lease)
+
+    @contextmanager
+    def blocking_slot(self, priority=BATCH, wait=None):
+        """A slot for synchronous scripts, polling until one is free or ``wait`` runs out."""
+        deadline = time.monotonic() + (WAIT_SECONDS[priority] if wait is None else wait)
+        lease = self._try_lease(priority)
+        while lease is None:
+            if time.monotonic() > deadline:
+                raise self._overloaded(priority)
+            time.sleep(POLL_SECONDS * 5)
+            lease = self._try_lease(priority)
+        try:
+            yield
+        finally:
+            self.release(lease)
+
+    def stats(self):
+        with self._lock:
+            in_flight = self._connection().execute('SELECT COUNT(*) FROM leases WHERE acquired_at >= ?',
+                                                   (time.time() - LEASE_TIMEOUT_SECONDS,)).fetchone()[0]
+        return {
+            'max_in_flight': self.max_in_flight,
+            'in_flight': in_flight,
+            'queued': len(self._waiters),
+            'max_queued': self.max_queued,
+            'admitted': dict(self.admitted),
+            'shed': dict(self.shed),
+            'avg_hold_seconds': round(self._hold_seconds, 2),
+        }
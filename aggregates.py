@@ -0,0 +1,351 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from datasets import register_derived
+from event_queries import event_date_index
+
+logger = logging.getLogger(__name__)
+
+ROUND_SECONDS = 300
+
+# Leading word(s) of "Winning Method" -> method category
+METHOD_CATEGORIES = {
+    'KO': 'KO/TKO',
+    'TKO': 'KO/TKO',
+    'Submission': 'Submission',
+    'Technical Submission': 'Submission',
+    'Decision': 'Decision',
+    'Technical Decision': 'Decision',
+    'Disqualification': 'DQ',
+    'Draw': 'Draw',
+    'No Contest': 'No Contest',
+}
+
+
+def method_category(methods):
+    """Map raw methods like "Submission (Kimura)" onto a handful of categories."""
+    prefix = methods.fillna('').str.replace(r'\s*\(.*$', '', regex=True).str.strip()
+    return prefix.map(METHOD_CATEGORIES).fillna('Other')
+
+
+def time_to_seconds(times):
+    """Convert "m:ss" strings to seconds; anything unparseable becomes 0."""
+    parts = times.fillna('').astype(str).str.extract(r'^(\d+):(\d{2})$')
+    return (pd.to_numeric(parts[0], errors='coerce') * 60
+            + pd.to_numeric(parts[1], errors='coerce')).fillna(0).astype(int)
+
+
+def build_fight_log(snapshot):
+    """One row per fighter per fight, newest fight first for each fighter."""
+    events = snapshot.frame('events')
+    category = method_category(events['Winning Method'])
+    rounds = events['Winning Round'].astype(int)
+    seconds = time_to_seconds(events['Winning Time'])
+
+    base = pd.DataFrame({
+        'fight_id': events.index,
+        'date': event_date_index(snapshot).dates,
+        'event': events['Event Name'],
+        'location': events['Event Location'],
+        'weight_class': events['Weight Class'],
+        'method': events['Winning Method'],
+        'method_category': category,
+        'round': rounds,
+        'time': events['Winning Time'],
+        'elapsed_seconds': (rounds - 1).clip(lower=0) * ROUND_SECONDS + seconds,
+        'referee': events['Referee'],
+        'fight_type': events['Fight Type'],
+    })
+
+    # Draws and no contests still list a "Winning Fighter", so the method decides the outcome
+    no_winner = np.select([category == 'Draw', category == 'No Contest'], ['D', 'NC'], default='')
+    fighter1_won = (events['Winning Fighter'] == events['Fighter 1']).to_numpy()
+
+    sides = []
+    for me, them, won in (('1', '2', fighter1_won), ('2', '1', ~fighter1_won)):
+        side = base.copy()
+        side['fighter_id'] = events[f'Fighter {me} ID'].to_numpy()
+        side['fighter'] = events[f'Fighter {me}'].to_numpy()
+        side['opponent_id'] = events[f'Fighter {them} ID'].to_numpy()
+        side['opponent'] = events[f'Fighter {them}'].to_numpy()
+        side['result'] = np.where(no_winner != '', no_winner, np.where(won, 'W', 'L'))
+        sides.append(side)
+
+    log = pd.concat(sides, ignore_index=True)
+    log = log[log['fighter_id'] != 0]
+    # Sherdog lists bouts latest-first, so within one date a lower row number is the later fight
+    return log.sort_values(['fighter_id', 'date', 'fight_id'], ascending=[True, False, True]).reset_index(drop=True)
+
+
+def fight_log(snapshot):
+    return snapshot.derived('fight_log', build_fight_log)
+
+
+def chronological_fights(events, dates):
+    """One row per fight in the order they happened, with a stable key for each one."""
+    category = method_category(events['Winning Method'])
+    fighter1_won = events['Winning Fighter'] == events['Fighter 1']
+    fights = pd.DataFrame({
+        'row': events.index,
+        'date': dates.dt.strftime('%Y-%m-%d'),
+        'fighter1_id': events['Fighter 1 ID'].astype(int),
+        'fighter2_id': events['Fighter 2 ID'].astype(int),
+        'fighter1': events['Fighter 1'],
+        'fighter2': events['Fighter 2'],
+        'weight_class': events['Weight Class'],
+        'event': events['Event Name'],
+        'method': events['Winning Method'],
+        'method_category': category,
+        'round': events['Winning Round'],
+        'time': events['Winning Time'],
+        # Score for fighter 1: 1 win, 0 loss, 0.5 draw, NaN for no contests (not rated)
+        'score': np.select(
+            [category == 'No Contest', category == 'Draw', fighter1_won],
+            [np.nan, 0.5, 1.0],
+            default=0.0,
+        ),
+        'finish': category.isin(['KO/TKO', 'Submission']),
+    })
+    fights = fights[(fights['fighter1_id'] != 0) & (fights['fighter2_id'] != 0) & fights['date'].notna()]
+    low = np.minimum(fights['fighter1_id'], fights['fighter2_id']).astype(str)
+    high = np.maximum(fights['fighter1_id'], fights['fighter2_id']).astype(str)
+    fights['key'] = fights['date'] + '|' + low + '|' + high
+    # Changes when a fight's result or method is corrected, which the key alone doesn't show
+    fights['signature'] = (fights['key'] + '|' + fights['score'].map(str)
+                           + '|' + fights['method'].fillna('').astype(str))
+    # The CSV lists events newest-first and bouts latest-first, so a higher row happened earlier
+    return fights.sort_values(['date', 'row'], ascending=[True, False]).reset_index(drop=True)
+
+
+def fight_table(snapshot):
+    return snapshot.derived('fight_table', lambda snap: chronological_fights(
+        snap.frame('events'), event_date_index(snap).dates))
+
+
+def build_fighter_physicals(snapshot):
+    """Birth date, height/reach in inches and stance per fighter, parsed from fighter_info.csv."""
+    fighters = snapshot.frame('fighters')
+    height = fighters['Height'].astype(str).str.extract(r"^(\d+)'(\d+)")
+    reach = fighters['Reach'].astype(str).str.extract(r'^(\d+(?:\.\d+)?)')[0]
+    return pd.DataFrame({
+        'fighter': fighters['Fighter'].to_numpy(),
+        'birth_date': pd.to_datetime(fighters['Birth Date'], format='%b %d, %Y', errors='coerce').to_numpy(),
+        'height_in': (pd.to_numeric(height[0], errors='coerce') * 12
+                      + pd.to_numeric(height[1], errors='coerce')).to_numpy(),
+        'reach_in': pd.to_numeric(reach, errors='coerce').to_numpy(),
+        'stance': fighters['Stance'].replace('', None).to_numpy(),
+    }, index=fighters['Fighter_ID'].to_numpy())
+
+
+def fighter_physicals(snapshot):
+    return snapshot.derived('fighter_physicals', build_fighter_physicals)
+
+
+def fight_fingerprints(log):
+    """A per-fighter hash of their fight rows, used to spot fighters whose history changed."""
+    # Row numbers shift when new events are prepended, so they are left out of the hash
+    columns = ['date', 'opponent_id', 'result', 'method', 'round', 'time', 'event']
+    row_hashes = pd.util.hash_pandas_object(log[columns], index=False)
+    return row_hashes.groupby(log['fighter_id']).sum()
+
+
+def compute_career_stats(log):
+    """Career aggregates for every fighter in ``log`` using group-wise vectorized operations."""
+    result = log['result']
+    category = log['method_category']
+    won, lost = result == 'W', result == 'L'
+    flags = pd.DataFrame({
+        'fights': 1,
+        'wins': won,
+        'losses': lost,
+        'draws': result == 'D',
+        'no_contests': result == 'NC',
+        'wins_ko': won & (category == 'KO/TKO'),
+        'wins_sub': won & (category == 'Submission'),
+        'wins_dec': won & (category == 'Decision'),
+        'losses_ko': lost & (category == 'KO/TKO'),
+        'losses_sub': lost & (category == 'Submission'),
+        'losses_dec': lost & (category == 'Decision'),
+        'main_events': log['fight_type'] == 'Main Event',
+    }).astype(int)
+    grouped = log.groupby('fighter_id', sort=False)
+    stats = flags.groupby(log['fighter_id'], sort=False).sum()
+
+    stats['fighter'] = grouped['fighter'].first()
+    finishes = stats['wins_ko'] + stats['wins_sub']
+    stats['finish_rate'] = (finishes / stats['wins'].where(stats['wins'] > 0)).fillna(0).round(3)
+    stats['finished_rate'] = ((stats['losses_ko'] + stats['losses_sub'])
+                              / stats['losses'].where(stats['losses'] > 0)).fillna(0).round(3)
+
+    # The log is newest-first, so a streak is the leading run of identical results
+    first_result = grouped['result'].transform('first')
+    broken = (result != first_result).astype(int).groupby(log['fighter_id'], sort=False).cummax()
+    streak_length = (broken == 0).groupby(log['fighter_id'], sort=False).sum()
+    streak_sign = grouped['result'].first().map({'W': 1, 'L': -1}).fillna(0).astype(int)
+    stats['current_streak'] = streak_length * streak_sign
+    stats['last_5'] = grouped.head(5).groupby('fighter_id', sort=False)['result'].agg(list)
+
+    stats['avg_fight_seconds'] = grouped['elapsed_seconds'].mean().round(1)
+    stats['total_fight_seconds'] = grouped['elapsed_seconds'].sum()
+    stats['first_fight_date'] = grouped['date'].min()
+    stats['last_fight_date'] = grouped['date'].max()
+    gaps = grouped['date'].diff().dt.days.abs()
+    stats['avg_days_between_fights'] = gaps.groupby(log['fighter_id'], sort=False).mean().round(1)
+    stats['last_opponent'] = grouped['opponent'].first()
+    stats['last_result'] = grouped['result'].first()
+    stats['last_method'] = grouped['method'].first()
+    return stats
+
+
+def build_career_stats(snapshot):
+    """Career aggregates per fighter, recomputed only for fighters whose fights changed."""
+    log = fight_log(snapshot)
+    fingerprints = fight_fingerprints(log)
+    previous = snapshot.previous.cached('career_stats') if snapshot.previous else None
+
+    if previous is None:
+        stats = compute_career_stats(log)
+    else:
+        old = previous['fingerprint'].reindex(fingerprints.index)
+        changed = fingerprints.index[old.isna() | (old != fingerprints)]
+        kept = previous.drop(index=changed, errors='ignore')
+        kept = kept[kept.index.isin(fingerprints.index)]
+        updated = compute_career_stats(log[log['fighter_id'].isin(changed)])
+        stats = pd.concat([kept.drop(columns=['fingerprint']), updated])
+        logger.info(f"Career stats rebuilt for {len(changed)} of {len(fingerprints)} fighters")
+
+    stats['fingerprint'] = fingerprints.reindex(stats.index)
+    return stats
+
+
+def career_stats(snapshot):
+    return snapshot.derived('career_stats', build_career_stats)
+
+
+register_derived('career_stats', build_career_stats)
+
+
+FINISH_CATEGORIES = ['KO/TKO', 'Submission']
+# Minute of the round a stoppage happened in
+STOPPAGE_MINUTES = ['0-1', '1-2', '2-3', '3-4', '4-5']
+
+
+def build_fight_outcomes(snapshot):
+    """Fight-level frame (one row per bout) with method category, stoppage timing and venue parts."""
+    events = snapshot.frame('events')
+    category = method_category(events['Winning Method'])
+    seconds = time_to_seconds(events['Winning Time'])
+    location = events['Event Location'].fillna('').str.split(', ')
+    return pd.DataFrame({
+        'event': events['Event Name'],
+        'date': event_date_index(snapshot).dates,
+        'referee': events['Referee'],
+        'method_category': category,
+        'finish': category.isin(FINISH_CATEGORIES),
+        'round': events['Winning Round'],
+        'stoppage_minute': pd.Categorical.from_codes(
+            (seconds // 60).clip(upper=len(STOPPAGE_MINUTES) - 1), STOPPAGE_MINUTES),
+        'elapsed_seconds': (events['Winning Round'] - 1).clip(lower=0) * ROUND_SECONDS + seconds,
+        'venue': location.str[0],
+        'city': location.str[1],
+        'country': location.str[-1],
+    })
+
+
+def fight_outcomes(snapshot):
+    return snapshot.derived('fight_outcomes', build_fight_outcomes)
+
+
+def _grouped_summary(fights, keys):
+    """Fight/event counts, finish rate and date range per group."""
+    grouped = fights.groupby(keys, sort=False)
+    summary = grouped.agg(
+        fights=('event', 'size'),
+        events=('event', 'nunique'),
+        finishes=('finish', 'sum'),
+        first_date=('date', 'min'),
+        last_date=('date', 'max'),
+    )
+    summary['finish_rate'] = (summary['finishes'] / summary['fights']).round(3)
+    summary['first_date'] = summary['first_date'].dt.strftime('%Y-%m-%d')
+    summary['last_date'] = summary['last_date'].dt.strftime('%Y-%m-%d')
+    return summary
+
+
+def build_referee_stats(snapshot):
+    """Per-referee finish rates, method mix and stoppage round/time distributions."""
+    fights = fight_outcomes(snapshot)
+    stoppages = fights[fights['finish']]
+    summary = _grouped_summary(fights, 'referee')
+    methods = pd.crosstab(fights['referee'], fights['method_category'])
+    rounds = pd.crosstab(stoppages['referee'], stoppages['round'])
+    minutes = pd.crosstab(stoppages['referee'], stoppages['stoppage_minute'], dropna=False)
+    avg_stoppage = stoppages.groupby('referee')['elapsed_seconds'].mean().round(1)
+
+    referees = []
+    for referee, row in summary.sort_values('fights', ascending=False).iterrows():
+        referees.append({
+            'referee': referee,
+            'fights': int(row['fights']),
+            'events': int(row['events']),
+            'finishes': int(row['finishes']),
+            'finish_rate': row['finish_rate'],
+            'methods': {k: int(v) for k, v in methods.loc[referee].items() if v},
+            'stoppage_rounds': {str(k): int(v) for k, v in rounds.loc[referee].items() if v}
+            if referee in rounds.index else {},
+            'stoppage_minutes': {str(k): int(v) for k, v in minutes.loc[referee].items()}
+            if referee in minutes.index else {},
+            'avg_stoppage_seconds': avg_stoppage.get(referee),
+            'first_fight': row['first_date'],
+            'last_fight': row['last_date'],
+        })
+    return referees
+
+
+def build_venue_stats(snapshot):
+    """Per-venue and per-country event counts and finish rates."""
+    fights = fight_outcomes(snapshot)
+    venues = _grouped_summary(fights, ['venue', 'city', 'country']).reset_index()
+    countries = _grouped_summary(fights, 'country')
+    countries['venues'] = fights.groupby('country', sort=False)['venue'].nunique()
+    countries = countries.reset_index()
+    return {
+        'venues': venues.sort_values(['events', 'fights'], ascending=False).to_dict(orient='records'),
+        'countries': countries.sort_values(['events', 'fights'], ascending=False).to_dict(orient='records'),
+    }
+
+
+def referee_stats(snapshot):
+    return snapshot.derived('referee_stats', build_referee_stats)
+
+
+def venue_stats(snapshot):
+    return snapshot.derived('venue_stats', build_venue_stats)
+
+
+register_derived('referee_stats', build_referee_stats)
+register_derived('venue_stats', build_venue_stats)
+
+
+def _json_value(value):
+    if isinstance(value, pd.Timestamp):
+        return value.date().isoformat() if not pd.isna(value) else None
+    if isinstance(value, (list, str)):
+        return value
+    if pd.isna(value):
+        return None
+    return value.item() if hasattr(value, 'item') else value
+
+
+def career_stats_record(stats, fighter_id):
+    """JSON-ready career stats for one fighter, or None if they have no recorded fights."""
+    if fighter_id not in stats.index:
+        return None
+    row = stats.loc[fighter_id].drop('fingerprint')
+    record = {column: _json_value(value) for column, value in row.items()}
+    # Layoff moves with the calendar, so it is computed when served rather than stored
+    today = pd.Timestamp.now(tz='UTC').tz_localize(None)
+    record['days_since_last_fight'] = (today - row['last_fight_date']).days
+    return record
@@ -1,17 +1,38 @@
 import os
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_file, send_from_directory, stream_with_context
 from flask_cors import CORS
-from openai import OpenAI
 import json
 import uuid
 from dotenv import load_dotenv
 import logging
-import time
 import base64
-import pandas as pd
 from datetime import datetime
 import re
 import openai
+import asyncio
+import threading
+from serialization import dumps, encode_object, json_response, records_json
+from datasets import get_snapshot
+from aggregates import career_stats, career_stats_record, referee_stats, venue_stats
+from ratings import leaderboard, rating_history, ratings, ratings_table
+from fight_graph import MAX_CHAIN_DEPTH, fight_graph
+from event_queries import InvalidQuery, event_date_index, filter_events, has_filters, parse_date_bound
+from search import event_search_index
+from simulation import MAX_ITERATIONS, simulate_fight
+from predictions import upcoming_predictions
+from previews import card_previews, event_slug
+from chat_runtime import ChatRuntime
+from chat_jobs import ChatJobs
+from response_cache import ResponseCache
+from image_cache import ImageCache
+from history_store import HistoryStore, conversation_turns
+from thread_store import open_thread_store
+from intents import IntentRouter
+from run_coalescer import RunCoalescer
+from tracing import Tracer, annotate, span
+from admission import FOLLOW_UP, INTERACTIVE, AdmissionControl, Overloaded
+from chat_tools import RUN_INSTRUCTIONS, RUN_TOOLS, tool_outputs
+from thread_pool import ThreadPool
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -23,17 +44,42 @@ load_dotenv()
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
-# Initialize OpenAI client with API key from environment variable
+# OpenAI API key from the environment
 api_key = os.getenv("OPENAI_API_KEY")
 if not api_key:
     logger.error("No OpenAI API key found in environment variables")
 else:
     logger.info(f"API key loaded (starts with: {api_key[:5]}...)")
 
-client = OpenAI(api_key=api_key)
+# Chat runs go through the async client on a shared event loop
+runtime = ChatRuntime(api_key)
+# Background chat runs started with {"async": true}, capped at CHAT_MAX_CONCURRENT_RUNS at a time
+chat_jobs = ChatJobs(runtime)
 
-# Store conversation threads
-threads = {}
+# Stat lookups answered straight from the datasets
+intent_router = IntentRouter()
+# Conversation -> thread mapping, shared by all workers (state/threads.sqlite3)
+thread_store = open_thread_store()
+# Conversation -> task writing a turn answered without a run (cache or local lookup) to its thread
+pending_turns = {}
+response_cache = ResponseCache()
+# Per-phase timings of recent chat and history requests, browsable at /api/debug/traces
+tracer = Tracer()
+# Caps OpenAI runs in flight on this machine (LLM_MAX_IN_FLIGHT), shared with the news script
+admission = AdmissionControl()
+# Chat requests that hold a worker thread while a run goes on (sync /api/chat, streams, job long-polls)
+# are capped below the thread count, so the data routes always have threads free
+MAX_BLOCKING_CHATS = int(os.getenv('MAX_BLOCKING_CHATS', str(max(int(os.getenv('GUNICORN_THREADS', '64')) * 3 // 4, 1))))
+blocking_chats = threading.BoundedSemaphore(MAX_BLOCKING_CHATS)
+# Identical first-turn prompts sent while one is being answered share its run, across workers
+run_coalescer = RunCoalescer()
+# Empty threads created ahead of time, so a new conversation starts without waiting for one
+thread_pool = ThreadPool(runtime)
+# Generated images, downloaded from OpenAI once and served by URL
+image_cache = ImageCache(runtime)
+# Local copies of thread messages, synced incrementally for /api/chat/history
+# (format_history_content is defined with the chat routes below)
+history_store = HistoryStore(runtime, lambda msg: format_history_content(msg))
 
 # Assistant ID from your assistants.py script
 ASSISTANT_ID = "asst_QIEMCdBCqsX4al7O4Jg2Jjpx"
@@ -51,6 +97,49 @@ def clean_markdown_simple(text):
     
     return text
 
+class MarkdownStreamCleaner:
+    """Apply clean_markdown_simple to text that arrives in pieces.
+
+    Only the start of a line that could still turn into a heading marker is held back;
+    everything else is passed through as soon as it arrives. As in clean_markdown_simple, a
+    marker's whitespace runs on across blank lines, so "#" followed by newlines is one marker.
+    """
+
+    HEADING = re.compile(r'#+\s+')
+    PARTIAL_HEADING = re.compile(r'#+\s*')
+
+    def __init__(self):
+        self.pending = ''
+        self.line_start = True
+
+    def feed(self, text):
+        text = self.pending + (text or '')
+        self.pending = ''
+        cleaned = []
+        pos = 0
+        while pos < len(text):
+            if self.line_start:
+                if self.PARTIAL_HEADING.fullmatch(text, pos):
+                    # "##", "## " or "#\n" may still be followed by more of the marker
+                    self.pending = text[pos:]
+                    break
+                heading = self.HEADING.match(text, pos)
+                if heading:
+                    # A marker ending in a newline leaves the next line's start open to another one
+                    pos = heading.end()
+                    self.line_start = text[pos - 1] == '\n'
+                    continue
+            newline = text.find('\n', pos)
+            end = len(text) if newline == -1 else newline + 1
+            cleaned.append(text[pos:end])
+            pos = end
+            self.line_start = newline != -1
+        return re.sub(r'\*+', '', ''.join(cleaned))
+
+    def flush(self):
+        text, self.pending = self.pending, ''
+        return '' if self.HEADING.fullmatch(text) else text
+
 @app.route('/')
 def home():
     return "Flask App is Running! API is available at /api/chat and /api/examples"
@@ -65,53 +154,17 @@ def serve_data_file(filename):
 @app.route('/api/data/fighters', methods=['GET'])
 def get_fighters():
     try:
-        # Read the CSV file
-        fighters_df = pd.read_csv('data/fighter_info.csv')
-        
-        # Replace string "None" or "NULL" values with proper None/null
-        fighters_df = fighters_df.replace(["None", "NULL", "NaN"], None)
+        # Cleaned records are encoded once per data version and reused between requests
+        snapshot = get_snapshot()
+        fighters_json = snapshot.derived('fighters_json', lambda snap: records_json(snap.frame('fighters')))
         
-        # Fill nullable columns that should never be null with appropriate values
-        fighters_df["Wins"] = fighters_df["Wins"].fillna(0)
-        fighters_df["Losses"] = fighters_df["Losses"].fillna(0)
-        fighters_df["Win_Decision"] = fighters_df["Win_Decision"].fillna(0)
-        fighters_df["Win_KO"] = fighters_df["Win_KO"].fillna(0)
-        fighters_df["Win_Sub"] = fighters_df["Win_Sub"].fillna(0)
-        fighters_df["Loss_Decision"] = fighters_df["Loss_Decision"].fillna(0)
-        fighters_df["Loss_KO"] = fighters_df["Loss_KO"].fillna(0)
-        fighters_df["Loss_Sub"] = fighters_df["Loss_Sub"].fillna(0)
-        fighters_df["Fighter_ID"] = fighters_df["Fighter_ID"].fillna(0)
-        
-        # For Reach, replace '-' with empty string to keep it as a string
-        fighters_df["Reach"] = fighters_df["Reach"].replace('-', '')
-        # For Stance, replace '-' with empty string
-        fighters_df["Stance"] = fighters_df["Stance"].replace('-', '')
-        # Fill any remaining nulls with empty strings for string columns
-        fighters_df["Reach"] = fighters_df["Reach"].fillna('')
-        fighters_df["Stance"] = fighters_df["Stance"].fillna('')
-        
-        # Ensure integer fields are properly formatted as integers
-        int_columns = ["Wins", "Losses", "Win_Decision", "Win_KO", "Win_Sub", 
-                       "Loss_Decision", "Loss_KO", "Loss_Sub", "Fighter_ID"]
-        for col in int_columns:
-            fighters_df[col] = fighters_df[col].astype(int)
-        
-        # Make sure Reach is treated as a string to match Swift's expectation
-        # Convert any numeric values to strings with one decimal place if needed
-        fighters_df["Reach"] = fighters_df["Reach"].apply(
-            lambda x: f"{float(x):.1f}" if isinstance(x, (int, float)) and x != '' else str(x)
+        # Encode the records once and splice them into the response with a timestamp for caching
+        body = encode_object(
+            {'timestamp': datetime.now().isoformat()},
+            fighters=fighters_json
         )
         
-        # Convert to dictionary format with appropriate handling of null values
-        fighters_data = json.loads(fighters_df.to_json(orient='records', date_format='iso'))
-        
-        # Add timestamp for caching
-        response = {
-            'timestamp': datetime.now().isoformat(),
-            'fighters': fighters_data
-        }
-        
-        return jsonify(response)
+        return json_response(body)
     except Exception as e:
         logger.error(f"Error fetching fighter data: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -119,36 +172,336 @@ def get_fighters():
 @app.route('/api/data/events', methods=['GET'])
 def get_events():
     try:
-        # Read the CSV file
-        events_df = pd.read_csv('data/event_data_sherdog.csv')
-        
-        # Replace string "None" or "NULL" values with proper None/null
-        events_df = events_df.replace(["None", "NULL", "NaN"], None)
-        
-        # Fill nullable columns that should never be null with appropriate values
-        events_df["Fighter 1 ID"] = events_df["Fighter 1 ID"].fillna(0)
-        events_df["Fighter 2 ID"] = events_df["Fighter 2 ID"].fillna(0)
-        events_df["Winning Round"] = events_df["Winning Round"].fillna(0)
-        
-        # Ensure integer fields are properly formatted as integers
-        int_columns = ["Fighter 1 ID", "Fighter 2 ID", "Winning Round"]
-        for col in int_columns:
-            events_df[col] = events_df[col].astype(int)
-        
-        # Convert to dictionary format with appropriate handling of null values
-        events_data = json.loads(events_df.to_json(orient='records', date_format='iso'))
+        # Cleaned records are encoded once per data version and reused between requests
+        snapshot = get_snapshot()
+        if has_filters(request.args):
+            filtered = filter_events(snapshot.frame('events'), request.args, event_date_index(snapshot))
+            events_json = records_json(filtered)
+        else:
+            events_json = snapshot.derived('events_json', lambda snap: records_json(snap.frame('events')))
         
-        # Add timestamp for caching
-        response = {
-            'timestamp': datetime.now().isoformat(),
-            'events': events_data
-        }
+        # Encode the records once and splice them into the response with a timestamp for caching
+        body = encode_object(
+            {'timestamp': datetime.now().isoformat()},
+            events=events_json
+        )
         
-        return jsonify(response)
+        return json_response(body)
+    except InvalidQuery as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error fetching event data: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/data/fighters/<int:fighter_id>/stats', methods=['GET'])
+def get_fighter_stats(fighter_id):
+    """Return precomputed career aggregates (UFC record, finish rate, streak, form, layoff)."""
+    try:
+        snapshot = get_snapshot()
+        stats = career_stats_record(career_stats(snapshot), fighter_id)
+        if stats is None:
+            return jsonify({'error': f'No fights found for fighter {fighter_id}'}), 404
+        return json_response({
+            'fighter_id': fighter_id,
+            'stats': stats,
+            'data_version': snapshot.version
+        })
+    except Exception as e:
+        logger.error(f"Error fetching fighter stats: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/ratings', methods=['GET'])
+def get_ratings():
+    """Return the Elo leaderboard, optionally filtered to one division."""
+    try:
+        snapshot = get_snapshot()
+        table = leaderboard(
+            ratings(snapshot),
+            division=request.args.get('division', type=str),
+            limit=request.args.get('limit', default=25, type=int),
+            min_fights=request.args.get('min_fights', default=3, type=int),
+            active_days=request.args.get('active_days', default=730, type=int)
+        )
+        body = encode_object({'data_version': snapshot.version}, ratings=records_json(table))
+        return json_response(body)
+    except Exception as e:
+        logger.error(f"Error fetching ratings: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/ratings/leaderboards', methods=['GET'])
+def get_rating_leaderboards():
+    """Return the top rated active fighters in every division."""
+    try:
+        snapshot = get_snapshot()
+        state = ratings(snapshot)
+        limit = request.args.get('limit', default=10, type=int)
+        divisions = sorted({d for d in state.divisions.values() if d})
+        boards = {}
+        for division in divisions:
+            table = leaderboard(state, division=division, limit=limit)
+            if not table.empty:
+                boards[division] = table.to_dict(orient='records')
+        return json_response({'data_version': snapshot.version, 'leaderboards': boards})
+    except Exception as e:
+        logger.error(f"Error fetching rating leaderboards: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/ratings/<int:fighter_id>', methods=['GET'])
+def get_fighter_rating(fighter_id):
+    """Return a fighter's current rating, overall rank and rating history."""
+    try:
+        snapshot = get_snapshot()
+        state = ratings(snapshot)
+        if fighter_id not in state.ratings:
+            return jsonify({'error': f'No rated fights for fighter {fighter_id}'}), 404
+        table = ratings_table(state)
+        row = table[table['fighter_id'] == fighter_id].iloc[0]
+        return json_response({
+            'fighter_id': fighter_id,
+            'fighter': state.names.get(fighter_id),
+            'division': state.divisions.get(fighter_id),
+            'rating': row['rating'],
+            'rank': int(row.name) + 1,
+            'fights': state.fight_counts.get(fighter_id, 0),
+            'history': rating_history(state, fighter_id),
+            'data_version': snapshot.version
+        })
+    except Exception as e:
+        logger.error(f"Error fetching fighter rating: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+def resolve_fighter_pair(graph):
+    """Resolve the fighter1/fighter2 query parameters (IDs or full names) against the fight graph."""
+    pair = []
+    for param in ('fighter1', 'fighter2'):
+        value = request.args.get(param, default='', type=str)
+        fighter_id = graph.resolve(value)
+        if fighter_id is None:
+            return None, (jsonify({'error': f"Unknown fighter for '{param}': '{value}'"}), 404)
+        pair.append({'id': fighter_id, 'name': graph.names.get(fighter_id)})
+    return pair, None
+
+@app.route('/api/graph/head_to_head', methods=['GET'])
+def get_head_to_head():
+    """Return every fight between two fighters, newest first."""
+    try:
+        graph = fight_graph(get_snapshot())
+        pair, error = resolve_fighter_pair(graph)
+        if error:
+            return error
+        return json_response({
+            'fighter1': pair[0],
+            'fighter2': pair[1],
+            'fights': graph.head_to_head(pair[0]['id'], pair[1]['id'])
+        })
+    except Exception as e:
+        logger.error(f"Error fetching head to head: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/graph/common_opponents', methods=['GET'])
+def get_common_opponents():
+    """Return opponents both fighters have faced and how each of them did."""
+    try:
+        graph = fight_graph(get_snapshot())
+        pair, error = resolve_fighter_pair(graph)
+        if error:
+            return error
+        return json_response({
+            'fighter1': pair[0],
+            'fighter2': pair[1],
+            'common_opponents': graph.common_opponents(pair[0]['id'], pair[1]['id'])
+        })
+    except Exception as e:
+        logger.error(f"Error fetching common opponents: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/graph/win_chain', methods=['GET'])
+def get_win_chain():
+    """Return the shortest "MMA math" win chain in each direction between two fighters."""
+    try:
+        graph = fight_graph(get_snapshot())
+        pair, error = resolve_fighter_pair(graph)
+        if error:
+            return error
+        max_depth = min(request.args.get('max_depth', default=4, type=int), MAX_CHAIN_DEPTH)
+        return json_response({
+            'fighter1': pair[0],
+            'fighter2': pair[1],
+            'max_depth': max_depth,
+            'fighter1_over_fighter2': graph.win_chain(pair[0]['id'], pair[1]['id'], max_depth),
+            'fighter2_over_fighter1': graph.win_chain(pair[1]['id'], pair[0]['id'], max_depth)
+        })
+    except Exception as e:
+        logger.error(f"Error fetching win chain: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/search/events', methods=['GET'])
+def search_events():
+    """Ranked full-text search over fights, accepting "quoted phrases" and the events API filters."""
+    query = request.args.get('q', default='', type=str).strip()
+    if not query:
+        return jsonify({'error': "Missing search query 'q'"}), 400
+    try:
+        snapshot = get_snapshot()
+        events = snapshot.frame('events')
+        limit = request.args.get('limit', default=20, type=int)
+        offset = request.args.get('offset', default=0, type=int)
+        candidates = None
+        if has_filters(request.args):
+            candidates = set(filter_events(events, request.args, event_date_index(snapshot)).index)
+
+        total, hits = event_search_index(snapshot).search(query, candidates, limit, offset)
+        results = events.loc[[row for row, _ in hits]].to_dict(orient='records')
+        for result, (_, score) in zip(results, hits):
+            result['score'] = score
+
+        return json_response({
+            'query': query,
+            'total': total,
+            'limit': limit,
+            'offset': offset,
+            'results': results
+        })
+    except InvalidQuery as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error searching events: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+def card_summary(card):
+    """JSON-ready summary of one card from the event date index."""
+    return {
+        'eventName': card['event'],
+        'location': card['location'],
+        'date': card['date'].isoformat(),
+        'mainEvent': f"{card['main_event']} vs. {card['main_event_opponent']}",
+        'fights': int(card['fights'])
+    }
+
+@app.route('/api/data/events/recent', methods=['GET'])
+def get_recent_events():
+    """Return the N most recent cards (optionally before a date) from the sorted event index."""
+    try:
+        index = event_date_index(get_snapshot())
+        n = request.args.get('n', default=5, type=int)
+        before = request.args.get('before', type=str)
+        cards = index.recent_cards(n, before=parse_date_bound(before, name='before') if before else None)
+        return json_response({'events': [card_summary(card) for _, card in cards.iterrows()]})
+    except InvalidQuery as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error fetching recent events: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/data/events/next', methods=['GET'])
+def get_next_event():
+    """Return the next upcoming card on or after today (or the given date)."""
+    try:
+        index = event_date_index(get_snapshot())
+        after = request.args.get('after', default=datetime.now().date().isoformat(), type=str)
+        card = index.next_card(parse_date_bound(after, name='after'))
+        if card is None:
+            return jsonify({'error': 'No upcoming event found'}), 404
+        return json_response({'event': card_summary(card)})
+    except InvalidQuery as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error fetching next event: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/data/referees', methods=['GET'])
+def get_referees():
+    """Return precomputed per-referee finish rates, method mix and stoppage distributions."""
+    try:
+        snapshot = get_snapshot()
+        referees = referee_stats(snapshot)
+        name = request.args.get('referee', default='', type=str).strip().lower()
+        min_fights = request.args.get('min_fights', default=0, type=int)
+        if name or min_fights:
+            referees = [r for r in referees
+                        if name in r['referee'].lower() and r['fights'] >= min_fights]
+            return json_response({'data_version': snapshot.version, 'referees': referees})
+        body = snapshot.derived('referees_json', lambda snap: dumps(referee_stats(snap)))
+        return json_response(encode_object({'data_version': snapshot.version}, referees=body))
+    except Exception as e:
+        logger.error(f"Error fetching referee stats: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/data/venues', methods=['GET'])
+def get_venues():
+    """Return precomputed per-venue and per-country event counts and finish rates."""
+    try:
+        snapshot = get_snapshot()
+        country = request.args.get('country', default='', type=str).strip().lower()
+        if country:
+            stats = venue_stats(snapshot)
+            return json_response({
+                'data_version': snapshot.version,
+                'venues': [v for v in stats['venues'] if v['country'].lower() == country],
+                'countries': [c for c in stats['countries'] if c['country'].lower() == country]
+            })
+        venues, countries = snapshot.derived('venues_json', lambda snap: (
+            dumps(venue_stats(snap)['venues']), dumps(venue_stats(snap)['countries'])))
+        body = encode_object({'data_version': snapshot.version}, venues=venues, countries=countries)
+        return json_response(body)
+    except Exception as e:
+        logger.error(f"Error fetching venue stats: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/simulate', methods=['GET'])
+def simulate():
+    """Run a seeded Monte Carlo simulation of a fight from both fighters' historical rates."""
+    try:
+        snapshot = get_snapshot()
+        pair, error = resolve_fighter_pair(fight_graph(snapshot))
+        if error:
+            return error
+        if pair[0]['id'] == pair[1]['id']:
+            return jsonify({'error': 'fighter1 and fighter2 must be different fighters'}), 400
+        n = request.args.get('n', default=10000, type=int)
+        rounds = request.args.get('rounds', default=3, type=int)
+        if not 1 <= n <= MAX_ITERATIONS:
+            return jsonify({'error': f'n must be between 1 and {MAX_ITERATIONS}'}), 400
+        if rounds not in (3, 5):
+            return jsonify({'error': 'rounds must be 3 or 5'}), 400
+        result = simulate_fight(
+            snapshot, pair[0]['id'], pair[1]['id'],
+            iterations=n,
+            seed=request.args.get('seed', type=int),
+            rounds=rounds
+        )
+        result['data_version'] = snapshot.version
+        return json_response(result)
+    except Exception as e:
+        logger.error(f"Error running simulation: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/predictions/upcoming', methods=['GET'])
+def get_upcoming_predictions():
+    """Serve win probabilities for the upcoming card, scored when the data was published."""
+    try:
+        body = upcoming_predictions(get_snapshot())
+        if body is None:
+            # Scoring runs in the background after new data loads; never on this request
+            return json_response({'error': 'Predictions are still being built'}, status=503,
+                                 headers={'Retry-After': '10'})
+        return json_response(body)
+    except Exception as e:
+        logger.error(f"Error fetching upcoming predictions: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/data/upcoming/<path:event>/preview', methods=['GET'])
+def get_card_preview(event):
+    """Serve the precomputed preview for an upcoming card, looked up by event name or slug."""
+    try:
+        body = card_previews(get_snapshot()).get(event_slug(event))
+        if body is None:
+            return jsonify({'error': f'No upcoming event found for "{event}"'}), 404
+        return json_response(body)
+    except Exception as e:
+        logger.error(f"Error fetching card preview: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/data/version', methods=['GET'])
 def get_data_version():
     try:
@@ -162,13 +515,290 @@ def get_data_version():
         return jsonify({
             'fighter_data_version': fighter_timestamp,
             'event_data_version': event_timestamp,
+            'manifest_version': get_snapshot().version,
             'timestamp': datetime.now().isoformat()
         })
     except Exception as e:
         logger.error(f"Error fetching data version: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+async def start_turn(conversation_id, user_input, assistant_id=None):
+    """Add the user's message to the conversation's thread, creating the thread if needed."""
+    if conversation_id in pending_turns:
+        # A turn answered without a run is still being written to the thread
+        await pending_turns[conversation_id]
+    record = await thread_store.aget(conversation_id) if conversation_id else None
+    if record is None:
+        # Take a new thread from the pool (created in the Assistants API if the pool is empty)
+        with span('thread_create'):
+            thread_id = await thread_pool.take()
+        conversation_id = thread_id  # Use thread_id as conversation_id
+        await thread_store.aput(conversation_id, thread_id, assistant_id)
+        logger.info(f"Created new thread with ID: {thread_id}")
+    else:
+        thread_id = record['thread_id']
+
+    with span('message_post'):
+        await runtime.client.beta.threads.messages.create(
+            thread_id=thread_id,
+            role="user",
+            content=user_input
+        )
+    await thread_store.atouch(conversation_id, assistant_id, messages=1)
+    return conversation_id, thread_id
+
+def format_image(file_id):
+    """Response item for a generated image, served from the image cache by URL."""
+    url = f"/api/chat/images/{file_id}"
+    return {
+        "type": "image",
+        "format": "png",
+        "file_id": file_id,
+        "url": url,
+        "content": url
+    }
+
+def wants_inline_images(value):
+    """Whether an ``inline_images`` flag, from a JSON body or a query string, asks for data URLs.
+
+    Inlining is the default, since the shipped iOS app only decodes data URLs; clients that load
+    images by URL opt out with ``inline_images=false``.
+    """
+    if value is None:
+        return True
+    if isinstance(value, str):
+        return value.strip().lower() not in ('0', 'false', 'no')
+    return bool(value)
+
+def inline_images(items):
+    """Replace image URLs with base64 data URLs, for clients that can't load images by URL."""
+    inlined = []
+    for item in items:
+        if item.get("type") == "image" and item.get("file_id"):
+            encoded_image = base64.b64encode(image_cache.read(item["file_id"])).decode('utf-8')
+            item = {**item, "content": f"data:image/png;base64,{encoded_image}"}
+        inlined.append(item)
+    return inlined
+
+async def format_assistant_content(content, text=None):
+    """Convert an assistant message's content blocks to the response items sent to the app.
+
+    ``text`` optionally replaces the message text, e.g. when it was already cleaned while streaming.
+    """
+    # Download the message's images into the cache, all at once, before the client asks for them
+    file_ids = [item.image_file.file_id for item in content if item.type == "image_file"]
+    if file_ids:
+        with span('image_download', images=len(file_ids)):
+            await asyncio.gather(*(image_cache.fetch(file_id) for file_id in file_ids))
+    response_data = []
+    for content_item in content:
+        if content_item.type == "text":
+            # Capture text annotations
+            annotations = [
+                {
+                    "type": "file",
+                    "text": annotation.text,
+                    "file_id": annotation.file_path.file_id
+                } for annotation in content_item.text.annotations
+                if annotation.type == "file_path"
+            ]
+            if text is None:
+                # Clean markdown symbols
+                with span('markdown_cleanup'):
+                    text_content = clean_markdown_simple(content_item.text.value)
+            else:
+                text_content = text
+            response_data.append({
+                "type": "text",
+                "content": text_content,
+                "annotations": annotations
+            })
+        elif content_item.type == "image_file":
+            response_data.append(format_image(content_item.image_file.file_id))
+    return response_data
+
+def run_overrides(assistant_id):
+    """Tools and instructions added to a run, for the default assistant only.
+
+    A custom assistant keeps its own tools (e.g. file_search) and instructions.
+    """
+    if assistant_id != ASSISTANT_ID:
+        return {}
+    return {"tools": RUN_TOOLS, "additional_instructions": RUN_INSTRUCTIONS}
+
+async def answer_tool_calls(run):
+    """Outputs for the function calls a run is waiting on, computed from the current datasets."""
+    calls = run.required_action.submit_tool_outputs.tool_calls
+    logger.info(f"Answering function calls: {[call.function.name for call in calls]}")
+    # Off the event loop, so other chats keep moving while the tools run
+    with span('tool_execution', tools=[call.function.name for call in calls]):
+        return await asyncio.to_thread(tool_outputs, get_snapshot(), calls)
+
+async def run_chat_turn(conversation_id, user_input, assistant_id):
+    """Run one chat turn on the runtime loop: returns (conversation_id, run status, response items).
+
+    The turn first waits for an admission slot, and raises Overloaded if none frees up in time.
+    """
+    async with admission.slot(FOLLOW_UP if conversation_id else INTERACTIVE):
+        # Create new thread if none exists, then add the user message to it
+        conversation_id, thread_id = await start_turn(conversation_id, user_input, assistant_id)
+
+        # Create run with text response format
+        with span('run_create'):
+            run = await runtime.client.beta.threads.runs.create(
+                thread_id=thread_id,
+                assistant_id=assistant_id,
+                **run_overrides(assistant_id)
+                # response_format={"type": "text"},
+                # instructions="Please provide responses in plain text only. Avoid using markdown formatting symbols like asterisks and hash symbols."
+            )
+
+        # Wait for completion without holding a thread, answering function calls as they come
+        run = await runtime.wait_for_run(thread_id, run)
+        while run.status == "requires_action":
+            outputs = await answer_tool_calls(run)
+            with span('tool_submit'):
+                run = await runtime.client.beta.threads.runs.submit_tool_outputs(
+                    thread_id=thread_id,
+                    run_id=run.id,
+                    tool_outputs=outputs
+                )
+            run = await runtime.wait_for_run(thread_id, run)
+        usage = getattr(run, 'usage', None)
+        if usage is not None:
+            annotate(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens,
+                     total_tokens=usage.total_tokens)
+        if run.status != "completed":
+            return conversation_id, run.status, None
+
+        # Get the assistant's response
+        with span('messages_list'):
+            messages = await runtime.client.beta.threads.messages.list(thread_id=thread_id)
+
+        # Get the most recent assistant message
+        response_data = []
+        for msg in messages.data:
+            if msg.role == "assistant":
+                response_data = await format_assistant_content(msg.content)
+                if response_data:
+                    break
+        await thread_store.atouch(conversation_id, messages=1)
+        return conversation_id, run.status, response_data
+
+async def record_local_turn(conversation_id, user_input, response_data, previous=None):
+    """Add a turn answered without a run to the conversation's thread, so follow-ups keep the context."""
+    try:
+        if previous is not None:
+            # Keep turns in order when the conversation already has one being recorded
+            await previous
+        reply = "\n\n".join(item["content"] for item in response_data if item["type"] == "text")
+        messages = [
+            {"role": "user", "content": user_input},
+            {"role": "assistant", "content": reply or "(image)"}
+        ]
+        record = await thread_store.aget(conversation_id)
+        if record is None:
+            thread = await runtime.client.beta.threads.create(messages=messages)
+            await thread_store.aput(conversation_id, thread.id, message_count=2)
+            logger.info(f"Created thread {thread.id} for conversation {conversation_id}")
+        else:
+            for message in messages:
+                await runtime.client.beta.threads.messages.create(thread_id=record['thread_id'], **message)
+            await thread_store.atouch(conversation_id, messages=2)
+    except Exception as e:
+        # The thread is missing or lacks this turn: forget it, so the next turn starts a fresh one
+        logger.error(f"Could not record turn for conversation {conversation_id}: {str(e)}")
+        await thread_store.adelete(conversation_id)
+    finally:
+        if pending_turns.get(conversation_id) is asyncio.current_task():
+            del pending_turns[conversation_id]
+
+async def local_reply(conversation_id, user_input, response_data, **fields):
+    """The /api/chat body for a turn answered without an assistant run (from the cache or the datasets).
+
+    The reply goes back right away; the turn is written to the conversation's thread in the background.
+    """
+    conversation_id = conversation_id or uuid.uuid4().hex
+    pending_turns[conversation_id] = asyncio.ensure_future(record_local_turn(
+        conversation_id, user_input, response_data, previous=pending_turns.get(conversation_id)))
+    return {"response": response_data, "conversation_id": conversation_id, **fields}, 200
+
+def text_items(text):
+    return [{"type": "text", "content": text, "annotations": []}]
+
+async def chat_reply(conversation_id, user_input, assistant_id, cache_key=None):
+    """The /api/chat response body and status code for one chat turn.
+
+    ``cache_key`` is given for first-turn messages, which are answered from the response cache when possible,
+    or else share the run of an identical message already being answered.
+    """
+    if cache_key is not None:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"Answered from the response cache: '{user_input}'")
+            annotate(source='cache')
+            return await local_reply(None, user_input, cached["response"], cached=True)
+
+        turn = {}
+
+        async def first_turn():
+            turn['result'] = await run_chat_turn(None, user_input, assistant_id)
+            _, status, response_data = turn['result']
+            return response_data if status == "completed" and response_data else None
+
+        response_data, shared = await run_coalescer.run(cache_key, first_turn)
+        if shared:
+            logger.info(f"Answered from an identical run already in progress: '{user_input}'")
+            annotate(source='coalesced')
+            response_cache.put(cache_key, {"response": response_data})
+            return await local_reply(None, user_input, response_data, coalesced=True)
+        conversation_id, status, response_data = turn['result']
+    else:
+        conversation_id, status, response_data = await run_chat_turn(conversation_id, user_input, assistant_id)
+    
+    if status != "completed":
+        logger.error(f"Run failed with status: {status}")
+        return {
+            "error": f"Assistant run failed with status: {status}",
+            "conversation_id": conversation_id
+        }, 500
+    
+    if not response_data:
+        response_data = [{
+            "type": "error",
+            "content": "Sorry, I couldn't retrieve the information you requested."
+        }]
+    
+    logger.info(f"Received response from Assistant: '{response_data[:50]}...'")
+    
+    if cache_key is not None and all(item["type"] != "error" for item in response_data):
+        response_cache.put(cache_key, {"response": response_data})
+    
+    # Return response with conversation ID
+    return {
+        "response": response_data,
+        "conversation_id": conversation_id
+    }, 200
+
+def overloaded_response(e):
+    """429 for a request shed by admission control, telling the client when to retry."""
+    logger.warning(f"Shed request: {str(e)}")
+    return jsonify({"error": str(e), "retry_after": e.retry_after}), 429, {'Retry-After': str(e.retry_after)}
+
+def job_status(job):
+    """Public view of a chat job; finished jobs include the /api/chat response body."""
+    body = {
+        "job_id": job['job_id'],
+        "status": job['status'],
+        "created_at": job['created_at'],
+        "finished_at": job['finished_at']
+    }
+    if job['result'] is not None:
+        body.update(job['result'])
+    return body
+
 @app.route('/api/chat', methods=['POST'])
+@tracer.route('chat')
 def chat():
     try:
         data = request.json
@@ -182,104 +812,211 @@ def chat():
         if custom_assistant_id:
             logger.info(f"Using custom assistant ID: {custom_assistant_id}")
         
-        # Create new thread if none exists
-        if not conversation_id or conversation_id not in threads:
-            # Create a new thread in the Assistants API
-            thread = client.beta.threads.create()
-            thread_id = thread.id
-            conversation_id = thread_id  # Use thread_id as conversation_id
-            threads[conversation_id] = thread_id
-            logger.info(f"Created new thread with ID: {thread_id}")
-        else:
-            thread_id = threads[conversation_id]
-        
-        # Add user message to thread
-        client.beta.threads.messages.create(
-            thread_id=thread_id,
-            role="user",
-            content=user_input
-        )
-        
         # Use custom assistant ID if provided, otherwise use default
         assistant_id = custom_assistant_id if custom_assistant_id else ASSISTANT_ID
         logger.info(f"Running assistant with ID: {assistant_id}")
         
-        # Create run with text response format
-        run = client.beta.threads.runs.create(
-            thread_id=thread_id,
-            assistant_id=assistant_id
-            # response_format={"type": "text"},
-            # instructions="Please provide responses in plain text only. Avoid using markdown formatting symbols like asterisks and hash symbols."
-        )
-
-        # Wait for completion
-        while run.status not in ["completed", "failed", "cancelled", "expired"]:
-            time.sleep(5)  # Poll every second
-            run = client.beta.threads.runs.retrieve(
-                thread_id=thread_id, 
-                run_id=run.id
-            )
-            logger.info(f"Run status: {run.status}")
-        
-        if run.status != "completed":
-            logger.error(f"Run failed with status: {run.status}")
-            return jsonify({
-                "error": f"Assistant run failed with status: {run.status}",
-                "conversation_id": conversation_id
-            }), 500
-        
-        # Get the assistant's response
-        messages = client.beta.threads.messages.list(thread_id=thread_id)
-        
-        # Get the most recent assistant message
-        response_data = []
-        for msg in messages.data:
-            if msg.role == "assistant":
-                for content_item in msg.content:
-                    if content_item.type == "text":
-                        # Capture text annotations
-                        text_content = content_item.text.value
-                        # Clean markdown symbols
-                        text_content = clean_markdown_simple(text_content)
-                        annotations = [
-                            {
-                                "type": "file",
-                                "text": annotation.text,
-                                "file_id": annotation.file_path.file_id
-                            } for annotation in content_item.text.annotations
-                        ]
-                        response_data.append({
-                            "type": "text",
-                            "content": text_content,
-                            "annotations": annotations
-                        })
-                    elif content_item.type == "image_file":
-                        # Retrieve and encode image
-                        image_file = content_item.image_file.file_id
-                        image_data = client.files.content(image_file)
-                        encoded_image = base64.b64encode(image_data.content).decode('utf-8')
-                        response_data.append({
-                            "type": "image",
-                            "format": "png",
-                            "content": f"data:image/png;base64,{encoded_image}"
-                        })
-                if response_data:
-                    break
-        
-        if not response_data:
-            response_data = [{
-                "type": "error",
-                "content": "Sorry, I couldn't retrieve the information you requested."
-            }]
+        snapshot = get_snapshot()
+        local = None
+        if not custom_assistant_id:
+            # Custom assistants answer everything themselves
+            with span('intent_routing'):
+                local = intent_router.answer(user_input, snapshot)
+        if local is not None:
+            # A pure stat lookup, answered from the datasets without a run
+            logger.info(f"Answered locally ({local[0]}): '{user_input}'")
+            annotate(source='local', intent=local[0])
+            turn = local_reply(conversation_id, user_input, text_items(local[1]), source="local")
+        else:
+            # First-turn prompts (e.g. the examples) can be answered from the cache for the current data version
+            cache_key = None
+            if not conversation_id:
+                cache_key = response_cache.key(user_input, assistant_id, snapshot.version)
+            turn = chat_reply(conversation_id, user_input, assistant_id, cache_key)
         
-        logger.info(f"Received response from Assistant: '{response_data[:50]}...'")
+        if data.get('async'):
+            # Return a job ID right away; the client polls /api/chat/jobs/<job_id> for the reply
+            job = chat_jobs.submit(tracer.traced('chat_job', turn))
+            logger.info(f"Queued chat job: {job['job_id']}")
+            return jsonify(job_status(job)), 202, {'Location': f"/api/chat/jobs/{job['job_id']}"}
         
-        # Return response with conversation ID
-        return jsonify({
-            "response": response_data,
-            "conversation_id": conversation_id
-        })
+        # The run executes on the shared event loop; this thread just waits for the result
+        if not blocking_chats.acquire(blocking=False):
+            turn.close()
+            raise Overloaded(admission.retry_after())
+        try:
+            body, status_code = runtime.run(turn)
+        finally:
+            blocking_chats.release()
+        if wants_inline_images(data.get('inline_images')) and 'response' in body:
+            with span('inline_images'):
+                body = {**body, "response": inline_images(body["response"])}
+        return jsonify(body), status_code
         
+    except Overloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        logger.error(f"Server error: {str(e)}")
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
+@app.route('/api/chat/jobs/<job_id>', methods=['GET'])
+def get_chat_job(job_id):
+    """Return a background chat job, long-polling up to ``wait`` seconds for it to finish."""
+    try:
+        wait = request.args.get('wait', default=0, type=float)
+        if wait and blocking_chats.acquire(blocking=False):
+            try:
+                job = chat_jobs.get(job_id, wait=wait)
+            finally:
+                blocking_chats.release()
+        else:
+            # No thread to spare for a long-poll: answer right away, the client polls again
+            job = chat_jobs.get(job_id)
+        if job is None:
+            return jsonify({"error": f"Unknown or expired job: {job_id}"}), 404
+        body = job_status(job)
+        if wants_inline_images(request.args.get('inline_images')) and 'response' in body:
+            body["response"] = inline_images(body["response"])
+        # 202 while the run is still queued or in progress
+        return jsonify(body), 200 if job['finished_at'] else 202
+    except Exception as e:
+        logger.error(f"Chat job error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+def sse_event(event, data):
+    """Encode one Server-Sent Event."""
+    return b'event: ' + event.encode('utf-8') + b'\ndata: ' + dumps(data) + b'\n\n'
+
+async def run_events(thread_id, assistant_id):
+    """Events of a streamed assistant run, continuing the stream after each round of function calls."""
+    stream = runtime.client.beta.threads.runs.stream(
+        thread_id=thread_id, assistant_id=assistant_id, **run_overrides(assistant_id))
+    while stream is not None:
+        async with stream as events:
+            stream = None
+            async for event in events:
+                yield event
+                if event.event == 'thread.run.requires_action':
+                    stream = runtime.client.beta.threads.runs.submit_tool_outputs_stream(
+                        thread_id=thread_id, run_id=event.data.id, tool_outputs=await answer_tool_calls(event.data))
+
+def stream_run(conversation_id, thread_id, assistant_id, inline=True):
+    """Relay a streamed assistant run as SSE: text deltas, tool progress, images, then the final response."""
+    yield sse_event('start', {"conversation_id": conversation_id})
+    response_data = []
+    cleaner = MarkdownStreamCleaner()
+    text = []
+    tools_started = set()
+    try:
+        for event in runtime.iterate(run_events(thread_id, assistant_id)):
+            if event.event == 'thread.message.delta':
+                for block in event.data.delta.content or []:
+                    if block.type == 'text' and block.text and block.text.value:
+                        delta = cleaner.feed(block.text.value)
+                        if delta:
+                            text.append(delta)
+                            yield sse_event('delta', {"text": delta})
+            elif event.event == 'thread.message.completed':
+                tail = cleaner.flush()
+                if tail:
+                    text.append(tail)
+                    yield sse_event('delta', {"text": tail})
+                items = runtime.run(format_assistant_content(event.data.content, text=''.join(text)))
+                if inline:
+                    items = inline_images(items)
+                cleaner, text = MarkdownStreamCleaner(), []
+                for item in items:
+                    if item["type"] == "image":
+                        yield sse_event('image', item)
+                response_data.extend(items)
+            elif event.event == 'thread.run.step.delta':
+                details = event.data.delta.step_details
+                if details and details.type == 'tool_calls':
+                    for call in details.tool_calls or []:
+                        if call.id and call.id not in tools_started:
+                            tools_started.add(call.id)
+                            yield sse_event('tool', {"id": call.id, "tool": call.type, "status": "started"})
+            elif event.event == 'thread.run.step.completed':
+                details = event.data.step_details
+                if details.type == 'tool_calls':
+                    for call in details.tool_calls:
+                        yield sse_event('tool', {"id": call.id, "tool": call.type, "status": "completed"})
+            elif event.event in ('thread.run.failed', 'thread.run.cancelled', 'thread.run.expired',
+                                 'thread.run.incomplete'):
+                logger.error(f"Run failed with status: {event.data.status}")
+                yield sse_event('error', {
+                    "error": f"Assistant run failed with status: {event.data.status}",
+                    "conversation_id": conversation_id
+                })
+                return
+            elif event.event == 'error':
+                raise RuntimeError(event.data.message)
+    except Exception as e:
+        logger.error(f"Streaming error: {str(e)}")
+        yield sse_event('error', {"error": f"Server error: {str(e)}", "conversation_id": conversation_id})
+        return
+
+    if not response_data:
+        response_data = [{
+            "type": "error",
+            "content": "Sorry, I couldn't retrieve the information you requested."
+        }]
+    # Same payload as /api/chat, so clients can swap the streamed text for the final response
+    thread_store.touch(conversation_id, messages=1)
+    yield sse_event('done', {"response": response_data, "conversation_id": conversation_id})
+
+def stream_local(body):
+    """A reply that is already complete, as the same SSE events a streamed run produces."""
+    yield sse_event('start', {"conversation_id": body["conversation_id"]})
+    yield sse_event('delta', {"text": body["response"][0]["content"]})
+    yield sse_event('done', body)
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """Chat like /api/chat, but stream the reply as Server-Sent Events while the run progresses."""
+    try:
+        data = request.json
+        user_input = data.get('message', '')
+        custom_assistant_id = data.get('assistant_id')
+        logger.info(f"Received streaming message: '{user_input}'")
+
+        assistant_id = custom_assistant_id if custom_assistant_id else ASSISTANT_ID
+        local = None if custom_assistant_id else intent_router.answer(user_input, get_snapshot())
+        lease = None
+        if local is None and not blocking_chats.acquire(blocking=False):
+            raise Overloaded(admission.retry_after())
+        if local is not None:
+            body, _ = runtime.run(local_reply(data.get('conversation_id'), user_input, text_items(local[1]),
+                                              source="local"))
+            events = stream_local(body)
+        else:
+            try:
+                lease = runtime.run(admission.acquire(FOLLOW_UP if data.get('conversation_id') else INTERACTIVE))
+                try:
+                    conversation_id, thread_id = runtime.run(start_turn(data.get('conversation_id'), user_input, assistant_id))
+                except BaseException:
+                    admission.release(lease)
+                    raise
+            except BaseException:
+                blocking_chats.release()
+                raise
+            events = stream_run(conversation_id, thread_id, assistant_id,
+                                inline=wants_inline_images(data.get('inline_images')))
+
+        response = Response(
+            stream_with_context(events),
+            mimetype='text/event-stream',
+            # Keep proxies (nginx) from buffering the stream
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+        if lease is not None:
+            # The slot and the thread are held until the response is closed: when the stream ends,
+            # or when the client leaves, even before the body has started
+            response.call_on_close(lambda: admission.release(lease))
+            response.call_on_close(blocking_chats.release)
+        return response
+    except Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         logger.error(f"Server error: {str(e)}")
         return jsonify({"error": f"Server error: {str(e)}"}), 500
@@ -297,109 +1034,116 @@ def get_examples():
     ]
     return jsonify({"examples": examples})
 
+def format_history_content(msg):
+    """History items for a thread message: text for user messages, text and images for replies."""
+    response_data = []
+    for content_item in msg.content:
+        if content_item.type == "text":
+            response_data.append({
+                "type": "text",
+                "content": content_item.text.value
+            })
+        elif content_item.type == "image_file" and msg.role == "assistant":
+            # Images are fetched once into the image cache and loaded by URL
+            response_data.append(format_image(content_item.image_file.file_id))
+    return response_data
+
+async def sync_history(conversation_id):
+    if conversation_id in pending_turns:
+        # A turn answered without a run is still being written to the thread
+        await pending_turns[conversation_id]
+    record = await thread_store.aget(conversation_id)
+    if record is None and not conversation_id.startswith('thread_'):
+        # Not a thread ID either (e.g. a conversation whose first turn was never recorded)
+        return None
+    thread_id = record['thread_id'] if record else conversation_id
+    async with admission.slot(INTERACTIVE):
+        with span('history_sync'):
+            return await history_store.sync(thread_id)
+
 @app.route('/api/chat/history', methods=['POST'])
+@tracer.route('chat_history')
 def get_chat_history():
     try:
         data = request.json
-        thread_id = data.get('conversation_id')
+        conversation_id = data.get('conversation_id')
         
-        if not thread_id:
+        if not conversation_id:
             return jsonify({"error": "No thread ID provided"}), 400
+        paging = {}
+        for name, minimum in (('before', 0), ('limit', 1)):
+            value = data.get(name)
+            if value is None:
+                continue
+            if isinstance(value, bool) or not isinstance(value, (int, str)) or not str(value).isdigit() \
+                    or int(value) < minimum:
+                return jsonify({"error": f"{name} must be an integer >= {minimum}"}), 400
+            paging[name] = int(value)
             
-        # Fetch messages from the thread
-        messages = client.beta.threads.messages.list(thread_id=thread_id)
+        # Bring the local copy of the thread up to date (only messages after the last one seen)
+        messages = runtime.run(sync_history(conversation_id))
+        if messages is None:
+            return jsonify({"error": f"Unknown conversation: {conversation_id}"}), 404
+        with span('conversation_turns'):
+            formatted_messages = conversation_turns(messages)
         
-        # Group and format messages for response
-        user_messages = []
-        assistant_messages = []
-        formatted_messages = []
+        # Optional paging, newest turns first: `limit` turns ending before index `before`
+        total = len(formatted_messages)
+        end = min(paging.get('before', total), total)
+        start = max(end - paging['limit'], 0) if 'limit' in paging else 0
+        formatted_messages = formatted_messages[start:end]
         
-        # First, separate user and assistant messages
-        for msg in messages.data:
-            if msg.role == "user":
-                response_data = []
-                for content_item in msg.content:
-                    if content_item.type == "text":
-                        response_data.append({
-                            "type": "text",
-                            "content": content_item.text.value
-                        })
-                if response_data:
-                    user_messages.append({
-                        "role": "user",
-                        "content": response_data,
-                        "created_at": msg.created_at  # We'll use this to match with assistant responses
-                    })
-            elif msg.role == "assistant":
-                response_data = []
-                for content_item in msg.content:
-                    if content_item.type == "text":
-                        response_data.append({
-                            "type": "text",
-                            "content": content_item.text.value
-                        })
-                    elif content_item.type == "image_file":
-                        image_file = content_item.image_file.file_id
-                        image_data = client.files.content(image_file)
-                        encoded_image = base64.b64encode(image_data.content).decode('utf-8')
-                        response_data.append({
-                            "type": "image",
-                            "content": f"data:image/png;base64,{encoded_image}"
-                        })
-                if response_data:
-                    assistant_messages.append({
-                        "role": "assistant",
-                        "content": response_data,
-                        "created_at": msg.created_at
-                    })
-        
-        # Sort messages by creation time (oldest first)
-        user_messages.sort(key=lambda x: x["created_at"])
-        assistant_messages.sort(key=lambda x: x["created_at"])
+        if wants_inline_images(data.get('inline_images')):
+            with span('inline_images'):
+                for message in formatted_messages:
+                    message["content"] = inline_images(message["content"])
         
-        # For each user message, find the most recent assistant message that follows it
-        for i, user_msg in enumerate(user_messages):
-            # Add user message
-            formatted_messages.append({
-                "role": user_msg["role"],
-                "content": user_msg["content"]
-            })
-            
-            # Find the most recent assistant message created after this user message
-            next_user_time = user_messages[i+1]["created_at"] if i+1 < len(user_messages) else float('inf')
-            relevant_assistant_msgs = [
-                a for a in assistant_messages 
-                if a["created_at"] > user_msg["created_at"] and a["created_at"] < next_user_time
-            ]
-            
-            # If there are assistant messages, add only the most recent one
-            if relevant_assistant_msgs:
-                # Sort by creation time (newest first) and take the first one
-                relevant_assistant_msgs.sort(key=lambda x: x["created_at"], reverse=True)
-                formatted_messages.append({
-                    "role": "assistant",
-                    "content": relevant_assistant_msgs[0]["content"]
-                })
-            
         return jsonify({
             "messages": formatted_messages,
-            "conversation_id": thread_id
+            "conversation_id": conversation_id,
+            "total": total,
+            "before": start,
+            "has_more": start > 0
         })
         
+    except Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         logger.error(f"Chat history error: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/chat/images/<file_id>', methods=['GET'])
+def get_chat_image(file_id):
+    """Serve an assistant-generated image from the on-disk cache, downloading it the first time."""
+    try:
+        if not image_cache.valid(file_id):
+            return jsonify({"error": "Invalid file ID"}), 400
+        path = image_cache.cached_path(file_id) or runtime.run(image_cache.fetch(file_id))
+        response = send_file(path, mimetype='image/png', etag=file_id, conditional=True)
+        # A file ID always refers to the same image
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        return response
+    except openai.NotFoundError:
+        return jsonify({"error": f"Image not found: {file_id}"}), 404
+    except Exception as e:
+        logger.error(f"Chat image error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+def csv_column_info(dataset):
+    """Column summary for a dataset, served from the profile computed when it was loaded."""
+    profile = get_snapshot().manifest()['datasets'][dataset]
+    columns = profile['columns']
+    return {
+        'columns': list(columns),
+        'dtypes': {col: info['dtype'] for col, info in columns.items()},
+        'null_counts': {col: info['null_count'] for col, info in columns.items()},
+        'profile': profile
+    }
+
 @app.route('/api/debug/fighter_csv_columns', methods=['GET'])
 def get_fighter_csv_columns():
     try:
-        fighters_df = pd.read_csv('data/fighter_info.csv')
-        column_info = {
-            'columns': list(fighters_df.columns),
-            'dtypes': {col: str(fighters_df[col].dtype) for col in fighters_df.columns},
-            'null_counts': {col: int(fighters_df[col].isnull().sum()) for col in fighters_df.columns}
-        }
-        return jsonify(column_info)
+        return json_response(csv_column_info('fighters'))
     except Exception as e:
         logger.error(f"Error reading fighter CSV columns: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -407,22 +1151,56 @@ def get_fighter_csv_columns():
 @app.route('/api/debug/event_csv_columns', methods=['GET'])
 def get_event_csv_columns():
     try:
-        events_df = pd.read_csv('data/event_data_sherdog.csv')
-        column_info = {
-            'columns': list(events_df.columns),
-            'dtypes': {col: str(events_df[col].dtype) for col in events_df.columns},
-            'null_counts': {col: int(events_df[col].isnull().sum()) for col in events_df.columns}
-        }
-        return jsonify(column_info)
+        return json_response(csv_column_info('events'))
     except Exception as e:
         logger.error(f"Error reading event CSV columns: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/debug/router', methods=['GET'])
+def get_router_stats():
+    """Return how many chat messages this worker answered locally instead of with an assistant run."""
+    return jsonify({'pid': os.getpid(), **intent_router.stats()})
+
+@app.route('/api/debug/coalescing', methods=['GET'])
+def get_coalescing_stats():
+    """Return how many assistant runs were saved by sharing identical in-flight prompts."""
+    return jsonify({'pid': os.getpid(), **run_coalescer.stats()})
+
+@app.route('/api/debug/thread_pool', methods=['GET'])
+def get_thread_pool_stats():
+    """Return how many new conversations got a pre-created thread instead of waiting for one."""
+    return jsonify({'pid': os.getpid(), **thread_pool.stats()})
+
+@app.route('/api/debug/admission', methods=['GET'])
+def get_admission_stats():
+    """Return OpenAI runs in flight on this machine, and what this worker admitted, queued and shed."""
+    return jsonify({'pid': os.getpid(), **admission.stats()})
+
+@app.route('/api/debug/traces', methods=['GET'])
+def get_traces():
+    """Return this worker's recent request traces and p50/p95/p99 milliseconds per phase."""
+    name = request.args.get('name')
+    limit = request.args.get('limit', default=50, type=int)
+    return json_response({
+        'pid': os.getpid(),
+        'percentiles': tracer.percentiles(name),
+        'traces': tracer.recent(name, limit)
+    })
+
+@app.route('/api/debug/manifest', methods=['GET'])
+def get_manifest():
+    """Return the dataset manifest: file hashes, load times, memory use and column profiles."""
+    try:
+        return json_response(get_snapshot().manifest())
+    except Exception as e:
+        logger.error(f"Error building dataset manifest: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/data/upcoming', methods=['GET'])
 def get_upcoming_events():
     try:
-        # Load the upcoming events CSV file
-        upcoming_df = pd.read_csv('data/upcoming_event_data_sherdog.csv')
+        # Use the upcoming events loaded in the current data snapshot
+        upcoming_df = get_snapshot().frame('upcoming')
         
         # Group by event name to organize fights under each event
         events = []
@@ -461,7 +1239,7 @@ def get_upcoming_events():
             
             events.append(event)
             
-        return jsonify(events)
+        return json_response(events)
     except Exception as e:
         logger.error(f"Error fetching upcoming event data: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -471,14 +1249,14 @@ def get_odds_chart():
     """Return betting odds movement data for the requested fighter as a list of chart points."""
     fighter_name = request.args.get('fighter', default='', type=str).strip().lower()
     csv_path = 'data/ufc_odds_movements_fightoddsio.csv'
+    snapshot = get_snapshot()
 
-    if not os.path.exists(csv_path):
+    if not snapshot.has('odds'):
         return jsonify({'error': f'CSV file not found at {csv_path}'}), 500
 
     try:
-        # Read only needed columns for efficiency
-        cols = ['file1', 'file2', 'fighter', 'sportsbook', 'odds_before', 'odds_after']
-        df = pd.read_csv(csv_path, usecols=cols)
+        # Odds are loaded once per data version with only the needed columns
+        df = snapshot.frame('odds')
 
         # Optionally filter by fighter (case-insensitive exact match)
         if fighter_name:
@@ -486,7 +1264,7 @@ def get_odds_chart():
 
         # If nothing to return, send empty list so client can show graceful message
         if df.empty:
-            return jsonify({'fighter': fighter_name, 'data': []})
+            return json_response({'fighter': fighter_name, 'data': []})
 
         chart_points = []
         for _, row in df.iterrows():
@@ -521,7 +1299,7 @@ def get_odds_chart():
         # Sort by timestamp for consistency
         chart_points.sort(key=lambda p: p['timestamp'])
 
-        return jsonify({'fighter': fighter_name, 'data': chart_points})
+        return json_response({'fighter': fighter_name, 'data': chart_points})
     except Exception as e:
         logger.error(f"Error processing odds data: {str(e)}")
         return jsonify({'error': str(e)}), 500
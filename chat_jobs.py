@@ -0,0 +1,155 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+
+from admission import Overloaded
+from runtime_state import STATE_DIR
+
+logger = logging.getLogger(__name__)
+
+JOBS_DIR = os.path.join(STATE_DIR, 'chat_jobs')
+# How long finished jobs stay retrievable
+JOB_TTL_SECONDS = 15 * 60
+# Runs executing at once per process; further jobs wait their turn in the queue
+MAX_CONCURRENT_RUNS = int(os.getenv('CHAT_MAX_CONCURRENT_RUNS', '16'))
+MAX_WAIT_SECONDS = 30
+# How often a long-poll for a job owned by another worker re-reads its record
+FOREIGN_POLL_SECONDS = 0.25
+
+FINISHED = ('completed', 'failed')
+
+
+class ChatJobs:
+    """Chat runs executed in the background, independent of the request that started them.
+
+    Jobs run as coroutines on the chat runtime's event loop, at most ``max_concurrent`` at a time.
+    Every state change is also written to ``directory`` so any gunicorn worker can answer a poll.
+    """
+
+    def __init__(self, runtime, directory=JOBS_DIR, max_concurrent=MAX_CONCURRENT_RUNS, ttl=JOB_TTL_SECONDS):
+        self.runtime = runtime
+        self.directory = directory
+        self.max_concurrent = max_concurrent
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._jobs = {}     # job id -> record, for jobs started by this process
+        self._events = {}   # job id -> threading.Event set when the job finishes
+        self._slots = None
+        self._slots_pid = None
+
+    def _path(self, job_id):
+        return os.path.join(self.directory, f'{job_id}.json')
+
+    def _save(self, job):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self._path(job['job_id']) + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(job, f)
+        os.replace(tmp_path, self._path(job['job_id']))
+
+    def _load(self, job_id):
+        try:
+            with open(self._path(job_id)) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    async def _update(self, job, **fields):
+        with self._lock:
+            job.update(fields)
+            record = dict(job)
+        # Written off the event loop; a job's updates are awaited in turn, so they land in order
+        await asyncio.to_thread(self._save, record)
+
+    def _expired(self, job):
+        return job['status'] in FINISHED and time.time() - job['finished_at'] > self.ttl
+
+    def purge(self):
+        """Forget finished jobs older than the TTL."""
+        with self._lock:
+            for job_id in [j for j, job in self._jobs.items() if self._expired(job)]:
+                del self._jobs[job_id]
+                self._events.pop(job_id, None)
+        if not os.path.isdir(self.directory):
+            return
+        cutoff = time.time() - self.ttl
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                # Records are rewritten when jobs finish, so an old file is an expired job
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def submit(self, coro):
+        """Queue ``coro`` (returning ``(body, status_code)``) as a job and return its record right away."""
+        self.purge()
+        job = {
+            'job_id': uuid.uuid4().hex,
+            'status': 'queued',
+            'created_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+            'http_status': None,
+            'result': None,
+        }
+        with self._lock:
+            self._jobs[job['job_id']] = job
+            self._events[job['job_id']] = threading.Event()
+            self._save(job)
+        self.runtime.submit(self._execute(job, coro))
+        return dict(job)
+
+    def _slot(self):
+        # The semaphore belongs to this process's event loop
+        if self._slots is None or self._slots_pid != os.getpid():
+            self._slots = asyncio.Semaphore(self.max_concurrent)
+            self._slots_pid = os.getpid()
+        return self._slots
+
+    async def _execute(self, job, coro):
+        try:
+            async with self._slot():
+                await self._update(job, status='running', started_at=time.time())
+                body, http_status = await coro
+            await self._update(job, status='completed' if http_status < 400 else 'failed',
+                         finished_at=time.time(), http_status=http_status, result=body)
+        except Overloaded as e:
+            await self._update(job, status='failed', finished_at=time.time(), http_status=429,
+                         result={'error': str(e), 'retry_after': e.retry_after})
+        except Exception as e:
+            logger.error(f"Chat job {job['job_id']} failed: {str(e)}")
+            await self._update(job, status='failed', finished_at=time.time(), http_status=500,
+                         result={'error': f"Server error: {str(e)}"})
+        finally:
+            self._events[job['job_id']].set()
+
+    def get(self, job_id, wait=0):
+        """A job's record, waiting up to ``wait`` seconds for it to finish; None if unknown or expired."""
+        if not re.fullmatch(r'[0-9a-f]{32}', job_id):
+            return None
+        wait = min(max(wait, 0), MAX_WAIT_SECONDS)
+        with self._lock:
+            job = self._jobs.get(job_id)
+            event = self._events.get(job_id)
+        if job is not None:
+            if wait and job['status'] not in FINISHED:
+                event.wait(wait)
+            with self._lock:
+                job = dict(job)
+        else:
+            # Started by another worker: follow its record on disk
+            deadline = time.monotonic() + wait
+            job = self._load(job_id)
+            while job is not None and job['status'] not in FINISHED and time.monotonic() < deadline:
+                time.sleep(FOREIGN_POLL_SECONDS)
+                job = self._load(job_id)
+        if job is None or self._expired(job):
+            return None
+        return job
@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+
+from openai import AsyncOpenAI
+
+from tracing import record, span
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_RUN_STATUSES = {"completed", "failed", "cancelled", "expired", "incomplete", "requires_action"}
+# Run status polling starts fast and backs off, instead of a fixed multi-second sleep
+POLL_INITIAL_SECONDS = 0.5
+POLL_MAX_SECONDS = 2.0
+POLL_BACKOFF = 1.5
+
+_DONE = object()
+
+
+class ChatRuntime:
+    """A per-process asyncio event loop, on a background thread, that runs all OpenAI calls.
+
+    Request threads hand coroutines to the loop and wait for the result; while a run is in
+    progress it costs the loop a sleeping task rather than a blocked worker, so one process can
+    hold many open chats and the data routes keep their threads.
+    """
+
+    def __init__(self, api_key=None):
+        self.api_key = api_key
+        self._lock = threading.Lock()
+        self._loop = None
+        self._pid = None
+        self._client = None
+
+    @property
+    def loop(self):
+        # Started lazily, and again after a fork, since a loop thread doesn't survive into gunicorn workers
+        if self._loop is None or self._pid != os.getpid():
+            with self._lock:
+                if self._loop is None or self._pid != os.getpid():
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name='chat-runtime', daemon=True).start()
+                    self._client = AsyncOpenAI(api_key=self.api_key)
+                    self._loop, self._pid = loop, os.getpid()
+        return self._loop
+
+    @property
+    def client(self):
+        self.loop
+        return self._client
+
+    def submit(self, coro):
+        """Schedule a coroutine on the runtime loop and return a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """Run a coroutine on the runtime loop and wait for its result."""
+        return self.submit(coro).result(timeout)
+
+    def iterate(self, agen):
+        """Consume an async iterator from a synchronous caller (e.g. a streaming response generator)."""
+        items = queue.Queue()
+
+        async def pump():
+            try:
+                async for item in agen:
+                    items.put((item, None))
+            except Exception as e:
+                items.put((_DONE, e))
+            else:
+                items.put((_DONE, None))
+
+        future = self.submit(pump())
+        try:
+            while True:
+                item, error = items.get()
+                if error is not None:
+                    raise error
+                if item is _DONE:
+                    return
+                yield item
+        finally:
+            # The client went away or the caller stopped early: stop the upstream stream as well
+            future.cancel()
+
+    async def wait_for_run(self, thread_id, run):
+        """Poll a run until it reaches a terminal status, sleeping cooperatively between polls."""
+        delay = POLL_INITIAL_SECONDS
+        start = time.perf_counter()
+        queued = run.status == 'queued'
+        with span('run_poll'):
+            while run.status not in TERMINAL_RUN_STATUSES:
+                await asyncio.sleep(delay)
+                delay = min(delay * POLL_BACKOFF, POLL_MAX_SECONDS)
+                run = await self.client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
+                logger.info(f"Run status: {run.status}")
+                if queued and run.status != 'queued':
+                    # Waiting for OpenAI to pick the run up, as seen by the polls
+                    record('run_queued', time.perf_counter() - start)
+                    queued = False
+        # How long after the run ended the poll noticed (run timestamps are whole seconds)
+        ended_at = next((t for t in (getattr(run, f'{status}_at', None) for status in
+                                     ('completed', 'failed', 'cancelled', 'expired', 'incomplete'))
+                         if isinstance(t, (int, float))), None)
+        if ended_at is not None:
+            record('poll_overshoot', max(time.time() - ended_at, 0))
+        return run
@@ -0,0 +1,266 @@
+import json
+import logging
+from datetime import datetime
+
+import pandas as pd
+
+from aggregates import career_stats, career_stats_record, fight_log, fighter_physicals
+from fight_graph import fight_graph
+from intents import fighter_name_index
+from previews import consensus_odds, event_slug
+from ratings import ratings
+from serialization import dumps
+from simulation import simulate_fight
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HISTORY_FIGHTS = 10
+MAX_HISTORY_FIGHTS = 25
+MAX_SPORTSBOOKS = 12
+SIMULATION_ITERATIONS = 5000
+
+
+def _function(name, description, properties, required):
+    return {
+        "type": "function",
+        "function": {
+            "name": name,
+            "description": description,
+            "parameters": {"type": "object", "properties": properties, "required": required},
+        },
+    }
+
+
+_FIGHTER = {"type": "string", "description": "The fighter's full name, e.g. \"Max Holloway\""}
+
+FUNCTION_TOOLS = [
+    _function("get_fighter",
+              "Profile of a fighter: pro and UFC record, win/loss methods, streak, physicals, Elo rating "
+              "and current betting line.",
+              {"name": _FIGHTER}, ["name"]),
+    _function("get_fight_history",
+              "A fighter's UFC fights, newest first: date, opponent, result, method, round, time and event.",
+              {"name": _FIGHTER,
+               "limit": {"type": "integer", "description": f"Number of fights (default {DEFAULT_HISTORY_FIGHTS}, "
+                                                          f"at most {MAX_HISTORY_FIGHTS})"}},
+              ["name"]),
+    _function("get_upcoming_card",
+              "Bouts on an upcoming UFC card with weight classes and consensus betting lines. "
+              "Without an event name, returns the next card.",
+              {"event": {"type": "string", "description": "Event name, e.g. \"UFC 310\" (optional)"}}, []),
+    _function("get_odds",
+              "Current betting odds for a fighter: the consensus line and each sportsbook's opening and latest line.",
+              {"name": _FIGHTER}, ["name"]),
+    _function("simulate_fight",
+              "Monte Carlo simulation of a fight from both fighters' historical finishing rates and Elo ratings: "
+              "win probabilities, methods, rounds and most likely outcomes.",
+              {"fighter1": _FIGHTER, "fighter2": _FIGHTER,
+               "rounds": {"type": "integer", "enum": [3, 5], "description": "Scheduled rounds (default 3)"}},
+              ["fighter1", "fighter2"]),
+]
+
+# Tools for every chat run: the functions above read the server's datasets directly, in place of
+# file_search over uploaded CSVs; the code interpreter stays for charts.
+RUN_TOOLS = [{"type": "code_interpreter"}] + FUNCTION_TOOLS
+RUN_INSTRUCTIONS = ("For fighter profiles, fight histories, upcoming cards, betting odds and fight simulations, "
+                    "call the provided functions; they read the latest scraped data.")
+
+
+class ToolError(Exception):
+    pass
+
+
+def resolve_fighter(snapshot, name):
+    """Fighter ID for a name passed by the model: an exact full name, else the one fighter named in it."""
+    fighter_id = fight_graph(snapshot).resolve(name)
+    if fighter_id is None:
+        found = fighter_name_index(snapshot).find(name or '')
+        fighter_id = found[0] if len(found) == 1 else None
+    if fighter_id is None:
+        raise ToolError(f"Unknown fighter: '{name}'")
+    return fighter_id
+
+
+def _date(value):
+    return value.date().isoformat() if not pd.isna(value) else None
+
+
+def _fighter_name(snapshot, fighter_id):
+    return fighter_name_index(snapshot).names.get(fighter_id)
+
+
+def _odds_line(snapshot, name):
+    odds = consensus_odds(snapshot)
+    if name is None or name.lower() not in odds.index:
+        return None
+    line = odds.loc[name.lower()]
+    return {
+        'consensus': int(line['consensus_odds']),
+        'implied_probability': float(line['implied_probability']),
+        'sportsbooks': int(line['sportsbooks']),
+        'updated': line['updated'],
+    }
+
+
+def get_fighter(snapshot, name):
+    fighter_id = resolve_fighter(snapshot, name)
+    fighters = snapshot.frame('fighters')
+    rows = fighters[fighters['Fighter_ID'] == fighter_id]
+    profile = rows.iloc[0] if len(rows) else None
+    physicals = fighter_physicals(snapshot)
+    phys = physicals.loc[fighter_id] if fighter_id in physicals.index else None
+    stats = career_stats_record(career_stats(snapshot), fighter_id)
+    state = ratings(snapshot)
+    name = _fighter_name(snapshot, fighter_id)
+
+    result = {'id': fighter_id, 'name': name}
+    if profile is not None:
+        result.update({
+            'nickname': None if profile['Nickname'] in ('-', '') else profile['Nickname'],
+            'nationality': profile['Nationality'],
+            'association': profile['Association'],
+            'weight_class': profile['Weight Class'],
+            'birth_date': profile['Birth Date'],
+            'pro_record': {
+                'wins': int(profile['Wins']), 'losses': int(profile['Losses']),
+                'wins_ko': int(profile['Win_KO']), 'wins_sub': int(profile['Win_Sub']),
+                'wins_dec': int(profile['Win_Decision']),
+                'losses_ko': int(profile['Loss_KO']), 'losses_sub': int(profile['Loss_Sub']),
+                'losses_dec': int(profile['Loss_Decision']),
+            },
+        })
+    if phys is not None:
+        result.update({
+            'height_in': None if pd.isna(phys['height_in']) else float(phys['height_in']),
+            'reach_in': None if pd.isna(phys['reach_in']) else float(phys['reach_in']),
+            'stance': phys['stance'],
+        })
+    if stats:
+        # The last-5 list is already covered by get_fight_history
+        result['ufc'] = {key: value for key, value in stats.items() if key not in ('fighter', 'last_5')}
+    if fighter_id in state.ratings:
+        result['elo_rating'] = round(state.ratings[fighter_id], 1)
+    result['odds'] = _odds_line(snapshot, name)
+    return result
+
+
+def get_fight_history(snapshot, name, limit=DEFAULT_HISTORY_FIGHTS):
+    fighter_id = resolve_fighter(snapshot, name)
+    limit = min(max(int(limit or DEFAULT_HISTORY_FIGHTS), 1), MAX_HISTORY_FIGHTS)
+    log = fight_log(snapshot)
+    fights = log[log['fighter_id'] == fighter_id]
+    return {
+        'name': _fighter_name(snapshot, fighter_id),
+        'total_ufc_fights': len(fights),
+        'fights': [
+            {
+                'date': _date(row.date),
+                'opponent': row.opponent,
+                'result': row.result,
+                'method': row.method,
+                'round': int(row.round),
+                'time': row.time,
+                'weight_class': row.weight_class,
+                'event': row.event,
+            }
+            for row in fights.head(limit).itertuples(index=False)
+        ],
+    }
+
+
+def get_upcoming_card(snapshot, event=None):
+    if not snapshot.has('upcoming'):
+        raise ToolError("No upcoming events are loaded")
+    upcoming = snapshot.frame('upcoming')
+    dates = pd.to_datetime(upcoming['Event Date'], utc=True, errors='coerce').dt.tz_localize(None)
+    if event:
+        slug = event_slug(event)
+        matches = upcoming[upcoming['Event Name'].map(event_slug).str.contains(slug, regex=False)]
+        if matches.empty:
+            raise ToolError(f"No upcoming event matches '{event}'")
+        event_name = matches['Event Name'].iloc[0]
+    else:
+        future = upcoming[dates >= pd.Timestamp(datetime.now().date())]
+        if future.empty:
+            raise ToolError("No upcoming events are scheduled")
+        event_name = future.loc[dates[future.index].idxmin(), 'Event Name']
+    card = upcoming[upcoming['Event Name'] == event_name]
+    return {
+        'event': event_name,
+        'date': card['Event Date'].iloc[0],
+        'location': card['Event Location'].iloc[0],
+        'bouts': [
+            {
+                'fighter1': row['Fighter 1'],
+                'fighter2': row['Fighter 2'],
+                'weight_class': row['Weight Class'],
+                'fight_type': row['Fight Type'],
+                'fighter1_odds': _odds_line(snapshot, row['Fighter 1']),
+                'fighter2_odds': _odds_line(snapshot, row['Fighter 2']),
+            }
+            for _, row in card.iterrows()
+        ],
+        'other_upcoming_events': [name for name in upcoming['Event Name'].unique() if name != event_name],
+    }
+
+
+def get_odds(snapshot, name):
+    fighter_id = resolve_fighter(snapshot, name)
+    name = _fighter_name(snapshot, fighter_id)
+    result = {'name': name, 'consensus': _odds_line(snapshot, name), 'sportsbooks': []}
+    if not snapshot.has('odds'):
+        return result
+    odds = snapshot.frame('odds')
+    lines = odds[odds['fighter'].str.lower() == name.lower()].sort_values('file2', kind='stable')
+    for sportsbook, group in lines.groupby('sportsbook', sort=False):
+        result['sportsbooks'].append({
+            'sportsbook': sportsbook,
+            'opening': str(group['odds_before'].iloc[0]),
+            'latest': str(group['odds_after'].iloc[-1]),
+            'moves': len(group),
+        })
+    result['sportsbooks'] = result['sportsbooks'][:MAX_SPORTSBOOKS]
+    return result
+
+
+def run_simulation(snapshot, fighter1, fighter2, rounds=3):
+    if rounds not in (3, 5):
+        rounds = 3
+    fighter1_id, fighter2_id = resolve_fighter(snapshot, fighter1), resolve_fighter(snapshot, fighter2)
+    if fighter1_id == fighter2_id:
+        raise ToolError("Can't simulate a fighter against themself")
+    result = simulate_fight(snapshot, fighter1_id, fighter2_id,
+                            iterations=SIMULATION_ITERATIONS, rounds=rounds)
+    for key in ('seed', 'elapsed_ms'):
+        result.pop(key, None)
+    return result
+
+
+FUNCTIONS = {
+    'get_fighter': get_fighter,
+    'get_fight_history': get_fight_history,
+    'get_upcoming_card': get_upcoming_card,
+    'get_odds': get_odds,
+    'simulate_fight': run_simulation,
+}
+
+
+def call_function(snapshot, name, arguments):
+    """Run one function call from the assistant and return its output as a compact JSON string."""
+    try:
+        function = FUNCTIONS.get(name)
+        if function is None:
+            raise ToolError(f"Unknown function: {name}")
+        output = function(snapshot, **json.loads(arguments or '{}'))
+    except ToolError as e:
+        output = {'error': str(e)}
+    except Exception as e:
+        logger.error(f"Function {name}({arguments}) failed: {str(e)}")
+        output = {'error': f"{name} failed: {str(e)}"}
+    return dumps(output).decode('utf-8')
+
+
+def tool_outputs(snapshot, tool_calls):
+    """Outputs for a run's required function calls, in the shape submit_tool_outputs expects."""
+    return [{'tool_call_id': call.id, 'output': call_function(snapshot, call.function.name, call.function.arguments)}
+            for call in tool_calls]
@@ -0,0 +1,265 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from runtime_state import STATE_DIR
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = 'data'
+MANIFEST_PATH = os.path.join(STATE_DIR, 'manifest.json')
+# One line per published data version, used to watch dataset size/memory over time
+MANIFEST_HISTORY_PATH = os.path.join(STATE_DIR, 'manifest_history.jsonl')
+
+
+def clean_fighters(fighters_df):
+    """Normalize the raw fighter_info.csv frame into the shape the app expects."""
+    # Replace string "None" or "NULL" values with proper None/null
+    fighters_df = fighters_df.replace(["None", "NULL", "NaN"], None)
+
+    # Fill nullable columns that should never be null with appropriate values
+    int_columns = ["Wins", "Losses", "Win_Decision", "Win_KO", "Win_Sub",
+                   "Loss_Decision", "Loss_KO", "Loss_Sub", "Fighter_ID"]
+    for col in int_columns:
+        fighters_df[col] = fighters_df[col].fillna(0).astype(int)
+
+    # For Reach and Stance, replace '-' and nulls with empty strings to keep them as strings
+    for col in ["Reach", "Stance"]:
+        fighters_df[col] = fighters_df[col].replace('-', '').fillna('')
+
+    # Make sure Reach is treated as a string to match Swift's expectation
+    # Convert any numeric values to strings with one decimal place if needed
+    fighters_df["Reach"] = fighters_df["Reach"].apply(
+        lambda x: f"{float(x):.1f}" if isinstance(x, (int, float)) and x != '' else str(x)
+    )
+    return fighters_df
+
+
+def clean_events(events_df):
+    """Normalize the raw event_data_sherdog.csv frame into the shape the app expects."""
+    # Replace string "None" or "NULL" values with proper None/null
+    events_df = events_df.replace(["None", "NULL", "NaN"], None)
+
+    # Fill nullable columns that should never be null and keep them as integers
+    for col in ["Fighter 1 ID", "Fighter 2 ID", "Winning Round"]:
+        events_df[col] = events_df[col].fillna(0).astype(int)
+    return events_df
+
+
+# name -> (file name, read_csv kwargs, cleaning function)
+DATASETS = {
+    'fighters': ('fighter_info.csv', {}, clean_fighters),
+    'events': ('event_data_sherdog.csv', {}, clean_events),
+    'upcoming': ('upcoming_event_data_sherdog.csv', {}, None),
+    'odds': ('ufc_odds_movements_fightoddsio.csv',
+             {'usecols': ['file1', 'file2', 'fighter', 'sportsbook', 'odds_before', 'odds_after']}, None),
+}
+
+
+def _scalar(value):
+    """Turn a numpy/pandas scalar into something JSON can hold."""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
+
+
+def profile_frame(df):
+    """Compute per-column profiles (dtype, nulls, distinct values, min/max, memory)."""
+    memory = df.memory_usage(index=False, deep=True)
+    null_counts = df.isnull().sum()
+    distinct_counts = df.nunique(dropna=True)
+    columns = {}
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_datetime64_any_dtype(series):
+            values = series
+        else:
+            values = series.dropna().astype(str)
+        columns[col] = {
+            'dtype': str(series.dtype),
+            'null_count': int(null_counts[col]),
+            'distinct_count': int(distinct_counts[col]),
+            'min': _scalar(values.min()) if len(values) else None,
+            'max': _scalar(values.max()) if len(values) else None,
+            'memory_bytes': int(memory[col]),
+        }
+    return columns
+
+
+class Dataset:
+    """One loaded CSV with the file metadata and profile it was loaded from."""
+
+    def __init__(self, name, path, read_kwargs, clean):
+        stat = os.stat(path)
+        self.name = name
+        self.path = path
+        self.mtime = stat.st_mtime
+        self.size = stat.st_size
+
+        with open(path, 'rb') as f:
+            self.sha256 = hashlib.sha256(f.read()).hexdigest()
+
+        start = time.perf_counter()
+        raw_df = pd.read_csv(path, **read_kwargs)
+        parse_seconds = time.perf_counter() - start
+        self.frame = clean(raw_df) if clean else raw_df
+        load_seconds = time.perf_counter() - start
+
+        # Profile the CSV as parsed, so the debug endpoints keep describing the file itself
+        self.profile = {
+            'path': path,
+            'mtime': self.mtime,
+            'size_bytes': self.size,
+            'sha256': self.sha256,
+            'rows': len(raw_df),
+            'parse_seconds': round(parse_seconds, 4),
+            'load_seconds': round(load_seconds, 4),
+            'memory_bytes': int(self.frame.memory_usage(index=True, deep=True).sum()),
+            'columns': profile_frame(raw_df),
+        }
+
+
+class Snapshot:
+    """An immutable set of loaded datasets plus anything derived from them."""
+
+    def __init__(self, datasets, previous=None):
+        self.datasets = datasets
+        # Derived builders can reuse the previous snapshot's results to update incrementally
+        self.previous = previous
+        digest = hashlib.sha256()
+        for name in sorted(datasets):
+            digest.update(f"{name}:{datasets[name].sha256}".encode())
+        self.version = digest.hexdigest()[:16]
+        self.loaded_at = datetime.now().isoformat()
+        self._derived = {}
+        self._build_locks = {}
+        self._lock = threading.Lock()
+
+    def has(self, name):
+        return name in self.datasets
+
+    def frame(self, name):
+        return self.datasets[name].frame
+
+    def derived(self, name, build):
+        """Return ``build(self)``, computed at most once per snapshot."""
+        if name in self._derived:
+            return self._derived[name]
+        # One lock per derived value, so a slow build doesn't hold up unrelated lookups
+        with self._lock:
+            build_lock = self._build_locks.setdefault(name, threading.RLock())
+        with build_lock:
+            if name not in self._derived:
+                self._derived[name] = build(self)
+        return self._derived[name]
+
+    def cached(self, name):
+        """Return a derived value if it has already been built, without building it."""
+        return self._derived.get(name)
+
+    def manifest(self):
+        return {
+            'version': self.version,
+            'generated_at': self.loaded_at,
+            'datasets': {name: ds.profile for name, ds in self.datasets.items()},
+        }
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+# Derived values built in the background as soon as a new snapshot is loaded
+_derived_builders = {}
+
+
+def register_derived(name, build):
+    """Build ``name`` eagerly for every new snapshot instead of on first request."""
+    _derived_builders[name] = build
+
+
+def _build_derived(snapshot):
+    for name, build in list(_derived_builders.items()):
+        try:
+            start = time.perf_counter()
+            snapshot.derived(name, build)
+            logger.info(f"Built {name} for snapshot {snapshot.version} in {time.perf_counter() - start:.2f}s")
+        except Exception as e:
+            logger.error(f"Error building {name}: {str(e)}")
+
+
+def _write_manifest(manifest):
+    """Persist the manifest and append a history line when the data version changed."""
+    try:
+        os.makedirs(STATE_DIR, exist_ok=True)
+        if os.path.exists(MANIFEST_PATH):
+            with open(MANIFEST_PATH) as f:
+                if json.load(f).get('version') == manifest['version']:
+                    return
+        tmp_path = f"{MANIFEST_PATH}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, MANIFEST_PATH)
+
+        history = {
+            'version': manifest['version'],
+            'generated_at': manifest['generated_at'],
+            'datasets': {
+                name: {key: profile[key] for key in ('rows', 'memory_bytes', 'load_seconds')}
+                for name, profile in manifest['datasets'].items()
+            },
+        }
+        with open(MANIFEST_HISTORY_PATH, 'a') as f:
+            f.write(json.dumps(history) + '\n')
+    except (OSError, ValueError) as e:
+        logger.error(f"Could not write dataset manifest: {str(e)}")
+
+
+def get_snapshot():
+    """Return the current snapshot, reloading only the datasets whose files changed."""
+    global _snapshot
+    with _snapshot_lock:
+        current = _snapshot.datasets if _snapshot else {}
+        datasets = {}
+        changed = False
+        for name, (file_name, read_kwargs, clean) in DATASETS.items():
+            path = os.path.join(DATA_DIR, file_name)
+            if not os.path.exists(path):
+                changed = changed or name in current
+                continue
+            stat = os.stat(path)
+            old = current.get(name)
+            if old and old.mtime == stat.st_mtime and old.size == stat.st_size:
+                datasets[name] = old
+                continue
+            logger.info(f"Loading dataset {name} from {path}")
+            datasets[name] = Dataset(name, path, read_kwargs, clean)
+            changed = True
+
+        if _snapshot is None or changed:
+            if _snapshot is not None:
+                # Keep only one generation of history for incremental rebuilds
+                _snapshot.previous = None
+            _snapshot = Snapshot(datasets, previous=_snapshot)
+            logger.info(f"Dataset snapshot {_snapshot.version} ready")
+            _write_manifest(_snapshot.manifest())
+            threading.Thread(target=_build_derived, args=(_snapshot,), daemon=True).start()
+        return _snapshot
+
+
+if __name__ == '__main__':
+    # Load every dataset once and publish the manifest, e.g. after copying new CSVs in
+    snapshot = get_snapshot()
+    for name, profile in snapshot.manifest()['datasets'].items():
+        print(f"{name:<10} rows={profile['rows']:<6} memory={profile['memory_bytes'] / 1e6:6.1f} MB "
+              f"load={profile['load_seconds']:.3f}s")
+    print(f"Manifest version {snapshot.version} written to {MANIFEST_PATH}")
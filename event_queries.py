@@ -0,0 +1,173 @@
+import numpy as np
+import pandas as pd
+
+from datasets import register_derived
+
+# Query parameter -> events column, matched as case-insensitive substrings
+TEXT_FILTERS = {
+    'event': 'Event Name',
+    'location': 'Event Location',
+    'referee': 'Referee',
+    'method': 'Winning Method',
+}
+# Query parameter -> events column, matched case-insensitively in full
+EXACT_FILTERS = {
+    'weight_class': 'Weight Class',
+    'fight_type': 'Fight Type',
+}
+FILTER_PARAMS = (['fighter', 'winner', 'round', 'date_from', 'date_to', 'last']
+                 + list(TEXT_FILTERS) + list(EXACT_FILTERS))
+
+
+class InvalidQuery(ValueError):
+    """A query parameter that can't be used; the message is meant for the client."""
+
+
+def parse_date_bound(value, end=False, name='date'):
+    """Parse an ISO date/datetime query value to a naive UTC datetime64.
+
+    Upper bounds are returned exclusive; a bare date used as an upper bound covers that whole day.
+    Raises InvalidQuery, naming the parameter as ``name``, if the value isn't a date.
+    """
+    try:
+        stamp = pd.Timestamp(value)
+    except (TypeError, ValueError):
+        stamp = pd.NaT
+    if pd.isna(stamp):
+        raise InvalidQuery(f"{name} must be an ISO date or datetime, e.g. 2025-06-07")
+    stamp = stamp.tz_localize('UTC') if stamp.tzinfo is None else stamp.tz_convert('UTC')
+    if end:
+        # Upper bounds are exclusive in the index, so step just past the requested time
+        stamp += pd.Timedelta(days=1) if len(value.strip()) <= 10 else pd.Timedelta(nanoseconds=1)
+    return stamp.tz_localize(None).to_datetime64()
+
+
+class EventDateIndex:
+    """Event dates parsed once, with fights and cards kept sorted by date for binary search."""
+
+    def __init__(self, events, upcoming=None):
+        dates = pd.to_datetime(events['Event Date'], utc=True, errors='coerce').dt.tz_localize(None)
+        self.dates = dates
+        valid = dates.notna().to_numpy()
+        rows = events.index.to_numpy()[valid]
+        values = dates.to_numpy()[valid]
+
+        # Chronological: by date, then latest-first CSV order reversed within a date
+        order = np.lexsort((-rows, values))
+        self.rows = rows[order]
+        self.sorted_dates = values[order]
+
+        self.cards = self._cards(events[valid], dates[valid])
+        self.upcoming = self._cards(upcoming, pd.to_datetime(
+            upcoming['Event Date'], utc=True, errors='coerce').dt.tz_localize(None)) if upcoming is not None else None
+
+    @staticmethod
+    def _cards(fights, dates):
+        """One row per event (card), sorted by date."""
+        cards = fights.assign(_date=dates).groupby('Event Name', sort=False).agg(
+            date=('_date', 'first'),
+            location=('Event Location', 'first'),
+            main_event=('Fighter 1', 'first'),
+            main_event_opponent=('Fighter 2', 'first'),
+            fights=('Event Name', 'size'),
+        ).reset_index().rename(columns={'Event Name': 'event'})
+        cards = cards[cards['date'].notna()]
+        return cards.sort_values('date', kind='stable').reset_index(drop=True)
+
+    def rows_between(self, start=None, end=None):
+        """Events rows with start <= date < end, in the CSV's own order."""
+        lo = 0 if start is None else np.searchsorted(self.sorted_dates, start, side='left')
+        hi = len(self.sorted_dates) if end is None else np.searchsorted(self.sorted_dates, end, side='left')
+        # The CSV isn't strictly sorted by date, so put the slice back in file order
+        return np.sort(self.rows[lo:hi])
+
+    def recent_cards(self, n, before=None):
+        """The ``n`` most recent cards that took place before ``before`` (default: all of them)."""
+        dates = self.cards['date'].to_numpy()
+        hi = len(dates) if before is None else np.searchsorted(dates, before, side='left')
+        return self.cards.iloc[max(hi - n, 0):hi].iloc[::-1]
+
+    def next_card(self, after):
+        """The first upcoming card on or after ``after``."""
+        if self.upcoming is None or self.upcoming.empty:
+            return None
+        dates = self.upcoming['date'].to_numpy()
+        position = np.searchsorted(dates, after, side='left')
+        if position >= len(dates):
+            return None
+        return self.upcoming.iloc[position]
+
+
+def build_event_date_index(snapshot):
+    upcoming = snapshot.frame('upcoming') if snapshot.has('upcoming') else None
+    return EventDateIndex(snapshot.frame('events'), upcoming)
+
+
+def event_date_index(snapshot):
+    return snapshot.derived('event_date_index', build_event_date_index)
+
+
+register_derived('event_date_index', build_event_date_index)
+
+
+def parse_int_param(args, name, minimum):
+    """An integer query parameter that must be at least ``minimum``; raises InvalidQuery otherwise."""
+    value = args[name].strip()
+    if not value.isdigit() or int(value) < minimum:
+        raise InvalidQuery(f"{name} must be an integer >= {minimum}")
+    return int(value)
+
+
+def has_filters(args):
+    return any(args.get(param) for param in FILTER_PARAMS)
+
+
+def _contains(column, value):
+    return column.fillna('').str.contains(value, case=False, regex=False)
+
+
+def _date_range_rows(args, date_index):
+    """Rows selected by date_from/date_to/last via binary search, or None if unrestricted."""
+    start = parse_date_bound(args['date_from'], name='date_from') if args.get('date_from') else None
+    end = parse_date_bound(args['date_to'], end=True, name='date_to') if args.get('date_to') else None
+    if args.get('last'):
+        # Fights from the N most recent cards within the range
+        cards = date_index.recent_cards(parse_int_param(args, 'last', 1), before=end)
+        if cards.empty:
+            return date_index.rows[:0]
+        oldest = cards['date'].iloc[-1].to_datetime64()
+        start = oldest if start is None else max(start, oldest)
+    if start is None and end is None:
+        return None
+    return date_index.rows_between(start, end)
+
+
+def event_filter_mask(events, args):
+    """Boolean mask over ``events`` for the non-date filter query parameters in ``args``."""
+    mask = pd.Series(True, index=events.index)
+
+    fighter = args.get('fighter')
+    if fighter:
+        mask &= _contains(events['Fighter 1'], fighter) | _contains(events['Fighter 2'], fighter)
+    winner = args.get('winner')
+    if winner:
+        mask &= _contains(events['Winning Fighter'], winner)
+
+    for param, column in TEXT_FILTERS.items():
+        if args.get(param):
+            mask &= _contains(events[column], args[param])
+    for param, column in EXACT_FILTERS.items():
+        if args.get(param):
+            mask &= events[column].fillna('').str.lower() == args[param].lower()
+
+    if args.get('round'):
+        mask &= events['Winning Round'] == parse_int_param(args, 'round', 1)
+    return mask
+
+
+def filter_events(events, args, date_index):
+    """Apply the events API filters, narrowing by date through the sorted index first."""
+    rows = _date_range_rows(args, date_index)
+    if rows is not None:
+        events = events.loc[rows]
+    return events[event_filter_mask(events, args)]
@@ -0,0 +1,174 @@
+import logging
+from collections import deque
+
+from aggregates import fight_table
+from datasets import register_derived
+
+logger = logging.getLogger(__name__)
+
+MAX_CHAIN_DEPTH = 6
+# Upper bound on fighters visited by a single win-chain search
+MAX_VISITED = 20000
+
+
+def _fight_record(fight):
+    if fight.score == 1.0:
+        winner_id = int(fight.fighter1_id)
+    elif fight.score == 0.0:
+        winner_id = int(fight.fighter2_id)
+    else:
+        winner_id = None
+    return {
+        'date': fight.date,
+        'event': fight.event,
+        'fighter1_id': int(fight.fighter1_id),
+        'fighter1': fight.fighter1,
+        'fighter2_id': int(fight.fighter2_id),
+        'fighter2': fight.fighter2,
+        'winner_id': winner_id,
+        'method': fight.method,
+        'method_category': fight.method_category,
+        'round': int(fight.round),
+        'time': fight.time,
+        'weight_class': fight.weight_class if isinstance(fight.weight_class, str) else None,
+    }
+
+
+def result_for(fight, fighter_id):
+    """W/L/D/NC for ``fighter_id`` in a fight record."""
+    if fight['winner_id'] is None:
+        return 'NC' if fight['method_category'] == 'No Contest' else 'D'
+    return 'W' if fight['winner_id'] == fighter_id else 'L'
+
+
+class FightGraph:
+    """Adjacency index of who fought (and who beat) whom.
+
+    Inner adjacency dicts are copied on write, so a new graph can share most of its
+    structure with the one built for the previous snapshot.
+    """
+
+    def __init__(self):
+        self.fights = {}      # fight key -> fight record
+        self.signatures = set()
+        self.opponents = {}   # fighter_id -> {opponent_id: (fight key, ...)}
+        self.beat = {}        # winner_id -> {loser_id: most recent fight key}
+        self.names = {}
+        self.name_index = {}  # lower-case name -> fighter_id
+
+    def copy(self):
+        graph = FightGraph()
+        graph.fights = dict(self.fights)
+        graph.signatures = set(self.signatures)
+        graph.opponents = dict(self.opponents)
+        graph.beat = dict(self.beat)
+        graph.names = dict(self.names)
+        graph.name_index = dict(self.name_index)
+        return graph
+
+    def add(self, fights):
+        """Add fights (in date order) from an aggregates.fight_table frame."""
+        for fight in fights.itertuples(index=False):
+            record = _fight_record(fight)
+            id1, id2 = record['fighter1_id'], record['fighter2_id']
+            self.fights[fight.key] = record
+            self.signatures.add(fight.signature)
+            for me, them, name in ((id1, id2, record['fighter1']), (id2, id1, record['fighter2'])):
+                links = dict(self.opponents.get(me, {}))
+                links[them] = links.get(them, ()) + (fight.key,)
+                self.opponents[me] = links
+                self.names[me] = name
+                self.name_index[name.lower()] = me
+            if record['winner_id'] is not None:
+                loser_id = id2 if record['winner_id'] == id1 else id1
+                wins = dict(self.beat.get(record['winner_id'], {}))
+                wins[loser_id] = fight.key
+                self.beat[record['winner_id']] = wins
+
+    def resolve(self, value):
+        """Find a fighter by Sherdog ID or (case-insensitive) full name."""
+        value = (value or '').strip()
+        if value.isdigit():
+            return int(value) if int(value) in self.opponents else None
+        return self.name_index.get(value.lower())
+
+    def head_to_head(self, fighter1_id, fighter2_id):
+        keys = self.opponents.get(fighter1_id, {}).get(fighter2_id, ())
+        fights = [self.fights[key] for key in keys]
+        return sorted(fights, key=lambda f: f['date'], reverse=True)
+
+    def common_opponents(self, fighter1_id, fighter2_id):
+        """Opponents both fighters have faced, with each fighter's results against them."""
+        opponents1 = self.opponents.get(fighter1_id, {})
+        opponents2 = self.opponents.get(fighter2_id, {})
+        common = (opponents1.keys() & opponents2.keys()) - {fighter1_id, fighter2_id}
+
+        results = []
+        for opponent_id in common:
+            entry = {'opponent_id': opponent_id, 'opponent': self.names.get(opponent_id)}
+            for label, fighter_id, links in (('fighter1', fighter1_id, opponents1),
+                                             ('fighter2', fighter2_id, opponents2)):
+                entry[f'{label}_results'] = [
+                    {
+                        'result': result_for(self.fights[key], fighter_id),
+                        'method': self.fights[key]['method'],
+                        'round': self.fights[key]['round'],
+                        'date': self.fights[key]['date'],
+                        'event': self.fights[key]['event'],
+                    }
+                    for key in links[opponent_id]
+                ]
+            entry['last_met'] = max(r['date'] for r in entry['fighter1_results'] + entry['fighter2_results'])
+            results.append(entry)
+        return sorted(results, key=lambda e: e['last_met'], reverse=True)
+
+    def win_chain(self, start_id, target_id, max_depth=4):
+        """Shortest "A beat B beat C" chain from start to target, via breadth-first search.
+
+        Returns the list of fights along the chain, or None if there is no chain within
+        ``max_depth`` wins.
+        """
+        if start_id == target_id:
+            return []
+        parents = {start_id: None}
+        frontier = deque([(start_id, 0)])
+        while frontier and len(parents) < MAX_VISITED:
+            fighter_id, depth = frontier.popleft()
+            if depth >= max_depth:
+                continue
+            for loser_id, key in self.beat.get(fighter_id, {}).items():
+                if loser_id in parents:
+                    continue
+                parents[loser_id] = (fighter_id, key)
+                if loser_id == target_id:
+                    chain = []
+                    node = loser_id
+                    while parents[node] is not None:
+                        node, key = parents[node]
+                        chain.append(self.fights[key])
+                    return chain[::-1]
+                frontier.append((loser_id, depth + 1))
+        return None
+
+
+def build_fight_graph(snapshot):
+    """The fight graph for this snapshot, extended from the previous one when possible."""
+    fights = fight_table(snapshot)
+    previous = snapshot.previous.cached('fight_graph') if snapshot.previous else None
+
+    if previous is not None and previous.signatures <= set(fights['signature']):
+        graph = previous.copy()
+        new = fights[~fights['signature'].isin(previous.signatures)]
+        graph.add(new)
+        logger.info(f"Fight graph extended with {len(new)} fights")
+    else:
+        graph = FightGraph()
+        graph.add(fights)
+    return graph
+
+
+def fight_graph(snapshot):
+    return snapshot.derived('fight_graph', build_fight_graph)
+
+
+register_derived('fight_graph', build_fight_graph)
@@ -0,0 +1,21 @@
+# Picked up automatically when gunicorn is started from this directory.
+import os
+
+# Threaded workers: runs are awaited on the process's event loop (see chat_runtime.py), but a
+# sync chat, stream or job long-poll still parks a thread until its run is done. app.py caps
+# those at MAX_BLOCKING_CHATS (3/4 of GUNICORN_THREADS by default): chats past the cap get a
+# 429 and long-polls return without waiting, so the data routes keep the remaining threads.
+worker_class = 'gthread'
+workers = int(os.getenv('GUNICORN_WORKERS', '2'))
+threads = int(os.getenv('GUNICORN_THREADS', '64'))
+
+# Chat runs and SSE streams can take minutes; gthread workers keep heartbeating meanwhile
+timeout = 120
+graceful_timeout = 30
+keepalive = 5
+
+
+def post_worker_init(worker):
+    # Fill the worker's pool of empty threads before its first new conversation arrives
+    from app import thread_pool
+    thread_pool.warm()
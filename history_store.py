@@ -0,0 +1,82 @@
+import asyncio
+import threading
+from collections import OrderedDict
+
+MAX_THREADS = 256
+PAGE_SIZE = 100
+
+
+class ThreadHistory:
+    """A thread's settled messages, oldest first, plus the cursor to continue listing from."""
+
+    def __init__(self):
+        self.messages = []  # {"id", "role", "content"}
+        self.cursor = None  # ID of the last settled message
+        self.lock = asyncio.Lock()
+
+
+class HistoryStore:
+    """Per-thread message history kept locally and synced incrementally from the Assistants API.
+
+    Each sync lists only the messages after the last one already stored. Messages still being
+    written by a run are not stored; they are listed again on the next sync until they settle.
+    """
+
+    def __init__(self, runtime, format_content, max_threads=MAX_THREADS):
+        self.runtime = runtime
+        # Turns a message's content blocks into response items
+        self.format_content = format_content
+        self.max_threads = max_threads
+        self._lock = threading.Lock()
+        self._threads = OrderedDict()
+
+    def _history(self, thread_id):
+        with self._lock:
+            history = self._threads.get(thread_id)
+            if history is None:
+                history = self._threads[thread_id] = ThreadHistory()
+                while len(self._threads) > self.max_threads:
+                    self._threads.popitem(last=False)
+            self._threads.move_to_end(thread_id)
+            return history
+
+    async def sync(self, thread_id):
+        """Fetch the thread's new messages and return all of its messages, oldest first."""
+        history = self._history(thread_id)
+        async with history.lock:
+            pending = []
+            params = {'thread_id': thread_id, 'order': 'asc', 'limit': PAGE_SIZE}
+            if history.cursor:
+                params['after'] = history.cursor
+            # The paginator follows the `after` cursor through every remaining page
+            async for msg in self.runtime.client.beta.threads.messages.list(**params):
+                message = {'id': msg.id, 'role': msg.role, 'content': self.format_content(msg)}
+                if msg.status == 'in_progress' or pending:
+                    # Keep everything from the first unsettled message out of the store
+                    pending.append(message)
+                    continue
+                history.messages.append(message)
+                history.cursor = msg.id
+            return history.messages + pending
+
+
+def conversation_turns(messages):
+    """Pair each user message with the last assistant message before the next user message.
+
+    A single pass over messages in thread order.
+    """
+    turns = []
+    reply = None
+    for message in messages:
+        if not message['content']:
+            continue
+        if message['role'] == 'user':
+            if reply is not None:
+                turns.append(reply)
+                reply = None
+            turns.append({'role': 'user', 'content': message['content']})
+        elif message['role'] == 'assistant' and turns:
+            reply = {'role': 'assistant', 'content': message['content']}
+    if reply is not None:
+        turns.append(reply)
+    return turns
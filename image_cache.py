@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import os
+import re
+import threading
+import uuid
+
+from runtime_state import STATE_DIR
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.path.join(STATE_DIR, 'image_cache')
+MAX_BYTES = int(os.getenv('IMAGE_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+FILE_ID_RE = re.compile(r'file-[A-Za-z0-9_-]+')
+
+
+class ImageCache:
+    """On-disk LRU cache of assistant-generated images, keyed by OpenAI file ID.
+
+    File IDs never change content, so a cached file is valid forever; the only reason to drop
+    one is the size bound. Access times are kept as file mtimes, which makes the LRU order shared
+    between gunicorn workers and survive restarts.
+    """
+
+    def __init__(self, runtime, directory=CACHE_DIR, max_bytes=MAX_BYTES):
+        self.runtime = runtime
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._bytes = None     # running total, computed from the directory on first write
+        self._inflight = {}    # file id -> task downloading it
+
+    @staticmethod
+    def valid(file_id):
+        return bool(FILE_ID_RE.fullmatch(file_id or ''))
+
+    def path(self, file_id):
+        return os.path.join(self.directory, f'{file_id}.png')
+
+    def cached_path(self, file_id):
+        """Path of a cached image (marking it recently used), or None."""
+        path = self.path(file_id)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    async def fetch(self, file_id):
+        """Path of the image, downloading it once if it isn't cached yet."""
+        # Disk work runs on worker threads, so a slow disk never stalls the chat loop
+        path = await asyncio.to_thread(self.cached_path, file_id)
+        if path is not None:
+            return path
+        # Concurrent requests for the same image share one download
+        task = self._inflight.get(file_id)
+        if task is None:
+            task = asyncio.ensure_future(self._download(file_id))
+            self._inflight[file_id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(file_id, None))
+        return await task
+
+    async def _download(self, file_id):
+        content = (await self.runtime.client.files.content(file_id)).content
+        path = await asyncio.to_thread(self._store, file_id, content)
+        logger.info(f"Cached image {file_id} ({len(content)} bytes)")
+        return path
+
+    def _store(self, file_id, content):
+        """Write a downloaded image into the cache, evicting if it's over its bound; blocking."""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(file_id)
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+        self._added(len(content))
+        return path
+
+    def read(self, file_id):
+        """Image bytes, from the cache or downloaded."""
+        path = self.cached_path(file_id) or self.runtime.run(self.fetch(file_id))
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def _added(self, size):
+        with self._lock:
+            if self._bytes is None:
+                self._bytes = sum(entry.stat().st_size for entry in os.scandir(self.directory))
+            else:
+                self._bytes += size
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Remove least recently used images until the cache is within 90% of its size bound."""
+        entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith('.png')]
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        total = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if total <= self.max_bytes * 0.9:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                total -= size
+            except FileNotFoundError:
+                pass
+        self._bytes = total
@@ -0,0 +1,277 @@
+import re
+import threading
+from datetime import datetime
+
+import pandas as pd
+
+from aggregates import career_stats, career_stats_record, fight_log
+from datasets import register_derived
+from event_queries import event_date_index
+from search import tokenize
+
+NUMBER_WORDS = {'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6, 'seven': 7,
+                'eight': 8, 'nine': 9, 'ten': 10}
+MAX_FIGHTS_LISTED = 15
+# Longer prompts are rarely pure lookups
+MAX_PROMPT_TOKENS = 25
+MAX_NAME_TOKENS = 4
+
+# Anything that asks for reasoning, visuals or opinion goes to the assistant
+NEEDS_ASSISTANT_RE = re.compile(
+    r'\b(predict\w*|analy[sz]\w*|compar\w*|why|chart|graph|plot|visuali[sz]\w*|simulat\w*|would win|'
+    r'will win|who wins|in detail|in depth|detailed|opinion|think|better|best|greatest|odds|bet\w*|style)\b')
+
+# Stands in for the fighter's name in the text the intent patterns see
+FIGHTER = '@'
+_RECENT = r'(?:last|latest|most recent|recent|previous|past)'
+_COUNT = r'(?:(\d+|' + '|'.join(NUMBER_WORDS) + r')\s+)?'
+_METHODS = r'methods?\s+of\s+(?:victory|victories|wins?)'
+# Fighter lookups only match when the keyword attaches to the fighter's name ("@ record",
+# "last 3 fights of @"), so a keyword elsewhere in a question ("who holds the record for ...")
+# doesn't send it to a template
+INTENT_PATTERNS = {
+    'last_fights': re.compile(
+        rf'@\s+{_COUNT}{_RECENT}\s+{_COUNT}fights?\b|\b{_COUNT}{_RECENT}\s+{_COUNT}fights?\s+(?:of|for|by|from)\s+@'),
+    'record': re.compile(
+        r'@\s+(?:(?:pro|professional|ufc|mma|career|fight|overall)\s+)?record\b|\brecord\s+(?:of|for)\s+@'),
+    'win_methods': re.compile(
+        rf'@\s+(?:{_METHODS}|wins?\s+by\s+method)\b|\b{_METHODS}\s+(?:of|for|by)\s+@|\bhow\s+(?:has|does|did)\s+@\s+(?:win|won)\b'),
+    'next_event': re.compile(r'\b(?:next|upcoming)\b.*\b(?:event|card|fight|ufc)\b'),
+}
+
+
+class FighterNameIndex:
+    """Finds fighter names mentioned in free text, from fighter_info.csv.
+
+    Full names are matched anywhere in the text; a surname on its own only when exactly one
+    fighter with recorded fights has it.
+    """
+
+    def __init__(self, fighters, fight_counts):
+        self.names = {}
+        self.full = {}
+        surnames = {}
+        for name, fighter_id in zip(fighters['Fighter'], fighters['Fighter_ID']):
+            tokens = tuple(tokenize(name))
+            if not tokens:
+                continue
+            fighter_id = int(fighter_id)
+            self.names[fighter_id] = name
+            # Same name twice: keep the fighter with more recorded fights
+            current = self.full.get(tokens)
+            if current is None or fight_counts.get(fighter_id, 0) > fight_counts.get(current, 0):
+                self.full[tokens] = fighter_id
+            if len(tokens) > 1 and fight_counts.get(fighter_id, 0):
+                surnames.setdefault(tokens[-1], set()).add(fighter_id)
+        self.surnames = {surname: ids.pop() for surname, ids in surnames.items() if len(ids) == 1}
+
+    def _lookup(self, tokens):
+        # Also try the possessive form ("holloways" -> "holloway")
+        candidates = [tokens]
+        if tokens[-1].endswith('s'):
+            candidates.append(tokens[:-1] + (tokens[-1][:-1],))
+        for candidate in candidates:
+            if candidate in self.full:
+                return self.full[candidate]
+            if len(candidate) == 1 and candidate[0] in self.surnames:
+                return self.surnames[candidate[0]]
+        return None
+
+    def mentions(self, tokens):
+        """(fighter id, start, end) token spans of the names in ``tokens``, longest names first."""
+        spans = []
+        i = 0
+        while i < len(tokens):
+            for n in range(min(MAX_NAME_TOKENS, len(tokens) - i), 0, -1):
+                fighter_id = self._lookup(tuple(tokens[i:i + n]))
+                if fighter_id is not None:
+                    spans.append((fighter_id, i, i + n))
+                    i += n
+                    break
+            else:
+                i += 1
+        return spans
+
+    def find(self, text):
+        """IDs of the fighters mentioned in ``text``, in order of appearance."""
+        found = []
+        for fighter_id, _, _ in self.mentions(tokenize(text)):
+            if fighter_id not in found:
+                found.append(fighter_id)
+        return found
+
+
+def build_fighter_name_index(snapshot):
+    counts = fight_log(snapshot)['fighter_id'].value_counts().to_dict()
+    return FighterNameIndex(snapshot.frame('fighters'), counts)
+
+
+def fighter_name_index(snapshot):
+    return snapshot.derived('fighter_name_index', build_fighter_name_index)
+
+
+register_derived('fighter_name_index', build_fighter_name_index)
+
+
+def _count(match):
+    value = next((group for group in match.groups() if group), None)
+    if value is None:
+        return None
+    return int(value) if value.isdigit() else NUMBER_WORDS[value]
+
+
+def _with_placeholder(tokens, spans):
+    """The prompt's tokens with each fighter name replaced by FIGHTER."""
+    words = list(tokens)
+    for _, start, end in reversed(spans):
+        words[start:end] = [FIGHTER]
+    return ' '.join(words)
+
+
+def _plural(n, word, plural=None):
+    return f"{n} {word}" if n == 1 else f"{n} {plural or word + 's'}"
+
+
+def _fight_line(row):
+    date = row.date.strftime('%b %d, %Y') if not pd.isna(row.date) else 'Unknown date'
+    outcome = {'W': 'Win', 'L': 'Loss', 'D': 'Draw', 'NC': 'No contest'}.get(row.result, row.result)
+    return f"{date}: {outcome} vs. {row.opponent} by {row.method}, round {row.round} at {row.time} ({row.event})"
+
+
+def answer_last_fights(snapshot, fighter_id, name, n):
+    fights = fight_log(snapshot)
+    fights = fights[fights['fighter_id'] == fighter_id].head(min(n, MAX_FIGHTS_LISTED))
+    if fights.empty:
+        return None
+    lines = [_fight_line(row) for row in fights.itertuples(index=False)]
+    heading = f"{name}'s last fight:" if len(lines) == 1 else f"{name}'s last {len(lines)} fights:"
+    return heading + '\n' + '\n'.join(lines)
+
+
+def answer_record(snapshot, fighter_id, name):
+    fighters = snapshot.frame('fighters')
+    profile = fighters[fighters['Fighter_ID'] == fighter_id].iloc[0]
+    text = (f"{name} has a professional record of {int(profile['Wins'])}-{int(profile['Losses'])} "
+            f"({int(profile['Win_KO'])} KO/TKO, {int(profile['Win_Sub'])} submission and "
+            f"{int(profile['Win_Decision'])} decision wins).")
+    stats = career_stats_record(career_stats(snapshot), fighter_id)
+    if stats:
+        ufc = f"{stats['wins']}-{stats['losses']}"
+        if stats['draws']:
+            ufc += f"-{stats['draws']}"
+        if stats['no_contests']:
+            ufc += f" ({_plural(stats['no_contests'], 'no contest')})"
+        streak = stats['current_streak']
+        text += f"\nUFC record: {ufc}."
+        if streak:
+            text += (f" Current streak: "
+                     f"{_plural(abs(streak), 'win') if streak > 0 else _plural(-streak, 'loss', 'losses')}.")
+    return text
+
+
+def answer_win_methods(snapshot, fighter_id, name):
+    stats = career_stats_record(career_stats(snapshot), fighter_id)
+    if not stats or not stats['wins']:
+        return None
+    wins = stats['wins']
+    parts = [(stats['wins_ko'], 'KO/TKO'), (stats['wins_sub'], 'submission'), (stats['wins_dec'], 'decision')]
+    breakdown = ', '.join(f"{count} by {label} ({count / wins:.0%})" for count, label in parts)
+    text = f"{name} has {_plural(wins, 'UFC win')}: {breakdown}."
+    if stats['losses']:
+        losses = [(stats['losses_ko'], 'KO/TKO'), (stats['losses_sub'], 'submission'), (stats['losses_dec'], 'decision')]
+        text += "\nLosses: " + ', '.join(f"{count} by {label}" for count, label in losses) + '.'
+    return text
+
+
+def _card_text(card, fights):
+    lines = [f"{row['Fighter 1']} vs. {row['Fighter 2']} ({row['Weight Class']})" for _, row in fights.iterrows()]
+    return (f"{card['event']} takes place on {card['date'].strftime('%B %d, %Y')} at {card['location']}.\n"
+            "Fights:\n" + '\n'.join(lines))
+
+
+def answer_next_event(snapshot, fighter_id=None, name=None):
+    if not snapshot.has('upcoming'):
+        return None
+    upcoming = snapshot.frame('upcoming')
+    index = event_date_index(snapshot)
+    card = index.next_card(pd.Timestamp(datetime.now().date()).to_datetime64())
+    if card is None:
+        return None
+    if fighter_id is None:
+        return _card_text(card, upcoming[upcoming['Event Name'] == card['event']])
+    bouts = upcoming[(upcoming['Event Name'] == card['event'])
+                     & ((upcoming['Fighter 1 ID'] == fighter_id) | (upcoming['Fighter 2 ID'] == fighter_id))]
+    if bouts.empty:
+        return None
+    bout = bouts.iloc[0]
+    opponent = bout['Fighter 2'] if bout['Fighter 1 ID'] == fighter_id else bout['Fighter 1']
+    return (f"{name} fights {opponent} ({bout['Weight Class']}) at {card['event']} "
+            f"on {card['date'].strftime('%B %d, %Y')}, {card['location']}.")
+
+
+class IntentRouter:
+    """Answers simple stat lookups straight from the datasets; everything else goes to the assistant.
+
+    Keeps per-process counts of how many messages were answered locally, by intent.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.messages = 0
+        self.local = {}
+
+    def classify(self, text):
+        """(intent, match) for normalized text, with the fighter's name as FIGHTER, that is a pure lookup; else None."""
+        if not text or len(text.split()) > MAX_PROMPT_TOKENS or NEEDS_ASSISTANT_RE.search(text):
+            return None
+        matches = [(intent, m) for intent, pattern in INTENT_PATTERNS.items() if (m := pattern.search(text))]
+        # Ambiguous prompts (several templates at once) are left to the assistant
+        return matches[0] if len(matches) == 1 else None
+
+    def _answer(self, snapshot, prompt):
+        tokens = tokenize(prompt)
+        if len(tokens) > MAX_PROMPT_TOKENS:
+            return None
+        index = fighter_name_index(snapshot)
+        spans = index.mentions(tokens)
+        fighters = {fighter_id for fighter_id, _, _ in spans}
+        if len(fighters) > 1:
+            return None
+        classified = self.classify(_with_placeholder(tokens, spans))
+        if classified is None:
+            return None
+        intent, match = classified
+        fighter_id = fighters.pop() if fighters else None
+        name = index.names.get(fighter_id)
+
+        if intent == 'next_event':
+            return intent, answer_next_event(snapshot, fighter_id, name)
+        if fighter_id is None:
+            return None
+        if intent == 'last_fights':
+            n = _count(match) or (1 if re.search(r'\bfight\b', match.group(0)) else 5)
+            return intent, answer_last_fights(snapshot, fighter_id, name, n)
+        if intent == 'record':
+            return intent, answer_record(snapshot, fighter_id, name)
+        return intent, answer_win_methods(snapshot, fighter_id, name)
+
+    def answer(self, prompt, snapshot):
+        """(intent, answer text) when the prompt can be answered locally, else None."""
+        result = self._answer(snapshot, prompt)
+        if result is not None and result[1] is None:
+            result = None
+        with self._lock:
+            self.messages += 1
+            if result is not None:
+                self.local[result[0]] = self.local.get(result[0], 0) + 1
+        return result
+
+    def stats(self):
+        with self._lock:
+            handled = sum(self.local.values())
+            return {
+                'messages': self.messages,
+                'handled_locally': handled,
+                'local_fraction': round(handled / self.messages, 4) if self.messages else 0.0,
+                'by_intent': dict(self.local),
+            }
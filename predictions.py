@@ -0,0 +1,292 @@
+"""Win-probability model: feature building, training, and batch scoring of the upcoming card.
+
+Run directly to publish the model and upcoming predictions for the current data:
+    python predictions.py
+"""
+import glob
+import json
+import logging
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from aggregates import fight_log, fighter_physicals
+from datasets import get_snapshot, register_derived
+from ratings import INITIAL_RATING, ratings
+from runtime_state import STATE_DIR
+from serialization import dumps
+
+logger = logging.getLogger(__name__)
+
+MODELS_DIR = os.path.join(STATE_DIR, 'models')
+MODEL_FORMAT = 1
+# Artifacts are kept for this many data versions
+KEEP_VERSIONS = 3
+
+FEATURES = [
+    'win_rate', 'experience', 'ko_win_rate', 'sub_win_rate', 'ko_loss_rate',
+    'recent_form', 'layoff', 'age', 'height', 'reach', 'elo',
+]
+# Used for debuts and missing physical data
+DEBUT_LAYOFF_DAYS = 365
+L2_PENALTY = 1.0
+HOLDOUT_FRACTION = 0.1
+
+
+def _side_features(stats, physicals, dates):
+    """Per-row feature values for one side, from running stats plus physical attributes."""
+    phys = physicals.reindex(stats['fighter_id'].to_numpy())
+    age = (dates.to_numpy() - phys['birth_date'].to_numpy()) / np.timedelta64(1, 'D') / 365.25
+    fights = stats['prior_fights'].to_numpy()
+    safe = np.maximum(fights, 1)
+    return pd.DataFrame({
+        'win_rate': (stats['prior_wins'].to_numpy() + 1) / (fights + 2),
+        'experience': np.log1p(fights),
+        'ko_win_rate': stats['prior_ko_wins'].to_numpy() / safe,
+        'sub_win_rate': stats['prior_sub_wins'].to_numpy() / safe,
+        'ko_loss_rate': stats['prior_ko_losses'].to_numpy() / safe,
+        'recent_form': stats['recent_form'].to_numpy(),
+        'layoff': np.log1p(stats['layoff_days'].to_numpy()),
+        'age': age,
+        'height': phys['height_in'].to_numpy(),
+        'reach': phys['reach_in'].to_numpy(),
+        'elo': (stats['elo'].to_numpy() - INITIAL_RATING) / 100,
+    })
+
+
+def _pre_fight_stats(snapshot):
+    """Each fighter's record going into every fight, computed with grouped cumulative sums."""
+    log = fight_log(snapshot)
+    # The log is newest-first per fighter; running totals need oldest-first
+    log = log.iloc[::-1].sort_values(['fighter_id', 'date'], kind='stable').reset_index(drop=True)
+    grouped = log.groupby('fighter_id', sort=False)
+    won = (log['result'] == 'W').astype(int)
+    lost = (log['result'] == 'L').astype(int)
+    ko = (log['method_category'] == 'KO/TKO').astype(int)
+    sub = (log['method_category'] == 'Submission').astype(int)
+
+    def before(flags):
+        return flags.groupby(log['fighter_id'], sort=False).cumsum() - flags
+
+    stats = log[['fight_id', 'fighter_id', 'opponent_id', 'date', 'result']].copy()
+    stats['prior_fights'] = grouped.cumcount()
+    stats['prior_wins'] = before(won)
+    stats['prior_ko_wins'] = before(won * ko)
+    stats['prior_sub_wins'] = before(won * sub)
+    stats['prior_ko_losses'] = before(lost * ko)
+
+    # Win share over the last three fights before this one
+    wins_before = stats['prior_wins']
+    wins_three_back = wins_before.groupby(log['fighter_id'], sort=False).shift(3).fillna(0)
+    recent = np.minimum(stats['prior_fights'], 3)
+    stats['recent_form'] = ((wins_before - wins_three_back) / recent.where(recent > 0)).fillna(0.5)
+    stats['layoff_days'] = grouped['date'].diff().dt.days.fillna(DEBUT_LAYOFF_DAYS)
+
+    # Elo going into the fight, from the rating engine's history
+    history = pd.DataFrame(ratings(snapshot).history,
+                           columns=['fighter_id', 'date', 'opponent_id', 'result', 'elo', 'elo_after'])
+    history = history.drop_duplicates(['fighter_id', 'date', 'opponent_id'])
+    stats['date_key'] = stats['date'].dt.strftime('%Y-%m-%d')
+    stats = stats.merge(history[['fighter_id', 'date', 'opponent_id', 'elo']].rename(columns={'date': 'date_key'}),
+                        on=['fighter_id', 'date_key', 'opponent_id'], how='left')
+    stats['elo'] = stats['elo'].fillna(INITIAL_RATING)
+    return stats
+
+
+def training_frame(snapshot):
+    """Feature deltas (fighter 1 minus fighter 2) and labels for every fight with a winner."""
+    stats = _pre_fight_stats(snapshot)
+    events = snapshot.frame('events')
+    physicals = fighter_physicals(snapshot)
+
+    fighter1_ids = events['Fighter 1 ID'].reindex(stats['fight_id']).to_numpy()
+    is_first = stats['fighter_id'].to_numpy() == fighter1_ids
+    side1 = stats[is_first].drop_duplicates('fight_id').set_index('fight_id')
+    side2 = stats[~is_first].drop_duplicates('fight_id').set_index('fight_id')
+    fight_ids = side1.index.intersection(side2.index)
+    side1, side2 = side1.loc[fight_ids], side2.loc[fight_ids]
+    decided = side1['result'].isin(['W', 'L']).to_numpy()
+
+    features1 = _side_features(side1.reset_index(), physicals, side1['date'])
+    features2 = _side_features(side2.reset_index(), physicals, side2['date'])
+    deltas = (features1 - features2).fillna(0)[decided]
+    labels = (side1['result'].to_numpy() == 'W')[decided].astype(float)
+    dates = side1['date'].to_numpy()[decided]
+    return deltas.reset_index(drop=True), labels, dates
+
+
+def fit_logistic(X, y, l2=L2_PENALTY, iterations=25):
+    """L2-regularized logistic regression (no intercept) fitted with Newton's method."""
+    weights = np.zeros(X.shape[1])
+    for _ in range(iterations):
+        p = 1 / (1 + np.exp(-X @ weights))
+        gradient = X.T @ (p - y) + l2 * weights
+        hessian = (X.T * (p * (1 - p))) @ X + l2 * np.eye(X.shape[1])
+        step = np.linalg.solve(hessian, gradient)
+        weights -= step
+        if np.abs(step).max() < 1e-8:
+            break
+    return weights
+
+
+def _metrics(X, y, weights):
+    p = np.clip(1 / (1 + np.exp(-X @ weights)), 1e-9, 1 - 1e-9)
+    return {
+        'rows': int(len(y)),
+        'log_loss': round(float(-np.mean(y * np.log(p) + (1 - y) * np.log(1 - p))), 4),
+        'accuracy': round(float(np.mean((p >= 0.5) == (y == 1))), 4),
+    }
+
+
+def train_model(snapshot):
+    """Fit the model on every decided fight and report metrics on the most recent fights."""
+    deltas, labels, dates = training_frame(snapshot)
+    order = np.argsort(dates, kind='stable')
+    X_all, y_all = deltas.to_numpy()[order], labels[order]
+    scale = X_all.std(axis=0)
+    scale[scale == 0] = 1.0
+
+    def symmetric(X, y):
+        # Every fight seen from both corners, so the model can't favour the fighter 1 slot
+        return np.vstack([X, -X]) / scale, np.concatenate([y, 1 - y])
+
+    split = int(len(y_all) * (1 - HOLDOUT_FRACTION))
+    holdout_weights = fit_logistic(*symmetric(X_all[:split], y_all[:split]))
+    holdout = _metrics(X_all[split:] / scale, y_all[split:], holdout_weights)
+    weights = fit_logistic(*symmetric(X_all, y_all))
+
+    return {
+        'format': MODEL_FORMAT,
+        'data_version': snapshot.version,
+        'trained_at': datetime.now().isoformat(),
+        'features': FEATURES,
+        'scale': scale.round(6).tolist(),
+        'weights': weights.round(6).tolist(),
+        'metrics': {'train': _metrics(X_all / scale, y_all, weights), 'holdout': holdout},
+    }
+
+
+def _current_stats(snapshot, fighter_ids, as_of):
+    """Going-into-the-next-fight stats for fighters on the upcoming card."""
+    log = fight_log(snapshot)
+    log = log[log['fighter_id'].isin(fighter_ids)]
+    grouped = log.groupby('fighter_id', sort=False)
+    won, lost = log['result'] == 'W', log['result'] == 'L'
+    ko, sub = log['method_category'] == 'KO/TKO', log['method_category'] == 'Submission'
+    totals = pd.DataFrame({
+        'prior_fights': 1, 'prior_wins': won, 'prior_ko_wins': won & ko,
+        'prior_sub_wins': won & sub, 'prior_ko_losses': lost & ko,
+    }).astype(int).groupby(log['fighter_id'], sort=False).sum()
+    totals['recent_form'] = grouped.head(3).assign(w=won).groupby('fighter_id')['w'].mean()
+    totals['layoff_days'] = (as_of - grouped['date'].max()).dt.days
+
+    stats = totals.reindex(fighter_ids)
+    stats = stats.fillna({'prior_fights': 0, 'prior_wins': 0, 'prior_ko_wins': 0, 'prior_sub_wins': 0,
+                          'prior_ko_losses': 0, 'recent_form': 0.5, 'layoff_days': DEBUT_LAYOFF_DAYS})
+    state = ratings(snapshot)
+    stats['elo'] = [state.ratings.get(fid, INITIAL_RATING) for fid in fighter_ids]
+    stats.index.name = 'fighter_id'
+    return stats.reset_index()
+
+
+def score_upcoming(snapshot, model):
+    """Batch-score every bout on the upcoming card with a trained model."""
+    if not snapshot.has('upcoming'):
+        return []
+    upcoming = snapshot.frame('upcoming')
+    physicals = fighter_physicals(snapshot)
+    dates = pd.to_datetime(upcoming['Event Date'], utc=True, errors='coerce').dt.tz_localize(None)
+    as_of = pd.Timestamp.now(tz='UTC').tz_localize(None)
+
+    sides = []
+    for corner in ('1', '2'):
+        ids = upcoming[f'Fighter {corner} ID'].astype(int).tolist()
+        stats = _current_stats(snapshot, ids, as_of)
+        sides.append(_side_features(stats, physicals, dates.fillna(as_of).reset_index(drop=True)))
+    deltas = (sides[0] - sides[1]).fillna(0)[model['features']].to_numpy()
+    probabilities = 1 / (1 + np.exp(-(deltas / np.array(model['scale'])) @ np.array(model['weights'])))
+
+    return [
+        {
+            'event': row['Event Name'],
+            'date': row['Event Date'],
+            'fighter1': row['Fighter 1'],
+            'fighter1_id': int(row['Fighter 1 ID']),
+            'fighter2': row['Fighter 2'],
+            'fighter2_id': int(row['Fighter 2 ID']),
+            'weight_class': row['Weight Class'],
+            'fight_type': row['Fight Type'],
+            'fighter1_win_probability': round(float(p), 4),
+            'fighter2_win_probability': round(float(1 - p), 4),
+        }
+        for (_, row), p in zip(upcoming.iterrows(), probabilities)
+    ]
+
+
+def _artifact_path(kind, version):
+    return os.path.join(MODELS_DIR, f'{kind}_{version}.json')
+
+
+def _write_artifact(kind, version, payload):
+    os.makedirs(MODELS_DIR, exist_ok=True)
+    path = _artifact_path(kind, version)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(payload, f, indent=2)
+    os.replace(tmp_path, path)
+    # Drop artifacts from old data versions
+    old = sorted(glob.glob(os.path.join(MODELS_DIR, f'{kind}_*.json')), key=os.path.getmtime)
+    for stale in old[:-KEEP_VERSIONS]:
+        os.remove(stale)
+
+
+def _read_artifact(kind, version):
+    try:
+        with open(_artifact_path(kind, version)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def publish_predictions(snapshot):
+    """Train (or reuse) the model for this data version and batch-score the upcoming card."""
+    model = _read_artifact('win_model', snapshot.version)
+    predictions = _read_artifact('predictions_upcoming', snapshot.version)
+    if model is None or model.get('format') != MODEL_FORMAT:
+        model = train_model(snapshot)
+        _write_artifact('win_model', snapshot.version, model)
+        predictions = None
+        logger.info(f"Trained win model for {snapshot.version}: {model['metrics']}")
+    if predictions is None:
+        predictions = {
+            'data_version': snapshot.version,
+            'scored_at': datetime.now().isoformat(),
+            'model': {key: model[key] for key in ('trained_at', 'features', 'metrics')},
+            'predictions': score_upcoming(snapshot, model),
+        }
+        _write_artifact('predictions_upcoming', snapshot.version, predictions)
+    return predictions
+
+
+def build_upcoming_predictions(snapshot):
+    """Published predictions, pre-encoded so the endpoint only copies bytes."""
+    return dumps(publish_predictions(snapshot))
+
+
+def upcoming_predictions(snapshot):
+    """Encoded predictions if they are ready; never trains or scores on the caller's thread."""
+    return snapshot.cached('upcoming_predictions')
+
+
+register_derived('upcoming_predictions', build_upcoming_predictions)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    published = publish_predictions(get_snapshot())
+    print(json.dumps(published['model']['metrics'], indent=2))
+    for bout in published['predictions']:
+        print(f"{bout['fighter1']:>25} {bout['fighter1_win_probability']:.0%}  vs  "
+              f"{bout['fighter2_win_probability']:.0%} {bout['fighter2']}")
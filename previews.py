@@ -0,0 +1,154 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from aggregates import career_stats, career_stats_record, fight_log, fighter_physicals
+from datasets import register_derived
+from ratings import ratings
+from serialization import dumps
+
+
+def event_slug(name):
+    """URL-friendly key for an event name, e.g. "ufc-on-espn-70-lewis-vs-teixeira"."""
+    return re.sub(r'[^a-z0-9]+', '-', str(name).lower()).strip('-')
+
+
+def american_to_probability(odds):
+    odds = np.asarray(odds, dtype=float)
+    return np.where(odds < 0, -odds, 100) / (np.abs(odds) + 100)
+
+
+def probability_to_american(probability):
+    if probability >= 0.5:
+        return int(round(-100 * probability / (1 - probability)))
+    return int(round(100 * (1 - probability) / probability))
+
+
+def build_consensus_odds(snapshot):
+    """Latest line per sportsbook for every fighter, combined into a consensus line."""
+    if not snapshot.has('odds'):
+        return pd.DataFrame(columns=['consensus_odds', 'implied_probability', 'sportsbooks', 'updated'])
+    odds = snapshot.frame('odds')
+    lines = pd.DataFrame({
+        'fighter': odds['fighter'].str.lower(),
+        'sportsbook': odds['sportsbook'],
+        'updated': odds['file2'].str.extract(r'(\d{8}_\d{4})')[0],
+        'odds': pd.to_numeric(odds['odds_after'].astype(str).str.replace('+', '', regex=False), errors='coerce'),
+    })
+    lines = lines[lines['odds'].notna() & (lines['odds'] != 0)]
+    latest = lines.sort_values('updated', kind='stable').groupby(['fighter', 'sportsbook']).tail(1)
+    latest = latest.assign(probability=american_to_probability(latest['odds']))
+    consensus = latest.groupby('fighter').agg(
+        implied_probability=('probability', 'mean'),
+        sportsbooks=('sportsbook', 'nunique'),
+        updated=('updated', 'max'),
+    )
+    consensus['consensus_odds'] = consensus['implied_probability'].map(probability_to_american)
+    consensus['implied_probability'] = consensus['implied_probability'].round(4)
+    return consensus
+
+
+def consensus_odds(snapshot):
+    return snapshot.derived('consensus_odds', build_consensus_odds)
+
+
+def _last_five(log, fighter_id):
+    fights = log[log['fighter_id'] == fighter_id].head(5)
+    return [
+        {
+            'date': row.date.date().isoformat() if not pd.isna(row.date) else None,
+            'opponent': row.opponent,
+            'result': row.result,
+            'method': row.method,
+            'round': int(row.round),
+            'time': row.time,
+            'event': row.event,
+        }
+        for row in fights.itertuples(index=False)
+    ]
+
+
+def _fighter_preview(snapshot, fighter_id, name, event_date):
+    fighters = snapshot.frame('fighters')
+    profile = fighters[fighters['Fighter_ID'] == fighter_id]
+    physicals = fighter_physicals(snapshot)
+    phys = physicals.loc[fighter_id] if fighter_id in physicals.index else None
+    odds = consensus_odds(snapshot)
+    line = odds.loc[name.lower()] if name.lower() in odds.index else None
+
+    age = None
+    if phys is not None and not pd.isna(phys['birth_date']) and not pd.isna(event_date):
+        age = round((event_date - phys['birth_date']).days / 365.25, 1)
+    ufc = career_stats_record(career_stats(snapshot), fighter_id)
+
+    return {
+        'id': fighter_id,
+        'name': name,
+        'record': {
+            'wins': int(profile['Wins'].iloc[0]) if len(profile) else None,
+            'losses': int(profile['Losses'].iloc[0]) if len(profile) else None,
+        },
+        'ufc_record': {key: ufc[key] for key in ('wins', 'losses', 'draws', 'no_contests')} if ufc else None,
+        'current_streak': ufc['current_streak'] if ufc else 0,
+        'last_5': _last_five(fight_log(snapshot), fighter_id),
+        'rating': round(ratings(snapshot).ratings[fighter_id], 1) if fighter_id in ratings(snapshot).ratings else None,
+        'age': age,
+        'height_in': None if phys is None or pd.isna(phys['height_in']) else float(phys['height_in']),
+        'reach_in': None if phys is None or pd.isna(phys['reach_in']) else float(phys['reach_in']),
+        'stance': None if phys is None or phys['stance'] is None else phys['stance'],
+        'odds': None if line is None else {
+            'consensus': int(line['consensus_odds']),
+            'implied_probability': float(line['implied_probability']),
+            'sportsbooks': int(line['sportsbooks']),
+            'updated': line['updated'],
+        },
+    }
+
+
+def _delta(a, b):
+    return None if a is None or b is None else round(a - b, 1)
+
+
+def build_card_previews(snapshot):
+    """Encoded preview for every upcoming card, keyed by event slug."""
+    if not snapshot.has('upcoming'):
+        return {}
+    upcoming = snapshot.frame('upcoming')
+    previews = {}
+    for event_name, group in upcoming.groupby('Event Name', sort=False):
+        event_date = pd.to_datetime(group['Event Date'].iloc[0], utc=True, errors='coerce').tz_localize(None)
+        bouts = []
+        for _, row in group.iterrows():
+            fighter1 = _fighter_preview(snapshot, int(row['Fighter 1 ID']), row['Fighter 1'], event_date)
+            fighter2 = _fighter_preview(snapshot, int(row['Fighter 2 ID']), row['Fighter 2'], event_date)
+            bouts.append({
+                'fighter1': fighter1,
+                'fighter2': fighter2,
+                'weightClass': row['Weight Class'],
+                'fightType': row['Fight Type'],
+                # Fighter 1 minus fighter 2
+                'deltas': {
+                    'age': _delta(fighter1['age'], fighter2['age']),
+                    'height_in': _delta(fighter1['height_in'], fighter2['height_in']),
+                    'reach_in': _delta(fighter1['reach_in'], fighter2['reach_in']),
+                    'rating': _delta(fighter1['rating'], fighter2['rating']),
+                },
+            })
+        preview = {
+            'eventName': event_name,
+            'slug': event_slug(event_name),
+            'location': group['Event Location'].iloc[0],
+            'date': group['Event Date'].iloc[0],
+            'data_version': snapshot.version,
+            'bouts': bouts,
+        }
+        previews[preview['slug']] = dumps(preview)
+    return previews
+
+
+def card_previews(snapshot):
+    return snapshot.derived('card_previews', build_card_previews)
+
+
+register_derived('card_previews', build_card_previews)
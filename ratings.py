@@ -0,0 +1,222 @@
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+from aggregates import fight_table
+from datasets import register_derived
+from runtime_state import STATE_DIR
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_PATH = os.path.join(STATE_DIR, 'ratings_checkpoint.json')
+CHECKPOINT_FORMAT = 2
+
+INITIAL_RATING = 1500.0
+K_FACTOR = 32.0
+# New fighters move faster until their rating has settled
+PROVISIONAL_K_FACTOR = 48.0
+PROVISIONAL_FIGHTS = 5
+# KO/TKO and submission wins count for a little more than decisions
+FINISH_MULTIPLIER = 1.25
+
+
+def _digest(keys):
+    return hashlib.sha256('\n'.join(keys).encode()).hexdigest()
+
+
+class EloRatings:
+    """Elo rating state that can be checkpointed and advanced one batch of fights at a time."""
+
+    def __init__(self):
+        self.ratings = {}
+        self.fight_counts = {}
+        self.names = {}
+        self.divisions = {}
+        # [fighter_id, date, opponent_id, result, rating_before, rating_after]
+        self.history = []
+        self.last_date = None
+        self.fights_processed = 0
+        self.digest = _digest([])
+
+    def expected(self, rating, opponent_rating):
+        return 1.0 / (1.0 + 10 ** ((opponent_rating - rating) / 400.0))
+
+    def k_factor(self, fighter_id):
+        if self.fight_counts.get(fighter_id, 0) < PROVISIONAL_FIGHTS:
+            return PROVISIONAL_K_FACTOR
+        return K_FACTOR
+
+    def apply(self, fights):
+        """Apply fights (already in date order) to the current ratings."""
+        for fight in fights.itertuples(index=False):
+            id1, id2 = fight.fighter1_id, fight.fighter2_id
+            self.names[id1], self.names[id2] = fight.fighter1, fight.fighter2
+            # Catchweight bouts don't say which division a fighter competes in
+            if isinstance(fight.weight_class, str) and 'catch' not in fight.weight_class.lower():
+                self.divisions[id1] = self.divisions[id2] = fight.weight_class
+            if np.isnan(fight.score):
+                continue
+
+            r1 = self.ratings.get(id1, INITIAL_RATING)
+            r2 = self.ratings.get(id2, INITIAL_RATING)
+            e1 = self.expected(r1, r2)
+            multiplier = FINISH_MULTIPLIER if fight.finish and fight.score != 0.5 else 1.0
+            new1 = r1 + self.k_factor(id1) * multiplier * (fight.score - e1)
+            new2 = r2 + self.k_factor(id2) * multiplier * ((1 - fight.score) - (1 - e1))
+
+            results = {1.0: ('W', 'L'), 0.0: ('L', 'W'), 0.5: ('D', 'D')}[fight.score]
+            self.history.append([id1, fight.date, id2, results[0], round(r1, 1), round(new1, 1)])
+            self.history.append([id2, fight.date, id1, results[1], round(r2, 1), round(new2, 1)])
+            self.ratings[id1], self.ratings[id2] = new1, new2
+            self.fight_counts[id1] = self.fight_counts.get(id1, 0) + 1
+            self.fight_counts[id2] = self.fight_counts.get(id2, 0) + 1
+
+        if len(fights):
+            self.last_date = fights['date'].iloc[-1]
+            self.fights_processed += len(fights)
+
+    def advance(self, fights):
+        """Bring the state up to date with ``fights``; returns how many fights were applied.
+
+        Only fights after the checkpoint date are replayed. If anything at or before the
+        checkpoint changed (a corrected result, a late-added bout), the history is replayed
+        from scratch instead.
+        """
+        if self.last_date is not None:
+            seen = fights[fights['date'] <= self.last_date]
+            if len(seen) == self.fights_processed and _digest(seen['signature']) == self.digest:
+                new = fights[fights['date'] > self.last_date]
+                self.apply(new)
+                self.digest = _digest(fights['signature'])
+                return len(new)
+            logger.info("Rating history changed before the checkpoint, replaying all fights")
+            self.__init__()
+
+        self.apply(fights)
+        self.digest = _digest(fights['signature'])
+        return len(fights)
+
+    def to_dict(self):
+        return {
+            'format': CHECKPOINT_FORMAT,
+            'last_date': self.last_date,
+            'fights_processed': self.fights_processed,
+            'digest': self.digest,
+            'ratings': {str(k): v for k, v in self.ratings.items()},
+            'fight_counts': {str(k): v for k, v in self.fight_counts.items()},
+            'names': {str(k): v for k, v in self.names.items()},
+            'divisions': {str(k): v for k, v in self.divisions.items()},
+            'history': self.history,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        state = cls()
+        state.last_date = data['last_date']
+        state.fights_processed = data['fights_processed']
+        state.digest = data['digest']
+        state.ratings = {int(k): v for k, v in data['ratings'].items()}
+        state.fight_counts = {int(k): v for k, v in data['fight_counts'].items()}
+        state.names = {int(k): v for k, v in data['names'].items()}
+        state.divisions = {int(k): v for k, v in data['divisions'].items()}
+        state.history = data['history']
+        return state
+
+    def copy(self):
+        state = EloRatings()
+        state.__dict__.update({key: value.copy() if isinstance(value, (dict, list)) else value
+                               for key, value in self.__dict__.items()})
+        return state
+
+
+def load_checkpoint(path=CHECKPOINT_PATH):
+    try:
+        with open(path) as f:
+            data = json.load(f)
+        if data.get('format') == CHECKPOINT_FORMAT:
+            return EloRatings.from_dict(data)
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, KeyError) as e:
+        logger.error(f"Ignoring unreadable ratings checkpoint: {str(e)}")
+    return None
+
+
+def save_checkpoint(state, path=CHECKPOINT_PATH):
+    try:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state.to_dict(), f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.error(f"Could not write ratings checkpoint: {str(e)}")
+
+
+def build_ratings(snapshot):
+    """Ratings for this snapshot, advanced from the previous snapshot or the disk checkpoint."""
+    fights = fight_table(snapshot)
+    previous = snapshot.previous.cached('ratings') if snapshot.previous else None
+    # Never mutate a state another snapshot is still serving
+    state = previous.copy() if previous else (load_checkpoint() or EloRatings())
+    applied = state.advance(fights)
+    logger.info(f"Ratings advanced by {applied} fights (through {state.last_date})")
+    if applied:
+        save_checkpoint(state)
+    return state
+
+
+def ratings(snapshot):
+    return snapshot.derived('ratings', build_ratings)
+
+
+register_derived('ratings', build_ratings)
+
+
+def ratings_table(state):
+    """Current ratings as a DataFrame sorted best-first."""
+    table = pd.DataFrame({
+        'fighter_id': list(state.ratings),
+        'rating': [round(r, 1) for r in state.ratings.values()],
+    })
+    table['fighter'] = table['fighter_id'].map(state.names)
+    table['division'] = table['fighter_id'].map(state.divisions)
+    table['fights'] = table['fighter_id'].map(state.fight_counts)
+    last_fight = {}
+    for fighter_id, date, *_ in state.history:
+        last_fight[fighter_id] = date
+    table['last_fight_date'] = table['fighter_id'].map(last_fight)
+    return table.sort_values('rating', ascending=False).reset_index(drop=True)
+
+
+def leaderboard(state, division=None, limit=25, min_fights=3, active_days=730):
+    """Top rated fighters, optionally for one division, who have fought recently."""
+    table = ratings_table(state)
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=active_days)).strftime('%Y-%m-%d')
+    table = table[(table['fights'] >= min_fights) & (table['last_fight_date'] >= cutoff)]
+    if division:
+        table = table[table['division'].str.lower() == division.lower()]
+    table = table.head(limit).reset_index(drop=True)
+    table.insert(0, 'rank', table.index + 1)
+    return table
+
+
+def rating_history(state, fighter_id):
+    """Every rated fight for one fighter, oldest first."""
+    return [
+        {
+            'date': date,
+            'opponent_id': opponent_id,
+            'opponent': state.names.get(opponent_id),
+            'result': result,
+            'rating_before': before,
+            'rating_after': after,
+        }
+        for fid, date, opponent_id, result, before, after in state.history
+        if fid == fighter_id
+    ]
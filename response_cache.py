@@ -0,0 +1,76 @@
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from serialization import dumps
+
+CACHE_TTL_SECONDS = 60 * 60
+MAX_ENTRIES = 256
+# Cached replies can carry images, so the cache is bounded by encoded size as well
+MAX_BYTES = 64 * 1024 * 1024
+
+
+def normalize_prompt(text):
+    """Canonical form of a prompt: Unicode-normalized, case-folded, whitespace collapsed."""
+    text = unicodedata.normalize('NFKC', text or '').casefold()
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+class ResponseCache:
+    """LRU cache with TTL and size bounds for chat replies to prompts sent without a conversation."""
+
+    def __init__(self, ttl=CACHE_TTL_SECONDS, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, size, body)
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(prompt, assistant_id, data_version):
+        """Cache key for a prompt; a new data version changes every key, so old replies stop matching."""
+        raw = '\x1f'.join([normalize_prompt(prompt), assistant_id or '', data_version or ''])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key, body):
+        size = len(dumps(body))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.time() + self.ttl, size, body)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
@@ -6,6 +6,7 @@ import requests
 from bs4 import BeautifulSoup
 from urllib.parse import urlparse
 from datetime import datetime
+from admission import BATCH, AdmissionControl
 
 print("\n\n" + "="*40)
 print(f"NEWS SCRAPE RUN: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
@@ -35,19 +36,21 @@ prompt = (
 #)
 #instructions="Only include news stories published in the last 10 days or about upcoming events. Exclude anything older."
 
-response = client.responses.create(
-    model="gpt-4.1",
-    #model="gpt-4.1-mini",
-    #model="gpt-4.1-nano",
-    #model="gpt-4o",
-    tools=[{ "type": "web_search_preview" }],
-    input=prompt,
-    #text={"format": {"type": "json_object"}},
-    #temperature=0.3,
-    #max_output_tokens=1200,
-    #top_p=1.0,
-    #instructions=instructions
-)
+# Counts against the server's limit on OpenAI runs in flight, behind interactive chats
+with AdmissionControl().blocking_slot(BATCH):
+    response = client.responses.create(
+        model="gpt-4.1",
+        #model="gpt-4.1-mini",
+        #model="gpt-4.1-nano",
+        #model="gpt-4o",
+        tools=[{ "type": "web_search_preview" }],
+        input=prompt,
+        #text={"format": {"type": "json_object"}},
+        #temperature=0.3,
+        #max_output_tokens=1200,
+        #top_p=1.0,
+        #instructions=instructions
+    )
 content = ""
 if hasattr(response, "output") and isinstance(response.output, list):
     for item in response.output:
@@ -0,0 +1,167 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from runtime_state import STATE_DIR
+from serialization import dumps
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = os.path.join(STATE_DIR, 'inflight_runs.sqlite3')
+# A claim this old belongs to a worker that died or timed out, and may be taken over
+CLAIM_TIMEOUT_SECONDS = 180
+# A finished result stays readable this long, for followers still between polls
+RESULT_SECONDS = 30
+POLL_INITIAL_SECONDS = 0.25
+POLL_MAX_SECONDS = 1.0
+POLL_BACKOFF = 1.5
+PURGE_INTERVAL_SECONDS = 60 * 60
+
+
+class RunCoalescer:
+    """Single-flight for identical chat runs: the first request for a key runs, the others get its result.
+
+    Inside a process, later requests await the leader's task. Across gunicorn workers, the leader
+    claims the key in a shared SQLite table and publishes its result there; requests in other
+    workers poll the table instead of starting their own run.
+    """
+
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._last_purge = 0
+        self._tasks = {}  # key -> task leading or following it in this process
+        self.led = 0
+        self.saved = 0
+
+    def _connection(self):
+        # One connection per process; connections must not be carried across a fork
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS inflight_runs (
+                    key TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    started_at REAL NOT NULL,
+                    finished_at REAL,
+                    result TEXT
+                )''')
+            conn.execute('CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._connection().execute(sql, params).fetchall()
+
+    async def _aexecute(self, sql, params=()):
+        # SQLite waits on other workers' locks; that must not block the event loop
+        return await asyncio.to_thread(self._execute, sql, params)
+
+    def _claim(self, key, owner):
+        """Claim ``key`` unless another run holds a live claim or recently finished; True if claimed."""
+        now = time.time()
+        self._execute('''
+            INSERT INTO inflight_runs (key, owner, started_at) VALUES (?, ?, ?)
+            ON CONFLICT (key) DO UPDATE SET
+                owner = excluded.owner, started_at = excluded.started_at, finished_at = NULL, result = NULL
+            WHERE (inflight_runs.finished_at IS NULL AND inflight_runs.started_at < ?)
+                OR inflight_runs.finished_at < ?''',
+            (key, owner, now, now - CLAIM_TIMEOUT_SECONDS, now - RESULT_SECONDS))
+        if now - self._last_purge > PURGE_INTERVAL_SECONDS:
+            self._last_purge = now
+            self._execute('DELETE FROM inflight_runs WHERE COALESCE(finished_at, started_at) < ?',
+                          (now - CLAIM_TIMEOUT_SECONDS,))
+        rows = self._execute('SELECT owner FROM inflight_runs WHERE key = ?', (key,))
+        return bool(rows) and rows[0]['owner'] == owner
+
+    async def _lead(self, key, owner, produce):
+        self.led += 1
+        try:
+            result = await produce()
+        except BaseException:
+            # Once handed to the thread, the delete runs even if this task is cancelled again
+            await self._aexecute('DELETE FROM inflight_runs WHERE key = ? AND owner = ?', (key, owner))
+            raise
+        if result is None:
+            # Nothing worth sharing (e.g. the run failed): let waiting requests run their own
+            await self._aexecute('DELETE FROM inflight_runs WHERE key = ? AND owner = ?', (key, owner))
+        else:
+            await self._aexecute('UPDATE inflight_runs SET result = ?, finished_at = ? WHERE key = ? AND owner = ?',
+                                 (dumps(result).decode('utf-8'), time.time(), key, owner))
+        return result
+
+    async def _follow(self, key):
+        """Wait for the run claimed in another worker; its result, or None if it gave up."""
+        delay = POLL_INITIAL_SECONDS
+        while True:
+            rows = await self._aexecute('SELECT started_at, result FROM inflight_runs WHERE key = ?', (key,))
+            if not rows or rows[0]['started_at'] < time.time() - CLAIM_TIMEOUT_SECONDS:
+                return None
+            if rows[0]['result'] is not None:
+                return json.loads(rows[0]['result'])
+            await asyncio.sleep(delay)
+            delay = min(delay * POLL_BACKOFF, POLL_MAX_SECONDS)
+
+    async def _lead_or_follow(self, key, produce):
+        owner = uuid.uuid4().hex
+        if await asyncio.to_thread(self._claim, key, owner):
+            return await self._lead(key, owner, produce), False
+        logger.info(f"Waiting for the identical run in another worker ({key[:12]})")
+        result = await self._follow(key)
+        if result is not None:
+            await self._count_saved()
+            return result, True
+        return await produce(), False
+
+    async def _count_saved(self):
+        self.saved += 1
+        await self._aexecute('''
+            INSERT INTO counters (name, value) VALUES ('saved_runs', 1)
+            ON CONFLICT (name) DO UPDATE SET value = value + 1''')
+
+    async def run(self, key, produce):
+        """``produce()``'s result for ``key``, shared with identical requests made while it runs.
+
+        Returns (result, shared); ``shared`` is True when the result came from another request's run.
+        ``produce`` is a coroutine function returning a JSON-serializable result, or None when there
+        is nothing to share, in which case each waiting request runs its own.
+        """
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._lead_or_follow(key, produce))
+            self._tasks[key] = task
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+            return await task
+        try:
+            # The leader's caller, not this one, decides whether the run is cancelled
+            result, _ = await asyncio.shield(task)
+        except Exception:
+            result = None
+        except asyncio.CancelledError:
+            if not task.cancelled():
+                raise
+            result = None
+        if result is None:
+            return await produce(), False
+        await self._count_saved()
+        return result, True
+
+    def stats(self):
+        rows = self._execute("SELECT value FROM counters WHERE name = 'saved_runs'")
+        return {
+            'in_flight': len(self._tasks),
+            'runs_led': self.led,
+            'runs_saved': self.saved,
+            'runs_saved_all_workers': rows[0]['value'] if rows else 0,
+        }
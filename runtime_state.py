@@ -0,0 +1,6 @@
+import os
+
+# Files the server writes while running (SQLite stores, checkpoints, caches, job records) live
+# here rather than in data/, which holds the deployed datasets, so copying the datasets to the
+# server never overwrites live state
+STATE_DIR = os.getenv('STATE_DIR', 'state')
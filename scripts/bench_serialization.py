@@ -0,0 +1,55 @@
+"""Benchmark the old to_json -> json.loads -> jsonify path against serialization.py.
+
+Run from the repo root:
+    python scripts/bench_serialization.py [iterations]
+"""
+import json
+import os
+import sys
+import timeit
+from datetime import datetime
+
+import pandas as pd
+from flask import Flask, jsonify
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from serialization import encode_object, json_response, orjson, records_json
+
+DATASETS = {
+    'fighters': 'data/fighter_info.csv',
+    'events': 'data/event_data_sherdog.csv',
+}
+
+
+def legacy_path(key, df):
+    data = json.loads(df.to_json(orient='records', date_format='iso'))
+    return jsonify({'timestamp': datetime.now().isoformat(), key: data}).get_data()
+
+
+def single_pass(key, df):
+    body = encode_object({'timestamp': datetime.now().isoformat()}, **{key: records_json(df)})
+    return json_response(body).get_data()
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    app = Flask(__name__)
+    print(f"Encoder: {'orjson' if orjson is not None else 'json (stdlib)'}, {iterations} iterations")
+
+    with app.app_context():
+        for key, path in DATASETS.items():
+            df = pd.read_csv(path).replace(["None", "NULL", "NaN"], None)
+
+            # Both paths must produce the same document
+            assert json.loads(legacy_path(key, df))[key] == json.loads(single_pass(key, df))[key]
+
+            legacy = timeit.timeit(lambda: legacy_path(key, df), number=iterations) / iterations
+            new = timeit.timeit(lambda: single_pass(key, df), number=iterations) / iterations
+            size = len(single_pass(key, df))
+            print(f"{key:<10} rows={len(df):<6} bytes={size:<9} "
+                  f"legacy={legacy * 1000:8.2f} ms  single-pass={new * 1000:8.2f} ms  "
+                  f"speedup={legacy / new:5.1f}x")
+
+
+if __name__ == '__main__':
+    main()
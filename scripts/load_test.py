@@ -0,0 +1,186 @@
+"""Drive /api/chat and /api/chat/history at a target concurrency and report throughput and latency.
+
+Meant to run against a server pointed at scripts/mock_openai.py, so the numbers reflect the app
+rather than OpenAI (and cost nothing). Run from the repo root:
+    python scripts/mock_openai.py --port 8081 &
+    OPENAI_BASE_URL=http://127.0.0.1:8081/v1 OPENAI_API_KEY=mock python app.py &
+    python scripts/load_test.py --url http://127.0.0.1:5001 --concurrency 20 --duration 60
+
+Each worker starts a conversation, follows it up or reads its history with the given
+probabilities, and starts over after --turns turns. Prompts are drawn from a small pool, so
+first turns exercise the response cache and run coalescing as real example-question traffic does.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter, defaultdict
+
+import numpy as np
+
+PROMPTS = [
+    "Who has the most knockouts in UFC history?",
+    "Compare Jon Jones and Stipe Miocic",
+    "What is Islam Makhachev's record?",
+    "Who are the top 5 lightweights right now?",
+    "Break down the main event of the next UFC card",
+    "Which fighters have the longest win streaks?",
+    "How does Alex Pereira win his fights?",
+    "What are the odds for the next main event?",
+]
+FOLLOW_UPS = [
+    "Tell me more about that",
+    "How about their grappling?",
+    "Who would win in a rematch?",
+    "Show me a chart of that",
+]
+PERCENTILES = (50, 95, 99)
+
+
+def call(url, body=None, timeout=180):
+    """(status, seconds, parsed body or None) of a JSON POST, or a GET without a body; network errors are status 0."""
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    request = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            status, payload = response.status, response.read()
+    except urllib.error.HTTPError as e:
+        status, payload = e.code, e.read()
+    except (urllib.error.URLError, OSError):
+        return 0, time.perf_counter() - start, None
+    seconds = time.perf_counter() - start
+    try:
+        return status, seconds, json.loads(payload)
+    except ValueError:
+        return status, seconds, None
+
+
+def get_json(url):
+    status, _, payload = call(url, timeout=10)
+    return payload if payload is not None else {'error': f'HTTP {status}'}
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)  # endpoint -> seconds of successful requests
+        self.statuses = defaultdict(Counter)
+        self.issued = 0
+
+    def _take(self, deadline):
+        """Claim the next request, or False when the run is over."""
+        with self.lock:
+            if self.args.requests and self.issued >= self.args.requests:
+                return False
+            if deadline and time.monotonic() > deadline:
+                return False
+            self.issued += 1
+            return True
+
+    def _request(self, endpoint, body):
+        status, seconds, payload = call(self.args.url + endpoint, body, self.args.timeout)
+        with self.lock:
+            self.statuses[endpoint][status] += 1
+            if status == 200:
+                self.latencies[endpoint].append(seconds)
+        return status, payload
+
+    def _chat(self, body):
+        if not self.args.use_async:
+            return self._request('/api/chat', body)
+        status, job = self._request('/api/chat', {**body, 'async': True})
+        if status != 202:
+            return status, job
+        # Long-poll the job; the latency that matters is from submit to reply
+        start = time.perf_counter()
+        status = 202
+        while status == 202:
+            status, _, payload = call(f"{self.args.url}/api/chat/jobs/{job['job_id']}?wait=20",
+                                      timeout=self.args.timeout)
+        with self.lock:
+            self.statuses['/api/chat (async job)'][status] += 1
+            if status == 200:
+                self.latencies['/api/chat (async job)'].append(time.perf_counter() - start)
+        return status, payload
+
+    def worker(self, seed, deadline):
+        rng = random.Random(seed)
+        conversation_id, turns = None, 0
+        while self._take(deadline):
+            if conversation_id and rng.random() < self.args.history_fraction:
+                self._request('/api/chat/history', {'conversation_id': conversation_id, 'limit': 20})
+                continue
+            if conversation_id and turns < self.args.turns and rng.random() < self.args.follow_up_fraction:
+                status, payload = self._chat({'message': rng.choice(FOLLOW_UPS), 'conversation_id': conversation_id})
+            else:
+                status, payload = self._chat({'message': rng.choice(PROMPTS)})
+                conversation_id, turns = None, 0
+            if status == 200 and payload and payload.get('conversation_id'):
+                conversation_id, turns = payload['conversation_id'], turns + 1
+            elif status == 429 and self.args.honor_retry_after:
+                time.sleep(min(float((payload or {}).get('retry_after', 1)), 10))
+
+    def run(self):
+        deadline = time.monotonic() + self.args.duration if self.args.duration else None
+        workers = [threading.Thread(target=self.worker, args=(self.args.seed + i, deadline), daemon=True)
+                   for i in range(self.args.concurrency)]
+        start = time.perf_counter()
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        return time.perf_counter() - start
+
+    def report(self, elapsed):
+        # Async jobs are reported on their own line but counted once, as the /api/chat request that submitted them
+        requests = [c for endpoint, c in self.statuses.items() if endpoint != '/api/chat (async job)']
+        total = sum(sum(c.values()) for c in requests)
+        ok = sum(c[200] + c[202] for c in requests)
+        print(f"{total} requests in {elapsed:.1f}s at concurrency {self.args.concurrency}: "
+              f"{total / elapsed:.2f} req/s, {ok / elapsed:.2f} successful req/s")
+        print(f"{'endpoint':<26} {'ok':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}  statuses")
+        for endpoint in sorted(self.statuses):
+            seconds = self.latencies.get(endpoint)
+            if seconds:
+                p50, p95, p99 = (np.percentile(seconds, PERCENTILES) * 1000).round(1)
+            else:
+                p50 = p95 = p99 = float('nan')
+            statuses = ', '.join(f"{code or 'error'}: {n}" for code, n in sorted(self.statuses[endpoint].items()))
+            print(f"{endpoint:<26} {len(seconds or []):>6} {p50:>9} {p95:>9} {p99:>9}  {statuses}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--url', default='http://127.0.0.1:5001')
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--requests', type=int, help='stop after this many requests')
+    parser.add_argument('--duration', type=float, help='stop after this many seconds (default 30 without --requests)')
+    parser.add_argument('--turns', type=int, default=4, help='turns per conversation before starting a new one')
+    parser.add_argument('--follow-up-fraction', type=float, default=0.5)
+    parser.add_argument('--history-fraction', type=float, default=0.2)
+    parser.add_argument('--async', dest='use_async', action='store_true', help='submit chats as async jobs and poll them')
+    parser.add_argument('--honor-retry-after', action='store_true', help='back off when shed with a 429')
+    parser.add_argument('--timeout', type=float, default=180)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    if not args.requests and not args.duration:
+        args.duration = 30
+
+    test = LoadTest(args)
+    test.report(test.run())
+
+    # The server's own view of the run
+    for name in ('admission', 'coalescing'):
+        print(f"\n/api/debug/{name}: {json.dumps(get_json(f'{args.url}/api/debug/{name}'))}")
+    traces = get_json(f'{args.url}/api/debug/traces?limit=0')
+    print("\nServer-side phase percentiles (ms):")
+    print(json.dumps(traces.get('percentiles', traces), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,381 @@
+"""A local stand-in for the OpenAI endpoints the app uses, for load testing without API spend.
+
+Serves the Assistants API (threads, messages, runs, streamed runs, tool outputs), file content
+and responses.create, with sampled latencies, failure rates and canned replies (some with a
+generated image). Point the server at it with OPENAI_BASE_URL:
+
+    python scripts/mock_openai.py --port 8081 [--config mock.json] [--seed 1]
+    OPENAI_BASE_URL=http://127.0.0.1:8081/v1 OPENAI_API_KEY=mock python app.py
+
+--config takes a JSON file overriding any of the keys in DEFAULT_CONFIG.
+"""
+import argparse
+import json
+import math
+import random
+import struct
+import threading
+import time
+import uuid
+import zlib
+
+from flask import Flask, Response, jsonify, request
+
+DEFAULT_CONFIG = {
+    'seed': 0,
+    # Latencies are log-normal: median in milliseconds and the sigma of the underlying normal
+    'api_latency_ms': {'median': 120, 'sigma': 0.4},
+    'run_queue_ms': {'median': 400, 'sigma': 0.5},
+    'run_duration_ms': {'median': 4000, 'sigma': 0.6},
+    'responses_latency_ms': {'median': 8000, 'sigma': 0.3},
+    'stream_chunk_ms': 40,
+    # Any API call answered with a 500 or a 429
+    'error_rate': 0.0,
+    'rate_limit_rate': 0.0,
+    # Runs that end as failed, stop once for a function call, or reply with an image
+    'run_failure_rate': 0.0,
+    'tool_call_rate': 0.0,
+    'image_rate': 0.1,
+    'usage': {'prompt_tokens': 1800, 'completion_tokens': 220},
+    'replies': [
+        "Jon Jones is 28-1 with one no contest. His last fight was a third-round TKO of Stipe Miocic at UFC 309.",
+        "Max Holloway has won 12 of his fights by knockout, 2 by submission and 12 by decision.",
+        "Islam Makhachev's grappling-heavy style has produced 8 submission wins in the UFC.",
+        "Alex Pereira's striking has carried him to 7 knockout wins in the octagon.",
+    ],
+    'tool_call': {'name': 'get_fighter', 'arguments': {'name': 'Jon Jones'}},
+}
+
+app = Flask(__name__)
+config = dict(DEFAULT_CONFIG)
+rng = random.Random(0)
+lock = threading.Lock()
+threads = {}   # thread id -> list of messages, oldest first
+runs = {}      # run id -> run state
+files = set()
+
+
+def new_id(prefix):
+    return f'{prefix}_{uuid.uuid4().hex[:24]}'
+
+
+def chance(rate):
+    with lock:
+        return rng.random() < rate
+
+
+def sample_seconds(key):
+    spec = config[key]
+    with lock:
+        return rng.lognormvariate(math.log(spec['median']), spec['sigma']) / 1000
+
+
+def pick(items):
+    with lock:
+        return rng.choice(items)
+
+
+def png(width=64, height=64):
+    """A valid solid-color PNG."""
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    with lock:
+        color = bytes(rng.randrange(256) for _ in range(3))
+    rows = b''.join(b'\x00' + color * width for _ in range(height))
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(rows)) + chunk(b'IEND', b''))
+
+
+def api_error(status, message, kind):
+    return jsonify({'error': {'message': message, 'type': kind, 'param': None, 'code': None}}), status
+
+
+@app.before_request
+def simulate_api():
+    time.sleep(sample_seconds('api_latency_ms'))
+    if chance(config['rate_limit_rate']):
+        response, status = api_error(429, 'Rate limit reached (mock)', 'requests')
+        response.headers['Retry-After'] = '1'
+        return response, status
+    if chance(config['error_rate']):
+        return api_error(500, 'The server had an error (mock)', 'server_error')
+
+
+def text_block(value):
+    return {'type': 'text', 'text': {'value': value, 'annotations': []}}
+
+
+def message_object(thread_id, role, content, run_id=None, status='completed'):
+    return {
+        'id': new_id('msg'),
+        'object': 'thread.message',
+        'created_at': int(time.time()),
+        'thread_id': thread_id,
+        'role': role,
+        'content': content,
+        'status': status,
+        'assistant_id': None,
+        'run_id': run_id,
+        'attachments': [],
+        'metadata': {},
+    }
+
+
+def user_content(content):
+    return [text_block(content)] if isinstance(content, str) else content
+
+
+@app.route('/v1/threads', methods=['POST'])
+def create_thread():
+    thread_id = new_id('thread')
+    messages = [message_object(thread_id, m['role'], user_content(m['content']))
+                for m in (request.get_json(silent=True) or {}).get('messages', [])]
+    with lock:
+        threads[thread_id] = messages
+    return jsonify({'id': thread_id, 'object': 'thread', 'created_at': int(time.time()),
+                    'metadata': {}, 'tool_resources': None})
+
+
+@app.route('/v1/threads/<thread_id>', methods=['DELETE'])
+def delete_thread(thread_id):
+    with lock:
+        if threads.pop(thread_id, None) is None:
+            return api_error(404, f'No thread found with id {thread_id}', 'invalid_request_error')
+        for run_id in [r['id'] for r in runs.values() if r['thread_id'] == thread_id]:
+            del runs[run_id]
+    return jsonify({'id': thread_id, 'object': 'thread.deleted', 'deleted': True})
+
+
+@app.route('/v1/threads/<thread_id>/messages', methods=['POST'])
+def create_message(thread_id):
+    if thread_id not in threads:
+        return api_error(404, f'No thread found with id {thread_id}', 'invalid_request_error')
+    body = request.get_json()
+    message = message_object(thread_id, body['role'], user_content(body['content']))
+    with lock:
+        threads[thread_id].append(message)
+    return jsonify(message)
+
+
+@app.route('/v1/threads/<thread_id>/messages', methods=['GET'])
+def list_messages(thread_id):
+    if thread_id not in threads:
+        return api_error(404, f'No thread found with id {thread_id}', 'invalid_request_error')
+    with lock:
+        messages = list(threads[thread_id])
+    if request.args.get('order', 'desc') == 'desc':
+        messages.reverse()
+    after = request.args.get('after')
+    if after:
+        ids = [m['id'] for m in messages]
+        messages = messages[ids.index(after) + 1:] if after in ids else []
+    limit = request.args.get('limit', default=20, type=int)
+    page = messages[:limit]
+    return jsonify({'object': 'list', 'data': page, 'first_id': page[0]['id'] if page else None,
+                    'last_id': page[-1]['id'] if page else None, 'has_more': len(messages) > limit})
+
+
+def new_run(thread_id, body):
+    has_functions = any(tool.get('type') == 'function' for tool in body.get('tools') or [])
+    run = {
+        'id': new_id('run'),
+        'thread_id': thread_id,
+        'assistant_id': body.get('assistant_id'),
+        'created_at': time.time(),
+        'phase_started': time.time(),
+        'queue': sample_seconds('run_queue_ms'),
+        'duration': sample_seconds('run_duration_ms'),
+        'fails': chance(config['run_failure_rate']),
+        'tool_pending': has_functions and chance(config['tool_call_rate']),
+        'tool_call_id': None,
+        'image': chance(config['image_rate']),
+        'reply': pick(config['replies']),
+        'finished_at': None,
+    }
+    with lock:
+        runs[run['id']] = run
+    return run
+
+
+def finish(run):
+    """Settle a run whose time is up: write its reply to the thread (once)."""
+    with lock:
+        if run['finished_at'] is not None:
+            return
+        run['finished_at'] = time.time()
+    if run['fails']:
+        return
+    content = [text_block(run['reply'])]
+    if run['image']:
+        file_id = f'file-mock{uuid.uuid4().hex[:20]}'
+        files.add(file_id)
+        content.append({'type': 'image_file', 'image_file': {'file_id': file_id, 'detail': None}})
+    message = message_object(run['thread_id'], 'assistant', content, run_id=run['id'])
+    with lock:
+        threads[run['thread_id']].append(message)
+
+
+def status_of(run):
+    elapsed = time.time() - run['phase_started']
+    if run['finished_at'] is None:
+        if elapsed < run['queue']:
+            return 'queued'
+        if elapsed < run['queue'] + run['duration']:
+            return 'in_progress'
+        if run['tool_pending']:
+            return 'requires_action'
+        finish(run)
+    return 'failed' if run['fails'] else 'completed'
+
+
+def run_object(run, status=None):
+    status = status or status_of(run)
+    ended = int(run['finished_at']) if run['finished_at'] else None
+    obj = {
+        'id': run['id'],
+        'object': 'thread.run',
+        'created_at': int(run['created_at']),
+        'thread_id': run['thread_id'],
+        'assistant_id': run['assistant_id'],
+        'status': status,
+        'started_at': int(run['phase_started'] + run['queue']) if status != 'queued' else None,
+        'completed_at': ended if status == 'completed' else None,
+        'failed_at': ended if status == 'failed' else None,
+        'cancelled_at': None,
+        'expires_at': None,
+        'last_error': {'code': 'server_error', 'message': 'Run failed (mock)'} if status == 'failed' else None,
+        'required_action': None,
+        'model': 'mock',
+        'instructions': '',
+        'tools': [],
+        'metadata': {},
+        'usage': None,
+        'incomplete_details': None,
+        'parallel_tool_calls': True,
+        'truncation_strategy': {'type': 'auto', 'last_messages': None},
+    }
+    if status == 'requires_action':
+        run['tool_call_id'] = run['tool_call_id'] or new_id('call')
+        obj['required_action'] = {'type': 'submit_tool_outputs', 'submit_tool_outputs': {'tool_calls': [{
+            'id': run['tool_call_id'],
+            'type': 'function',
+            'function': {'name': config['tool_call']['name'],
+                         'arguments': json.dumps(config['tool_call']['arguments'])},
+        }]}}
+    if status in ('completed', 'failed'):
+        usage = config['usage']
+        obj['usage'] = {**usage, 'total_tokens': usage['prompt_tokens'] + usage['completion_tokens']}
+    return obj
+
+
+def sse(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+def stream_run(run):
+    """The SSE events of a streamed run, up to completion or the next function call."""
+    yield sse('thread.run.created', run_object(run, 'queued'))
+    yield sse('thread.run.queued', run_object(run, 'queued'))
+    time.sleep(run['queue'])
+    yield sse('thread.run.in_progress', run_object(run, 'in_progress'))
+    if run['tool_pending']:
+        time.sleep(run['duration'])
+        yield sse('thread.run.requires_action', run_object(run, 'requires_action'))
+    elif run['fails']:
+        time.sleep(run['duration'])
+        finish(run)
+        yield sse('thread.run.failed', run_object(run, 'failed'))
+    else:
+        message = message_object(run['thread_id'], 'assistant', [], run_id=run['id'], status='in_progress')
+        yield sse('thread.message.created', message)
+        words = run['reply'].split(' ')
+        for i, word in enumerate(words):
+            time.sleep(min(config['stream_chunk_ms'] / 1000, run['duration'] / len(words)))
+            value = word if i == 0 else ' ' + word
+            yield sse('thread.message.delta', {'id': message['id'], 'object': 'thread.message.delta', 'delta': {
+                'content': [{'index': 0, 'type': 'text', 'text': {'value': value, 'annotations': []}}]}})
+        finish(run)
+        with lock:
+            completed = threads[run['thread_id']][-1]
+        yield sse('thread.message.completed', {**completed, 'id': message['id']})
+        yield sse('thread.run.completed', run_object(run, 'completed'))
+    yield 'event: done\ndata: [DONE]\n\n'
+
+
+@app.route('/v1/threads/<thread_id>/runs', methods=['POST'])
+def create_run(thread_id):
+    if thread_id not in threads:
+        return api_error(404, f'No thread found with id {thread_id}', 'invalid_request_error')
+    body = request.get_json()
+    run = new_run(thread_id, body)
+    if body.get('stream'):
+        return Response(stream_run(run), mimetype='text/event-stream')
+    return jsonify(run_object(run))
+
+
+@app.route('/v1/threads/<thread_id>/runs/<run_id>', methods=['GET'])
+def retrieve_run(thread_id, run_id):
+    run = runs.get(run_id)
+    if run is None:
+        return api_error(404, f'No run found with id {run_id}', 'invalid_request_error')
+    return jsonify(run_object(run))
+
+
+@app.route('/v1/threads/<thread_id>/runs/<run_id>/submit_tool_outputs', methods=['POST'])
+def submit_tool_outputs(thread_id, run_id):
+    run = runs.get(run_id)
+    if run is None or status_of(run) != 'requires_action':
+        return api_error(400, f'Run {run_id} is not waiting on tool outputs', 'invalid_request_error')
+    # The second leg of the run: queued again, then runs to completion
+    run.update(tool_pending=False, phase_started=time.time(),
+               queue=sample_seconds('run_queue_ms'), duration=sample_seconds('run_duration_ms'))
+    if (request.get_json() or {}).get('stream'):
+        return Response(stream_run(run), mimetype='text/event-stream')
+    return jsonify(run_object(run))
+
+
+@app.route('/v1/files/<file_id>/content', methods=['GET'])
+def file_content(file_id):
+    if file_id not in files:
+        return api_error(404, f'No such File object: {file_id}', 'invalid_request_error')
+    return Response(png(), mimetype='image/png')
+
+
+@app.route('/v1/responses', methods=['POST'])
+def create_response():
+    time.sleep(sample_seconds('responses_latency_ms'))
+    today = time.strftime('%Y-%m-%d')
+    news = [{'title': f'Mock headline {i + 1}', 'date': today, 'summary': pick(config['replies']),
+             'source': 'Sherdog', 'url': f'https://www.sherdog.com/news/mock-{i + 1}', 'image_url': ''}
+            for i in range(10)]
+    return jsonify({
+        'id': new_id('resp'),
+        'object': 'response',
+        'created_at': int(time.time()),
+        'status': 'completed',
+        'model': (request.get_json() or {}).get('model', 'mock'),
+        'output': [{'type': 'message', 'id': new_id('msg'), 'role': 'assistant', 'status': 'completed',
+                    'content': [{'type': 'output_text', 'text': json.dumps(news), 'annotations': []}]}],
+        'usage': {'input_tokens': 300, 'output_tokens': 900, 'total_tokens': 1200},
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--config', help='JSON file with overrides for DEFAULT_CONFIG')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    if args.config:
+        with open(args.config) as f:
+            config.update(json.load(f))
+    if args.seed is not None:
+        config['seed'] = args.seed
+    rng.seed(config['seed'])
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+import math
+import re
+import unicodedata
+
+from datasets import register_derived
+
+# Indexed events columns and how much a match in each one counts towards the score
+FIELD_WEIGHTS = {
+    'Fighter 1': 3.0,
+    'Fighter 2': 3.0,
+    'Event Name': 2.0,
+    'Referee': 2.0,
+    'Event Location': 1.5,
+    'Winning Method': 1.0,
+}
+# Position gap between fields so a phrase can't match across two of them
+FIELD_GAP = 100
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+PHRASE_RE = re.compile(r'"([^"]+)"')
+
+
+def tokenize(text):
+    """Lower-case, accent-free alphanumeric tokens."""
+    if not isinstance(text, str):
+        return []
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
+    # Keep names like O'Malley as a single token
+    return TOKEN_RE.findall(text.lower().replace("'", ''))
+
+
+def parse_query(query):
+    """Split a query into quoted phrases and loose terms."""
+    phrases = [tokenize(p) for p in PHRASE_RE.findall(query)]
+    terms = tokenize(PHRASE_RE.sub(' ', query))
+    return terms, [p for p in phrases if p]
+
+
+class EventSearchIndex:
+    """Positional inverted index over the fights in the events data, ranked with BM25."""
+
+    def __init__(self, events):
+        self.rows = events.index
+        self.postings = {}  # token -> {doc: [positions]}
+        self.weights = {}   # token -> {doc: field-weighted term frequency}
+        self.doc_lengths = []
+
+        columns = [events[field].tolist() for field in FIELD_WEIGHTS]
+        field_weights = list(FIELD_WEIGHTS.values())
+        for doc, values in enumerate(zip(*columns)):
+            position = 0
+            length = 0
+            for value, weight in zip(values, field_weights):
+                tokens = tokenize(value)
+                for offset, token in enumerate(tokens):
+                    self.postings.setdefault(token, {}).setdefault(doc, []).append(position + offset)
+                    doc_weights = self.weights.setdefault(token, {})
+                    doc_weights[doc] = doc_weights.get(doc, 0.0) + weight
+                position += len(tokens) + FIELD_GAP
+                length += len(tokens)
+            self.doc_lengths.append(length)
+        self.average_length = sum(self.doc_lengths) / max(len(self.doc_lengths), 1)
+
+    def _idf(self, token):
+        n = len(self.doc_lengths)
+        df = len(self.postings.get(token, ()))
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def _has_phrase(self, doc, tokens):
+        starts = set(self.postings[tokens[0]][doc])
+        for offset, token in enumerate(tokens[1:], start=1):
+            starts &= {p - offset for p in self.postings[token][doc]}
+            if not starts:
+                return False
+        return True
+
+    def search(self, query, candidates=None, limit=20, offset=0):
+        """Return (total matches, [(events row, score), ...]) for fights matching every term.
+
+        ``candidates`` optionally restricts matches to a set of events rows.
+        """
+        terms, phrases = parse_query(query)
+        tokens = list(dict.fromkeys(terms + [t for phrase in phrases for t in phrase]))
+        if not tokens or any(t not in self.postings for t in tokens):
+            return 0, []
+
+        # Intersect posting lists starting from the rarest token
+        tokens.sort(key=lambda t: len(self.postings[t]))
+        docs = set(self.postings[tokens[0]])
+        for token in tokens[1:]:
+            docs.intersection_update(self.postings[token])
+        if candidates is not None:
+            docs = {doc for doc in docs if self.rows[doc] in candidates}
+        for phrase in phrases:
+            docs = {doc for doc in docs if self._has_phrase(doc, phrase)}
+
+        idf = {token: self._idf(token) for token in tokens}
+        scored = []
+        for doc in docs:
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[doc] / self.average_length)
+            score = 0.0
+            for token in tokens:
+                tf = self.weights[token][doc]
+                score += idf[token] * tf * (BM25_K1 + 1) / (tf + norm)
+            scored.append((score, doc))
+        # Best score first, then the most recent fight (lowest row) to break ties
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        page = scored[offset:offset + limit]
+        return len(scored), [(self.rows[doc], round(score, 4)) for score, doc in page]
+
+
+def build_event_search_index(snapshot):
+    return EventSearchIndex(snapshot.frame('events'))
+
+
+def event_search_index(snapshot):
+    return snapshot.derived('event_search_index', build_event_search_index)
+
+
+register_derived('event_search_index', build_event_search_index)
@@ -0,0 +1,68 @@
+import json
+import math
+from datetime import date, datetime
+
+from flask import Response
+
+# orjson is optional; it is much faster than the stdlib encoder when installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(obj):
+    """Handle numpy/pandas values the encoders don't know about."""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if hasattr(obj, 'tolist'):  # numpy scalars and arrays (.item fails on arrays of more than one)
+        return obj.tolist()
+    if hasattr(obj, 'item'):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _finite(obj):
+    """Replace NaN and infinities with None, as orjson does; the stdlib would write bare NaN."""
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {key: _finite(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_finite(value) for value in obj]
+    return obj
+
+
+def dumps(obj):
+    """Encode a Python object straight to JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(
+            obj,
+            default=_default,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+        )
+    return json.dumps(_finite(obj), default=lambda value: _finite(_default(value)), allow_nan=False,
+                      separators=(',', ':')).encode('utf-8')
+
+
+def records_json(df):
+    """Encode a DataFrame as a JSON array of row objects in a single pass."""
+    return df.to_json(orient='records', date_format='iso').encode('utf-8')
+
+
+def encode_object(fields=None, **fragments):
+    """Build a JSON object from plain ``fields`` plus already-encoded JSON ``fragments``.
+
+    Fragments (e.g. the output of ``records_json``) are spliced in as-is, so large
+    payloads are never parsed back or encoded a second time.
+    """
+    parts = [dumps(key) + b':' + dumps(value) for key, value in (fields or {}).items()]
+    parts += [dumps(key) + b':' + fragment for key, fragment in fragments.items()]
+    return b'{' + b','.join(parts) + b'}'
+
+
+def json_response(body, status=200, headers=None):
+    """Return a Flask response for a Python object or pre-encoded JSON bytes."""
+    if not isinstance(body, (bytes, bytearray)):
+        body = dumps(body)
+    return Response(body, status=status, headers=headers, mimetype='application/json')
@@ -0,0 +1,164 @@
+import time
+
+import numpy as np
+
+from aggregates import ROUND_SECONDS, fight_log, fight_outcomes, time_to_seconds
+from ratings import ratings
+
+METHODS = ['KO/TKO', 'Submission', 'Decision']
+MAX_ITERATIONS = 1_000_000
+# How many "league average" fights are mixed into each fighter's own record
+PRIOR_FIGHTS = 5.0
+
+
+def _smoothed(counts, prior, weight=PRIOR_FIGHTS):
+    """Counts blended with a prior distribution, normalized to probabilities."""
+    counts = np.asarray(counts, dtype=float)
+    blended = counts + weight * np.asarray(prior, dtype=float)
+    return blended / blended.sum()
+
+
+def build_league_priors(snapshot, max_rounds):
+    """League-wide method mix, finish-round mix and finish times (seconds into the round)."""
+    fights = fight_outcomes(snapshot)
+    decided = fights[fights['method_category'].isin(METHODS)]
+    methods = decided['method_category'].value_counts().reindex(METHODS, fill_value=0).to_numpy()
+    finishes = decided[decided['finish']]
+    rounds = finishes['round'].clip(1, max_rounds).value_counts().reindex(
+        range(1, max_rounds + 1), fill_value=0).to_numpy()
+    seconds = (finishes['elapsed_seconds'] - (finishes['round'] - 1) * ROUND_SECONDS).to_numpy()
+    return methods / methods.sum(), rounds / rounds.sum(), seconds
+
+
+def league_priors(snapshot, max_rounds):
+    return snapshot.derived(f'simulation_priors_{max_rounds}', lambda snap: build_league_priors(snap, max_rounds))
+
+
+def fighter_profile(log, fighter_id, max_rounds):
+    """Win/loss counts, method splits and finish rounds/times for one fighter."""
+    fights = log[log['fighter_id'] == fighter_id]
+    won = fights[fights['result'] == 'W']
+    lost = fights[fights['result'] == 'L']
+
+    def by_method(rows):
+        return rows['method_category'].value_counts().reindex(METHODS, fill_value=0).to_numpy()
+
+    def finish_rounds(rows):
+        finished = rows[rows['method_category'].isin(METHODS[:2])]
+        return finished['round'].clip(1, max_rounds).value_counts().reindex(
+            range(1, max_rounds + 1), fill_value=0).to_numpy()
+
+    finished = fights[fights['method_category'].isin(METHODS[:2])]
+    return {
+        'name': fights['fighter'].iloc[0] if len(fights) else None,
+        'fights': len(fights),
+        'wins': len(won),
+        'losses': len(lost),
+        'win_methods': by_method(won),
+        'loss_methods': by_method(lost),
+        'win_rounds': finish_rounds(won),
+        'loss_rounds': finish_rounds(lost),
+        'finish_seconds': time_to_seconds(finished['time']).to_numpy(),
+    }
+
+
+def win_probability(profile1, profile2, rating1=None, rating2=None):
+    """Fighter 1's chance of winning: log5 on smoothed win rates, blended with Elo when available."""
+    a = (profile1['wins'] + 1) / (profile1['wins'] + profile1['losses'] + 2)
+    b = (profile2['wins'] + 1) / (profile2['wins'] + profile2['losses'] + 2)
+    log5 = (a - a * b) / (a + b - 2 * a * b)
+    if rating1 is None or rating2 is None:
+        return log5
+    elo = 1.0 / (1.0 + 10 ** ((rating2 - rating1) / 400.0))
+    return (log5 + elo) / 2
+
+
+def _sample(rng, cdfs, rows):
+    """Draw one category per row from per-row cumulative distributions."""
+    u = rng.random(len(rows))
+    return np.minimum((u[:, None] > cdfs[rows]).sum(axis=1), cdfs.shape[1] - 1)
+
+
+def simulate_fight(snapshot, fighter1_id, fighter2_id, iterations=10000, seed=None, rounds=3):
+    """Monte Carlo simulation of a fight, with every iteration run as array operations."""
+    start = time.perf_counter()
+    iterations = int(min(max(iterations, 1), MAX_ITERATIONS))
+    if seed is None:
+        seed = int(np.random.SeedSequence().entropy % (2 ** 32))
+    rng = np.random.default_rng(seed)
+
+    log = fight_log(snapshot)
+    method_prior, round_prior, league_seconds = league_priors(snapshot, rounds)
+    profiles = [fighter_profile(log, fid, rounds) for fid in (fighter1_id, fighter2_id)]
+    state = ratings(snapshot)
+    p1 = win_probability(profiles[0], profiles[1],
+                         state.ratings.get(fighter1_id), state.ratings.get(fighter2_id))
+
+    # Row 0: fighter 1 wins, row 1: fighter 2 wins. The winner's way of winning and the
+    # loser's way of losing count equally.
+    method_cdfs = np.array([
+        np.cumsum((_smoothed(winner['win_methods'], method_prior)
+                   + _smoothed(loser['loss_methods'], method_prior)) / 2)
+        for winner, loser in (profiles, profiles[::-1])
+    ])
+    round_cdfs = np.array([
+        np.cumsum((_smoothed(winner['win_rounds'], round_prior)
+                   + _smoothed(loser['loss_rounds'], round_prior)) / 2)
+        for winner, loser in (profiles, profiles[::-1])
+    ])
+    seconds_pool = np.concatenate([profiles[0]['finish_seconds'], profiles[1]['finish_seconds'],
+                                   league_seconds]).astype(float)
+    seconds_pool = seconds_pool[(seconds_pool > 0) & (seconds_pool <= ROUND_SECONDS)]
+
+    winner = (rng.random(iterations) >= p1).astype(int)  # 0 = fighter 1, 1 = fighter 2
+    method = _sample(rng, method_cdfs, winner)
+    finish = method < 2
+    finish_round = _sample(rng, round_cdfs, winner) + 1
+    round_ended = np.where(finish, finish_round, rounds)
+    seconds = np.where(finish, rng.choice(seconds_pool, size=iterations), ROUND_SECONDS)
+    elapsed = (round_ended - 1) * ROUND_SECONDS + seconds
+
+    # Joint outcome counts: winner x method x round
+    codes = (winner * len(METHODS) + method) * rounds + (round_ended - 1)
+    joint = np.bincount(codes, minlength=2 * len(METHODS) * rounds).reshape(2, len(METHODS), rounds)
+
+    fighters = []
+    for side, (fighter_id, profile) in enumerate(zip((fighter1_id, fighter2_id), profiles)):
+        wins = joint[side].sum()
+        fighters.append({
+            'id': fighter_id,
+            'name': profile['name'],
+            'win_probability': round(wins / iterations, 4),
+            'methods': {m: round(joint[side, i].sum() / iterations, 4) for i, m in enumerate(METHODS)},
+            'finish_rounds': {str(r + 1): round(joint[side, :2, r].sum() / iterations, 4)
+                              for r in range(rounds)},
+        })
+
+    finished_elapsed = elapsed[finish]
+    top = np.argsort(joint, axis=None)[::-1][:5]
+    return {
+        'iterations': iterations,
+        'seed': seed,
+        'scheduled_rounds': rounds,
+        'model_win_probability': round(float(p1), 4),
+        'fighter1': fighters[0],
+        'fighter2': fighters[1],
+        'rounds': {
+            **{str(r + 1): round(joint[:, :2, r].sum() / iterations, 4) for r in range(rounds)},
+            'Decision': round(joint[:, 2].sum() / iterations, 4),
+        },
+        'finish_time_seconds': {
+            f'p{q}': round(float(np.percentile(finished_elapsed, q)), 1) for q in (25, 50, 75)
+        } if len(finished_elapsed) else {},
+        'most_likely_outcomes': [
+            {
+                'winner': fighters[w]['name'],
+                'method': METHODS[m],
+                'round': int(r + 1) if m < 2 else None,
+                'probability': round(joint[w, m, r] / iterations, 4),
+            }
+            for w, m, r in zip(*np.unravel_index(top, joint.shape))
+            if joint[w, m, r]
+        ],
+        'elapsed_ms': round((time.perf_counter() - start) * 1000, 1),
+    }
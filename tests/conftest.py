@@ -0,0 +1,127 @@
+"""Fixtures for smoke tests that drive the app against scripts/mock_openai.py.
+
+The mock runs as a subprocess with short latencies and no injected failures, and the app is
+imported from a scratch directory whose data/ links to the repo's datasets, so the SQLite files,
+job records and caches it writes to state/ at runtime stay out of the working tree.
+"""
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MOCK_CONFIG = {
+    'api_latency_ms': {'median': 5, 'sigma': 0.1},
+    'run_queue_ms': {'median': 50, 'sigma': 0.1},
+    'run_duration_ms': {'median': 800, 'sigma': 0.1},
+    'stream_chunk_ms': 5,
+    'image_rate': 0.0,
+    'tool_call_rate': 0.0,
+    # Headings and bold text, so streamed replies exercise the markdown cleaner
+    'replies': ["# Jon Jones\n\n**Record:** 28-1\n## \n\nLast fight: TKO of Stipe Miocic at UFC 309."],
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture(scope='session')
+def mock_api(tmp_path_factory):
+    """Base URL of a mock OpenAI API running for the whole session."""
+    config_path = tmp_path_factory.mktemp('mock') / 'config.json'
+    config_path.write_text(json.dumps(MOCK_CONFIG))
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'scripts', 'mock_openai.py'), '--port', str(port),
+         '--config', str(config_path)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f'http://127.0.0.1:{port}/v1'
+    deadline = time.monotonic() + 15
+    while True:
+        try:
+            urllib.request.urlopen(f'{base_url}/files/none/content', timeout=1)
+        except urllib.error.HTTPError:
+            break  # Up: unknown files are a 404
+        except OSError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                pytest.fail('mock OpenAI server did not start')
+            time.sleep(0.1)
+    yield base_url
+    process.terminate()
+    process.wait(timeout=10)
+
+
+@pytest.fixture(scope='session')
+def app_module(mock_api, tmp_path_factory):
+    """The app module, imported with its OpenAI client pointed at the mock."""
+    workdir = tmp_path_factory.mktemp('app')
+    os.mkdir(workdir / 'data')
+    for name in os.listdir(os.path.join(ROOT, 'data')):
+        os.symlink(os.path.join(ROOT, 'data', name), workdir / 'data' / name)
+    os.environ.update(OPENAI_BASE_URL=mock_api, OPENAI_API_KEY='mock')
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    import app
+    yield app
+    os.chdir(cwd)
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+@pytest.fixture(scope='session')
+def raw_events():
+    """The repo's event_data_sherdog.csv as read from disk, newest event first."""
+    import pandas as pd
+    return pd.read_csv(os.path.join(ROOT, 'data', 'event_data_sherdog.csv'))
+
+
+@pytest.fixture
+def make_snapshot(tmp_path, monkeypatch):
+    """Build a datasets.Snapshot of an events frame, optionally following a previous snapshot.
+
+    Runs in a scratch directory, so checkpoints written by derived builders stay out of state/.
+    """
+    from datasets import DATASETS, Dataset, Snapshot
+    monkeypatch.chdir(tmp_path)
+    count = iter(range(1000))
+
+    def make(events, previous=None):
+        file_name, read_kwargs, clean = DATASETS['events']
+        path = tmp_path / f'{next(count)}_{file_name}'
+        events.to_csv(path, index=False)
+        return Snapshot({'events': Dataset('events', str(path), read_kwargs, clean)}, previous)
+
+    return make
+
+
+NEW_EVENTS = 3
+
+
+def without_latest_events(events, count=NEW_EVENTS):
+    """The events frame as it was before its ``count`` most recent cards were added."""
+    dates = events['Event Date'].drop_duplicates()
+    return events[events['Event Date'] < dates.iloc[count - 1]]
+
+
+def corrected_decision(events, column, value):
+    """A copy of events with one old decision win by Fighter 1 changed."""
+    events = events.copy()
+    old = (events.index > len(events) // 2) & (events['Winning Fighter'] == events['Fighter 1'])
+    row = events.index[old & events['Winning Method'].str.startswith('Decision', na=False)][0]
+    events.loc[row, column] = events.loc[row, value] if value in events else value
+    return events
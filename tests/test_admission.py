@@ -0,0 +1,28 @@
+"""Admission leases shared between processes through SQLite."""
+import time
+
+import admission
+from admission import INTERACTIVE, AdmissionControl
+
+
+def test_held_leases_outlive_the_timeout_and_abandoned_ones_do_not(tmp_path, monkeypatch):
+    monkeypatch.setattr(admission, 'LEASE_TIMEOUT_SECONDS', 0.5)
+    monkeypatch.setattr(admission, 'LEASE_REFRESH_SECONDS', 0.1)
+    path = str(tmp_path / 'admission.sqlite3')
+    # Two processes' views of one limit
+    holder, other = (AdmissionControl(path=path, max_in_flight=1, batch_reserve=0) for _ in range(2))
+
+    lease = holder._try_lease(INTERACTIVE)
+    time.sleep(1.5)
+    # A long run keeps its slot
+    assert other._try_lease(INTERACTIVE) is None
+
+    # A lease nobody refreshes any more (its process died) is reaped
+    holder._held.clear()
+    time.sleep(0.7)
+    taken = other._try_lease(INTERACTIVE)
+    assert taken is not None
+
+    holder.release(lease)
+    other.release(taken)
+    assert other.stats()['in_flight'] == 0
@@ -0,0 +1,38 @@
+"""Career stats recomputed only for changed fighters must match a full recomputation."""
+import re
+
+import pandas as pd
+
+from aggregates import career_stats, compute_career_stats, fight_log
+from conftest import corrected_decision, without_latest_events
+
+
+def assert_same_stats(stats, snapshot):
+    expected = compute_career_stats(fight_log(snapshot))
+    pd.testing.assert_frame_equal(stats.drop(columns=['fingerprint']).sort_index(), expected.sort_index())
+
+
+def rebuilt_count(text):
+    rebuilt, total = map(int, re.search(r"Career stats rebuilt for (\d+) of (\d+) fighters", text).groups())
+    return rebuilt, total
+
+
+def test_new_fights_update_only_their_fighters(raw_events, make_snapshot, caplog):
+    old = make_snapshot(without_latest_events(raw_events))
+    career_stats(old)
+    current = make_snapshot(raw_events, previous=old)
+
+    with caplog.at_level('INFO', logger='aggregates'):
+        stats = career_stats(current)
+
+    rebuilt, total = rebuilt_count(caplog.text)
+    assert 0 < rebuilt < total
+    assert_same_stats(stats, current)
+
+
+def test_corrected_past_result_updates_both_fighters(raw_events, make_snapshot):
+    old = make_snapshot(raw_events)
+    career_stats(old)
+    current = make_snapshot(corrected_decision(raw_events, 'Winning Fighter', 'Fighter 2'), previous=old)
+
+    assert_same_stats(career_stats(current), current)
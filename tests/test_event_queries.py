@@ -0,0 +1,59 @@
+"""The events API filters, and how they reject values they can't use."""
+import pandas as pd
+import pytest
+
+
+@pytest.mark.parametrize('query, message', [
+    ('date_from=garbage', 'date_from must be an ISO date or datetime, e.g. 2025-06-07'),
+    ('date_to=2025-13-40', 'date_to must be an ISO date or datetime, e.g. 2025-06-07'),
+    ('round=x', 'round must be an integer >= 1'),
+    ('round=-1', 'round must be an integer >= 1'),
+    ('last=abc', 'last must be an integer >= 1'),
+    ('last=0', 'last must be an integer >= 1'),
+])
+@pytest.mark.parametrize('path', ['/api/data/events', '/api/search/events?q=decision'])
+def test_bad_filters_are_rejected(client, path, query, message):
+    response = client.get(f"{path}{'&' if '?' in path else '?'}{query}")
+
+    assert response.status_code == 400
+    assert response.get_json() == {'error': message}
+
+
+@pytest.mark.parametrize('path, message', [
+    ('/api/data/events/recent?before=soon', 'before must be an ISO date or datetime, e.g. 2025-06-07'),
+    ('/api/data/events/next?after=later', 'after must be an ISO date or datetime, e.g. 2025-06-07'),
+])
+def test_bad_card_dates_are_rejected(client, path, message):
+    response = client.get(path)
+
+    assert response.status_code == 400
+    assert response.get_json() == {'error': message}
+
+
+def test_filters_select_matching_fights(client):
+    events = client.get('/api/data/events?round=2&last=3&method=submission').get_json()['events']
+
+    assert events
+    assert {event['Winning Round'] for event in events} == {2}
+    assert all('submission' in event['Winning Method'].lower() for event in events)
+    assert len({event['Event Name'] for event in events}) <= 3
+
+
+def test_date_window_matches_a_scan_of_every_fight(client):
+    events = client.get('/api/data/events').get_json()['events']
+    dates = pd.to_datetime([event['Event Date'] for event in events], utc=True).tz_localize(None)
+    # date_to is a whole day, so it takes in fights on 2024-03-31
+    expected = [event for event, date in zip(events, dates)
+                if pd.Timestamp('2024-01-01') <= date < pd.Timestamp('2024-04-01')]
+
+    found = client.get('/api/data/events?date_from=2024-01-01&date_to=2024-03-31').get_json()['events']
+
+    assert expected and found == expected
+
+
+def test_recent_cards_come_before_the_date_newest_first(client):
+    cards = client.get('/api/data/events/recent?n=4&before=2024-06-01').get_json()['events']
+
+    dates = [card['date'] for card in cards]
+    assert len(cards) == 4
+    assert dates == sorted(dates, reverse=True) and dates[0] < '2024-06-01'
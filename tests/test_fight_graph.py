@@ -0,0 +1,47 @@
+"""A fight graph extended from the previous snapshot must match one built from scratch."""
+from aggregates import fight_table
+from conftest import corrected_decision, without_latest_events
+from fight_graph import FightGraph, fight_graph
+
+
+def fresh_graph(snapshot):
+    graph = FightGraph()
+    graph.add(fight_table(snapshot))
+    return graph
+
+
+def assert_same_graph(graph, expected):
+    assert graph.fights == expected.fights
+    assert graph.signatures == expected.signatures
+    assert graph.opponents == expected.opponents
+    assert graph.beat == expected.beat
+    assert graph.names == expected.names
+    assert graph.name_index == expected.name_index
+
+
+def test_new_fights_extend_the_previous_graph(raw_events, make_snapshot, caplog):
+    old = make_snapshot(without_latest_events(raw_events))
+    previous = fight_graph(old)
+    frozen = previous.copy()
+    current = make_snapshot(raw_events, previous=old)
+    added = len(fight_table(current)) - len(fight_table(old))
+
+    with caplog.at_level('INFO', logger='fight_graph'):
+        graph = fight_graph(current)
+
+    assert f"Fight graph extended with {added} fights" in caplog.text
+    assert_same_graph(graph, fresh_graph(current))
+    # Extending copies on write, so the previous snapshot's graph is left as it was
+    assert_same_graph(previous, frozen)
+
+
+def test_corrected_past_result_rebuilds_the_graph(raw_events, make_snapshot, caplog):
+    old = make_snapshot(without_latest_events(raw_events))
+    fight_graph(old)
+    current = make_snapshot(corrected_decision(raw_events, 'Winning Fighter', 'Fighter 2'), previous=old)
+
+    with caplog.at_level('INFO', logger='fight_graph'):
+        graph = fight_graph(current)
+
+    assert 'Fight graph extended' not in caplog.text
+    assert_same_graph(graph, fresh_graph(current))
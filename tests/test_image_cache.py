@@ -0,0 +1,50 @@
+"""The image cache downloads each image once and keeps its disk work off the event loop."""
+import asyncio
+import os
+import threading
+from types import SimpleNamespace
+
+from image_cache import ImageCache
+
+IMAGE_BYTES = 1000
+
+
+class Files:
+    def __init__(self):
+        self.downloads = []
+
+    async def content(self, file_id):
+        self.downloads.append(file_id)
+        await asyncio.sleep(0.01)
+        return SimpleNamespace(content=b'\x89PNG' + b'x' * (IMAGE_BYTES - 4))
+
+
+def test_images_are_stored_and_evicted_off_the_loop(tmp_path, monkeypatch):
+    files = Files()
+    cache = ImageCache(SimpleNamespace(client=SimpleNamespace(files=files)), directory=str(tmp_path),
+                       max_bytes=IMAGE_BYTES * 3)
+    store_threads = []
+    store = cache._store
+
+    def spy(*args):
+        store_threads.append(threading.current_thread())
+        return store(*args)
+
+    monkeypatch.setattr(cache, '_store', spy)
+
+    async def main():
+        # Concurrent requests for one image share a download
+        first = await asyncio.gather(*(cache.fetch('file-a') for _ in range(3)))
+        for file_id in ('file-b', 'file-c', 'file-d', 'file-e'):
+            await cache.fetch(file_id)
+        return first
+
+    paths = asyncio.run(main())
+
+    assert len(set(paths)) == 1
+    assert files.downloads == ['file-a', 'file-b', 'file-c', 'file-d', 'file-e']
+    assert store_threads and threading.main_thread() not in store_threads
+    # Going over the bound evicted the least recently used images
+    cached = sorted(name for name in os.listdir(tmp_path) if name.endswith('.png'))
+    assert sum(os.path.getsize(tmp_path / name) for name in cached) <= IMAGE_BYTES * 3
+    assert cached == ['file-c.png', 'file-d.png', 'file-e.png']
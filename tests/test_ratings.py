@@ -0,0 +1,49 @@
+"""Incrementally advanced Elo ratings must match a full replay of the same fights."""
+import pytest
+
+from aggregates import fight_table
+from conftest import corrected_decision, without_latest_events
+from ratings import EloRatings, ratings
+
+
+def full_replay(snapshot):
+    state = EloRatings()
+    state.advance(fight_table(snapshot))
+    return state
+
+
+def assert_same_ratings(state, expected):
+    assert state.ratings == pytest.approx(expected.ratings)
+    assert state.history == expected.history
+    assert state.fights_processed == expected.fights_processed
+
+
+def test_new_fights_are_applied_incrementally(raw_events, make_snapshot, caplog):
+    old = make_snapshot(without_latest_events(raw_events))
+    ratings(old)
+    current = make_snapshot(raw_events, previous=old)
+    added = len(fight_table(current)) - len(fight_table(old))
+
+    with caplog.at_level('INFO', logger='ratings'):
+        state = ratings(current)
+
+    assert f"Ratings advanced by {added} fights" in caplog.text
+    assert state is not ratings(old)
+    assert_same_ratings(state, full_replay(current))
+
+
+def test_corrected_past_result_replays_all_fights(raw_events, make_snapshot):
+    old = make_snapshot(without_latest_events(raw_events))
+    ratings(old)
+    # Flip the winner of a decision long before the checkpoint
+    current = make_snapshot(corrected_decision(raw_events, 'Winning Fighter', 'Fighter 2'), previous=old)
+
+    assert_same_ratings(ratings(current), full_replay(current))
+
+
+def test_corrected_past_method_replays_all_fights(raw_events, make_snapshot):
+    old = make_snapshot(without_latest_events(raw_events))
+    ratings(old)
+    current = make_snapshot(corrected_decision(raw_events, 'Winning Method', 'KO (Punches)'), previous=old)
+
+    assert_same_ratings(ratings(current), full_replay(current))
@@ -0,0 +1,73 @@
+"""Ranked full-text search over the events data."""
+import pandas as pd
+
+from search import EventSearchIndex
+
+EVENTS = pd.DataFrame({
+    'Fighter 1': ['Sean O\'Malley', 'Jose Aldo', 'Conor McGregor', 'Max Holloway'],
+    'Fighter 2': ['Marlon Vera', 'Conor McGregor', 'Nate Diaz', 'Jose Aldo'],
+    'Event Name': ['UFC 299', 'UFC 194', 'UFC 202', 'UFC 218'],
+    'Referee': ['Herb Dean', 'John McCarthy', 'Herb Dean', 'Herb Dean'],
+    'Event Location': ['Miami, Florida', 'Las Vegas, Nevada', 'Las Vegas, Nevada', 'Detroit, Michigan'],
+    'Winning Method': ['Decision (Unanimous)', 'KO (Punch)', 'Decision (Majority)', 'TKO (Punches)'],
+}, index=[10, 11, 12, 13])
+
+
+def rows(hits):
+    return {row for row, _ in hits[1]}
+
+
+def test_every_term_must_match():
+    index = EventSearchIndex(EVENTS)
+
+    assert rows(index.search('aldo')) == {11, 13}
+    assert rows(index.search('aldo detroit')) == {13}
+    assert index.search('aldo miami') == (0, [])
+    assert index.search('khabib') == (0, [])
+
+
+def test_matches_in_fighter_names_rank_first():
+    # Same words in both rows; only the field holding "herb" differs
+    events = pd.DataFrame({
+        'Fighter 1': ['Herb Smith', 'Dan Smith'],
+        'Fighter 2': ['Al Jones', 'Al Jones'],
+        'Event Name': ['UFC 1', 'UFC 1'],
+        'Referee': ['Dan Miragliotta', 'Herb Miragliotta'],
+        'Event Location': ['Denver', 'Denver'],
+        'Winning Method': ['KO', 'KO'],
+    }, index=[5, 6])
+
+    total, hits = EventSearchIndex(events).search('herb')
+
+    assert total == 2 and [row for row, _ in hits] == [5, 6]
+    assert hits[0][1] > hits[1][1]
+
+
+def test_phrases_accents_and_apostrophes():
+    index = EventSearchIndex(EVENTS)
+
+    assert rows(index.search('"herb dean" decision')) == {10, 12}
+    assert index.search('"dean herb"') == (0, [])
+    # A phrase can't run from one field into the next
+    assert index.search('"diaz ufc"') == (0, [])
+    assert rows(index.search('OMALLEY')) == {10}
+    assert rows(index.search('José')) == {11, 13}
+
+
+def test_candidates_and_paging():
+    index = EventSearchIndex(EVENTS)
+
+    assert rows(index.search('herb', candidates={12, 13})) == {12, 13}
+    total, first = index.search('herb', limit=2)
+    _, rest = index.search('herb', limit=2, offset=2)
+    assert total == 3 and len(first) == 2 and len(rest) == 1
+    assert {row for row, _ in first + rest} == {10, 12, 13}
+
+
+def test_search_route_scores_results(client):
+    body = client.get('/api/search/events?q="jon jones"&limit=5').get_json()
+
+    assert body['total'] >= 5 and len(body['results']) == 5
+    scores = [result['score'] for result in body['results']]
+    assert scores == sorted(scores, reverse=True)
+    assert all('Jon Jones' in (result['Fighter 1'], result['Fighter 2']) for result in body['results'])
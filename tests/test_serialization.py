@@ -0,0 +1,51 @@
+"""JSON encoding must produce valid JSON with or without orjson installed."""
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import serialization
+from serialization import dumps
+
+VALUES = {
+    'nan': float('nan'),
+    'inf': float('inf'),
+    'numpy': [np.float64('nan'), np.float32('-inf'), np.float32(1.5), np.int64(3)],
+    'array': np.array([1.0, np.nan]),
+    'nested': ({'ok': 0.25, 'missing': np.nan},),
+    'date': pd.Timestamp('2025-06-07'),
+}
+EXPECTED = {
+    'nan': None,
+    'inf': None,
+    'numpy': [None, None, 1.5, 3],
+    'array': [1.0, None],
+    'nested': [{'ok': 0.25, 'missing': None}],
+    'date': '2025-06-07T00:00:00',
+}
+
+
+def strict_loads(body):
+    def reject(constant):
+        raise ValueError(f'invalid JSON constant {constant}')
+    return json.loads(body, parse_constant=reject)
+
+
+@pytest.mark.parametrize('use_orjson', [True, False])
+def test_non_finite_floats_become_null(use_orjson, monkeypatch):
+    if use_orjson and serialization.orjson is None:
+        pytest.skip('orjson is not installed')
+    if not use_orjson:
+        monkeypatch.setattr(serialization, 'orjson', None)
+
+    assert strict_loads(dumps(VALUES)) == EXPECTED
+
+
+def test_search_results_with_missing_fields_are_valid_json(app_module, client, monkeypatch):
+    monkeypatch.setattr(serialization, 'orjson', None)
+
+    response = client.get('/api/search/events?q=newark&limit=200')
+
+    assert response.status_code == 200
+    assert strict_loads(response.get_data())['results']
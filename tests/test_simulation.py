@@ -0,0 +1,48 @@
+"""Fight simulations, through the API and the assistant's simulate_fight function."""
+import json
+
+import pytest
+
+from chat_tools import call_function
+
+
+def test_simulation_rejects_a_fighter_against_themself(client):
+    response = client.get('/api/simulate?fighter1=Jon Jones&fighter2=Jon Jones')
+
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'fighter1 and fighter2 must be different fighters'}
+
+
+def test_simulation_tool_rejects_a_fighter_against_themself(app_module):
+    output = call_function(app_module.get_snapshot(), 'simulate_fight',
+                           json.dumps({'fighter1': 'Jon Jones', 'fighter2': 'Jon Jones'}))
+
+    assert json.loads(output) == {'error': "Can't simulate a fighter against themself"}
+
+
+def test_seeded_simulation_is_reproducible_and_consistent(client):
+    path = '/api/simulate?fighter1=Jon Jones&fighter2=Daniel Cormier&n=20000&seed=7&rounds=5'
+    first, second = client.get(path).get_json(), client.get(path).get_json()
+
+    for body in (first, second):
+        body.pop('elapsed_ms')
+    assert first == second
+    fighters = first['fighter1'], first['fighter2']
+    assert sum(f['win_probability'] for f in fighters) == pytest.approx(1, abs=1e-3)
+    for fighter in fighters:
+        assert sum(fighter['methods'].values()) == pytest.approx(fighter['win_probability'], abs=1e-3)
+    assert set(first['rounds']) == {'1', '2', '3', '4', '5', 'Decision'}
+    assert sum(first['rounds'].values()) == pytest.approx(1, abs=1e-3)
+    # 20,000 draws land within a couple of points of the model's probability
+    assert fighters[0]['win_probability'] == pytest.approx(first['model_win_probability'], abs=0.02)
+
+
+@pytest.mark.parametrize('query, message', [
+    ('n=0', 'n must be between 1 and 1000000'),
+    ('rounds=4', 'rounds must be 3 or 5'),
+])
+def test_simulation_rejects_bad_settings(client, query, message):
+    response = client.get(f'/api/simulate?fighter1=Jon Jones&fighter2=Daniel Cormier&{query}')
+
+    assert response.status_code == 400
+    assert response.get_json() == {'error': message}
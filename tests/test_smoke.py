@@ -0,0 +1,147 @@
+"""Smoke tests of the chat routes against the mock OpenAI API (see conftest.py)."""
+import json
+import random
+import threading
+import time
+
+from conftest import MOCK_CONFIG
+
+REPLY = MOCK_CONFIG['replies'][0]
+
+
+def post_all(client, bodies):
+    """POST each body to /api/chat at the same moment; the responses in order."""
+    barrier = threading.Barrier(len(bodies))
+    responses = [None] * len(bodies)
+
+    def post(i):
+        barrier.wait()
+        responses[i] = client.post('/api/chat', json=bodies[i])
+
+    threads = [threading.Thread(target=post, args=(i,)) for i in range(len(bodies))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return responses
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.02)
+
+
+def sse_events(body):
+    """(event, data) pairs of a Server-Sent Events body."""
+    events = []
+    for block in body.decode('utf-8').split('\n\n'):
+        if block:
+            name, data = block.split('\n', 1)
+            events.append((name[len('event: '):], json.loads(data[len('data: '):])))
+    return events
+
+
+def test_identical_first_turns_share_one_run(app_module, client):
+    led = app_module.run_coalescer.led
+    responses = post_all(client, [{'message': 'Smoke test: who won the main event?'}] * 8)
+
+    assert [r.status_code for r in responses] == [200] * 8
+    bodies = [r.get_json() for r in responses]
+    assert app_module.run_coalescer.led == led + 1
+    assert sum(1 for b in bodies if b.get('coalesced') or b.get('cached')) == 7
+    assert len({b['response'][0]['content'] for b in bodies}) == 1
+    # Each caller still gets a conversation of its own
+    assert len({b['conversation_id'] for b in bodies}) == 8
+
+
+def test_chat_is_shed_when_no_slot_can_be_queued_for(app_module, client, monkeypatch):
+    admission = app_module.admission
+    monkeypatch.setattr(admission, 'max_in_flight', 1)
+    monkeypatch.setattr(admission, 'max_queued', 0)
+    first = {}
+    holder = threading.Thread(
+        target=lambda: first.update(response=client.post('/api/chat', json={'message': 'Smoke test: slot holder'})))
+    holder.start()
+    wait_for(lambda: admission.stats()['in_flight'] == 1)
+
+    shed = client.post('/api/chat', json={'message': 'Smoke test: shed request'})
+    holder.join()
+
+    assert shed.status_code == 429
+    assert int(shed.headers['Retry-After']) >= 1
+    assert first['response'].status_code == 200
+    # Leases are given back off the event loop, shortly after the run
+    wait_for(lambda: admission.stats()['in_flight'] == 0)
+
+
+def test_history_sync_lists_only_new_messages(app_module, client, monkeypatch):
+    listed = []
+    messages = app_module.runtime.client.beta.threads.messages
+    list_messages = messages.list
+
+    def spy(**params):
+        listed.append(params)
+        return list_messages(**params)
+
+    monkeypatch.setattr(messages, 'list', spy)
+    first = client.post('/api/chat', json={'message': 'Smoke test: history, first turn'}).get_json()
+    conversation_id = first['conversation_id']
+    history = client.post('/api/chat/history', json={'conversation_id': conversation_id}).get_json()
+    assert [m['role'] for m in history['messages']] == ['user', 'assistant']
+
+    thread_id = app_module.thread_store.get(conversation_id)['thread_id']
+    cursor = app_module.history_store._history(thread_id).cursor
+    assert cursor is not None
+    reply = client.post('/api/chat', json={'message': 'Smoke test: history, follow-up',
+                                           'conversation_id': conversation_id})
+    assert reply.status_code == 200
+    del listed[:]
+    history = client.post('/api/chat/history', json={'conversation_id': conversation_id}).get_json()
+
+    assert [m['role'] for m in history['messages']] == ['user', 'assistant', 'user', 'assistant']
+    assert [params.get('after') for params in listed] == [cursor]
+    assert app_module.history_store._history(thread_id).cursor != cursor
+
+
+def test_streamed_reply_is_cleaned_like_the_whole_text(app_module, client):
+    response = client.post('/api/chat/stream', json={'message': 'Smoke test: streamed reply'})
+    events = sse_events(response.get_data())
+
+    assert events[0][0] == 'start' and events[-1][0] == 'done'
+    streamed = ''.join(data['text'] for name, data in events if name == 'delta')
+    assert streamed == app_module.clean_markdown_simple(REPLY)
+
+
+def test_markdown_stream_cleaner_matches_whole_text_cleaning(app_module):
+    rng = random.Random(0)
+    alphabet = ['#', '#', ' ', '\n', '\n', '*', 'a', 'b', '\t', '\r', '\xa0', 'x ']
+    cases = ['#\n\nText', '## \n\n## Title\nbody', '# \n  # x', '##', '#\n', '**bold** # not a heading']
+    cases += [''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 30))) for _ in range(2000)]
+    for text in cases:
+        cuts = sorted(rng.sample(range(len(text) + 1), min(rng.randint(0, 6), len(text) + 1)))
+        pieces = [text[a:b] for a, b in zip([0] + cuts, cuts + [len(text)])]
+        cleaner = app_module.MarkdownStreamCleaner()
+        streamed = ''.join(cleaner.feed(piece) for piece in pieces) + cleaner.flush()
+        assert streamed == app_module.clean_markdown_simple(text), pieces
+
+
+def test_custom_assistant_runs_keep_their_own_tools(app_module, client, monkeypatch):
+    runs = app_module.runtime.client.beta.threads.runs
+    sent = []
+    for name in ('create', 'stream'):
+        method = getattr(runs, name)
+        monkeypatch.setattr(runs, name, lambda method=method, **params: sent.append(params) or method(**params))
+
+    assert client.post('/api/chat', json={'message': 'Smoke test: default assistant'}).status_code == 200
+    for path in ('/api/chat', '/api/chat/stream'):
+        response = client.post(path, json={'message': f'Smoke test: custom assistant via {path}',
+                                           'assistant_id': 'asst_custom'})
+        assert response.status_code == 200
+        response.get_data()
+
+    default, *custom = sent
+    assert default['tools'] == app_module.RUN_TOOLS and 'additional_instructions' in default
+    assert [params['assistant_id'] for params in custom] == ['asst_custom', 'asst_custom']
+    assert not any('tools' in params or 'additional_instructions' in params for params in custom)
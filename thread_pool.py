@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+
+import openai
+
+logger = logging.getLogger(__name__)
+
+# Empty threads kept ready per worker
+POOL_SIZE = int(os.getenv('THREAD_POOL_SIZE', '4'))
+# Pooled threads older than this are deleted and replaced rather than handed out
+MAX_AGE_SECONDS = int(os.getenv('THREAD_POOL_MAX_AGE', str(6 * 60 * 60)))
+# After a failed create, the pool stops refilling for a while instead of hammering the API
+RETRY_SECONDS = 30
+
+
+class ThreadPool:
+    """Empty assistant threads created ahead of time, so a new conversation needn't wait for one.
+
+    Taking a thread is instant when the pool has one; each take starts creating a replacement
+    in the background. The pool lives on the chat runtime's loop and belongs to one process:
+    after a fork it starts empty, so two workers never hand out the same thread. It fills when
+    warmed (or on the first take), and a background task recycles threads past the age limit.
+    """
+
+    def __init__(self, runtime, size=POOL_SIZE, max_age=MAX_AGE_SECONDS):
+        self.runtime = runtime
+        self.size = size
+        self.max_age = max_age
+        self._pid = None
+        self._ready = deque()  # (thread id, created at), oldest first
+        self._creating = 0
+        self._retry_at = 0
+        self._recycler = None
+        self.hits = 0
+        self.misses = 0
+        self.recycled = 0
+
+    def _for_this_process(self):
+        if self._pid != os.getpid():
+            self._ready, self._creating, self._recycler = deque(), 0, None
+            self._pid = os.getpid()
+
+    def warm(self):
+        """Start filling the pool from outside the loop, e.g. when a gunicorn worker starts."""
+        self.runtime.loop.call_soon_threadsafe(self._maintain)
+
+    def _maintain(self):
+        self._for_this_process()
+        self._recycle_expired()
+        self._refill()
+        if self._recycler is None or self._recycler.done():
+            self._recycler = asyncio.ensure_future(self._recycle_periodically())
+
+    async def take(self):
+        """The ID of a new empty thread: a pooled one if ready, otherwise one created now."""
+        self._for_this_process()
+        self._recycle_expired()
+        entry = self._ready.popleft() if self._ready else None
+        self._maintain()
+        if entry is not None:
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        thread = await self.runtime.client.beta.threads.create()
+        return thread.id
+
+    def _refill(self):
+        if time.time() < self._retry_at:
+            return
+        for _ in range(self.size - len(self._ready) - self._creating):
+            self._creating += 1
+            asyncio.ensure_future(self._create())
+
+    async def _create(self):
+        try:
+            thread = await self.runtime.client.beta.threads.create()
+        except Exception as e:
+            self._retry_at = time.time() + RETRY_SECONDS
+            logger.warning(f"Could not pre-create a thread: {str(e)}")
+        else:
+            self._ready.append((thread.id, time.time()))
+        finally:
+            self._creating -= 1
+
+    def _recycle_expired(self):
+        cutoff = time.time() - self.max_age
+        while self._ready and self._ready[0][1] < cutoff:
+            thread_id, _ = self._ready.popleft()
+            self.recycled += 1
+            asyncio.ensure_future(self._delete(thread_id))
+
+    async def _delete(self, thread_id):
+        try:
+            await self.runtime.client.beta.threads.delete(thread_id)
+        except openai.NotFoundError:
+            # Already gone, e.g. expired on the API side: nothing to clean up
+            pass
+        except Exception as e:
+            logger.warning(f"Could not delete expired pooled thread {thread_id}: {str(e)}")
+
+    async def _recycle_periodically(self):
+        while True:
+            await asyncio.sleep(max(self.max_age / 4, 1))
+            self._maintain()
+
+    def stats(self):
+        taken = self.hits + self.misses
+        return {
+            'size': self.size,
+            'ready': len(self._ready) if self._pid == os.getpid() else 0,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / taken, 3) if taken else None,
+            'recycled': self.recycled,
+        }
@@ -0,0 +1,231 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from runtime_state import STATE_DIR
+
+DB_PATH = os.path.join(STATE_DIR, 'threads.sqlite3')
+THREAD_TTL_SECONDS = int(os.getenv('THREAD_TTL_DAYS', '30')) * 24 * 60 * 60
+MAX_CACHED = 1024
+PURGE_INTERVAL_SECONDS = 60 * 60
+
+
+class ThreadStore(ABC):
+    """Maps conversation IDs to Assistants thread IDs, with per-conversation metadata.
+
+    Records are dicts with conversation_id, thread_id, assistant_id, created_at, last_active and
+    message_count. Subclasses provide the storage; anything shared between processes (SQLite
+    here, or e.g. a Redis or Postgres implementation) lets any worker continue any conversation.
+    Coroutines on the chat runtime's loop use the ``a``-prefixed methods, which keep blocking
+    storage I/O off the loop.
+    """
+
+    @abstractmethod
+    def get(self, conversation_id):
+        """The conversation's record, or None if it is unknown or has expired."""
+
+    @abstractmethod
+    def put(self, conversation_id, thread_id, assistant_id=None, message_count=0):
+        """Store the conversation's thread, replacing any earlier one."""
+
+    @abstractmethod
+    def touch(self, conversation_id, assistant_id=None, messages=0):
+        """Record activity on a conversation: refresh last_active and add to its message count."""
+
+    @abstractmethod
+    def purge(self):
+        """Drop conversations idle for longer than the TTL."""
+
+    @abstractmethod
+    def delete(self, conversation_id):
+        """Forget a conversation, so its next turn starts a new thread."""
+
+    async def aget(self, conversation_id):
+        return await asyncio.to_thread(self.get, conversation_id)
+
+    async def aput(self, conversation_id, thread_id, assistant_id=None, message_count=0):
+        await asyncio.to_thread(self.put, conversation_id, thread_id, assistant_id, message_count)
+
+    async def atouch(self, conversation_id, assistant_id=None, messages=0):
+        await asyncio.to_thread(self.touch, conversation_id, assistant_id, messages)
+
+    async def adelete(self, conversation_id):
+        await asyncio.to_thread(self.delete, conversation_id)
+
+
+class SQLiteThreadStore(ThreadStore):
+    """Thread store in an embedded SQLite database, shared by every worker on the machine."""
+
+    def __init__(self, path=DB_PATH, ttl=THREAD_TTL_SECONDS):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._last_purge = 0
+
+    def _connection(self):
+        # One connection per process; connections must not be carried across a fork
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS conversations (
+                    conversation_id TEXT PRIMARY KEY,
+                    thread_id TEXT NOT NULL,
+                    assistant_id TEXT,
+                    created_at REAL NOT NULL,
+                    last_active REAL NOT NULL,
+                    message_count INTEGER NOT NULL DEFAULT 0
+                )''')
+            conn.execute('CREATE INDEX IF NOT EXISTS conversations_last_active ON conversations (last_active)')
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._connection().execute(sql, params).fetchall()
+
+    def get(self, conversation_id):
+        rows = self._execute('SELECT * FROM conversations WHERE conversation_id = ? AND last_active >= ?',
+                             (conversation_id, time.time() - self.ttl))
+        return dict(rows[0]) if rows else None
+
+    def put(self, conversation_id, thread_id, assistant_id=None, message_count=0):
+        now = time.time()
+        self._execute('''
+            INSERT INTO conversations (conversation_id, thread_id, assistant_id, created_at, last_active, message_count)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (conversation_id) DO UPDATE SET
+                thread_id = excluded.thread_id, last_active = excluded.last_active''',
+            (conversation_id, thread_id, assistant_id, now, now, message_count))
+        if now - self._last_purge > PURGE_INTERVAL_SECONDS:
+            self.purge()
+
+    def touch(self, conversation_id, assistant_id=None, messages=0):
+        self._execute('''
+            UPDATE conversations SET last_active = ?, message_count = message_count + ?,
+                assistant_id = COALESCE(?, assistant_id)
+            WHERE conversation_id = ?''', (time.time(), messages, assistant_id, conversation_id))
+
+    def purge(self):
+        self._last_purge = time.time()
+        self._execute('DELETE FROM conversations WHERE last_active < ?', (time.time() - self.ttl,))
+
+    def delete(self, conversation_id):
+        self._execute('DELETE FROM conversations WHERE conversation_id = ?', (conversation_id,))
+
+
+class CachedThreadStore(ThreadStore):
+    """An in-memory LRU in front of another thread store.
+
+    A conversation's thread never changes, so lookups are answered from memory; activity and
+    metadata updates are written through to the backing store.
+    """
+
+    def __init__(self, backend, max_entries=MAX_CACHED):
+        self.backend = backend
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def _remember(self, record):
+        with self._lock:
+            self._entries[record['conversation_id']] = record
+            self._entries.move_to_end(record['conversation_id'])
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _cached(self, conversation_id):
+        """The remembered record, if it is fresh enough to answer from memory."""
+        with self._lock:
+            record = self._entries.get(conversation_id)
+            if record is not None:
+                self._entries.move_to_end(conversation_id)
+        if record is not None and record['last_active'] >= time.time() - self.backend.ttl:
+            return dict(record)
+        return None
+
+    def _loaded(self, conversation_id, record):
+        if record is None:
+            with self._lock:
+                self._entries.pop(conversation_id, None)
+            return None
+        self._remember(record)
+        return dict(record)
+
+    def get(self, conversation_id):
+        record = self._cached(conversation_id)
+        if record is not None:
+            return record
+        # Unknown here, or idle long enough locally that another worker's activity may matter
+        return self._loaded(conversation_id, self.backend.get(conversation_id))
+
+    async def aget(self, conversation_id):
+        record = self._cached(conversation_id)
+        if record is not None:
+            return record
+        return self._loaded(conversation_id, await self.backend.aget(conversation_id))
+
+    def _put_local(self, conversation_id, thread_id, assistant_id, message_count):
+        now = time.time()
+        self._remember({
+            'conversation_id': conversation_id,
+            'thread_id': thread_id,
+            'assistant_id': assistant_id,
+            'created_at': now,
+            'last_active': now,
+            'message_count': message_count,
+        })
+
+    def put(self, conversation_id, thread_id, assistant_id=None, message_count=0):
+        self.backend.put(conversation_id, thread_id, assistant_id, message_count)
+        self._put_local(conversation_id, thread_id, assistant_id, message_count)
+
+    async def aput(self, conversation_id, thread_id, assistant_id=None, message_count=0):
+        await self.backend.aput(conversation_id, thread_id, assistant_id, message_count)
+        self._put_local(conversation_id, thread_id, assistant_id, message_count)
+
+    def _touch_local(self, conversation_id, assistant_id, messages):
+        with self._lock:
+            record = self._entries.get(conversation_id)
+            if record is not None:
+                record['last_active'] = time.time()
+                record['message_count'] += messages
+                record['assistant_id'] = assistant_id or record['assistant_id']
+
+    def touch(self, conversation_id, assistant_id=None, messages=0):
+        self.backend.touch(conversation_id, assistant_id, messages)
+        self._touch_local(conversation_id, assistant_id, messages)
+
+    async def atouch(self, conversation_id, assistant_id=None, messages=0):
+        await self.backend.atouch(conversation_id, assistant_id, messages)
+        self._touch_local(conversation_id, assistant_id, messages)
+
+    def delete(self, conversation_id):
+        with self._lock:
+            self._entries.pop(conversation_id, None)
+        self.backend.delete(conversation_id)
+
+    async def adelete(self, conversation_id):
+        with self._lock:
+            self._entries.pop(conversation_id, None)
+        await self.backend.adelete(conversation_id)
+
+    def purge(self):
+        self.backend.purge()
+        cutoff = time.time() - self.backend.ttl
+        with self._lock:
+            for conversation_id in [c for c, r in self._entries.items() if r['last_active'] < cutoff]:
+                del self._entries[conversation_id]
+
+
+def open_thread_store(path=DB_PATH):
+    """The default thread store: SQLite with an in-memory LRU in front."""
+    return CachedThreadStore(SQLiteThreadStore(path))
@@ -0,0 +1,173 @@
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAX_TRACES = int(os.getenv('TRACE_BUFFER_SIZE', '1000'))
+# Optional JSONL file every finished trace is appended to
+TRACE_FILE = os.getenv('TRACE_FILE')
+PERCENTILES = (50, 95, 99)
+
+# The trace of the request being handled. Contexts are copied into tasks and into coroutines
+# handed to the chat runtime, so spans recorded on the event loop land in the request's trace.
+current_trace = ContextVar('current_trace', default=None)
+
+
+class Trace:
+    """Timed phases (spans) of one request, with request-level attributes such as token usage."""
+
+    def __init__(self, name, **attributes):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.started_at = time.time()
+        self.attributes = attributes
+        self.spans = []
+        self.duration = None
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, phase, start, seconds, **attributes):
+        with self._lock:
+            # Background work that outlives the request (e.g. seeding a thread) isn't part of it
+            if self.duration is None:
+                self.spans.append({
+                    'phase': phase,
+                    'start_ms': round((start - self._start) * 1000, 2),
+                    'duration_ms': round(seconds * 1000, 2),
+                    **attributes,
+                })
+
+    def finish(self):
+        with self._lock:
+            self.duration = time.perf_counter() - self._start
+
+    def phase_totals(self):
+        """Milliseconds per phase, summed over repeated spans (e.g. one poll per tool round)."""
+        totals = {}
+        for s in self.spans:
+            totals[s['phase']] = totals.get(s['phase'], 0) + s['duration_ms']
+        totals['total'] = round(self.duration * 1000, 2)
+        return totals
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'name': self.name,
+            'started_at': self.started_at,
+            'duration_ms': round(self.duration * 1000, 2) if self.duration is not None else None,
+            'attributes': self.attributes,
+            'spans': list(self.spans),
+        }
+
+
+@contextmanager
+def span(phase, **attributes):
+    """Time a phase of the current trace; a no-op outside of a trace."""
+    trace = current_trace.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if trace is not None:
+            trace.add(phase, start, time.perf_counter() - start, **attributes)
+
+
+def record(phase, seconds, **attributes):
+    """Add a phase measured some other way, e.g. from timestamps on a run object."""
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add(phase, time.perf_counter() - seconds, seconds, **attributes)
+
+
+def annotate(**attributes):
+    """Attach attributes (token usage, where the answer came from, ...) to the current trace."""
+    trace = current_trace.get()
+    if trace is not None:
+        trace.attributes.update(attributes)
+
+
+class Tracer:
+    """Keeps the most recent finished traces in a ring buffer, optionally also appending them to a JSONL file."""
+
+    def __init__(self, max_traces=MAX_TRACES, path=TRACE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._traces = deque(maxlen=max_traces)
+
+    @contextmanager
+    def trace(self, name, **attributes):
+        trace = Trace(name, **attributes)
+        token = current_trace.set(trace)
+        try:
+            yield trace
+        except BaseException as e:
+            trace.attributes['error'] = f"{type(e).__name__}: {str(e)}"
+            raise
+        finally:
+            current_trace.reset(token)
+            trace.finish()
+            self._export(trace)
+
+    async def traced(self, name, coro, **attributes):
+        """Await ``coro`` in a trace of its own, e.g. a background job that outlives its request."""
+        with self.trace(name, **attributes):
+            return await coro
+
+    def route(self, name):
+        """Decorator tracing a Flask view; the response status is recorded on the trace."""
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                with self.trace(name) as trace:
+                    result = view(*args, **kwargs)
+                    status = result[1] if isinstance(result, tuple) and len(result) > 1 else getattr(
+                        result, 'status_code', 200)
+                    trace.attributes['status'] = status
+                    return result
+            return wrapper
+        return decorator
+
+    def _export(self, trace):
+        with self._lock:
+            self._traces.append(trace)
+        if self.path:
+            try:
+                with open(self.path, 'a') as f:
+                    f.write(json.dumps(trace.to_dict(), default=str) + '\n')
+            except OSError as e:
+                logger.warning(f"Could not write trace to {self.path}: {str(e)}")
+
+    def recent(self, name=None, limit=50):
+        with self._lock:
+            traces = [t for t in self._traces if name is None or t.name == name]
+        return [t.to_dict() for t in traces[::-1][:limit]]
+
+    def percentiles(self, name=None):
+        """p50/p95/p99 milliseconds per phase over the buffered traces, by trace name."""
+        with self._lock:
+            traces = [t for t in self._traces if name is None or t.name == name]
+        by_name = {}
+        for trace in traces:
+            phases = by_name.setdefault(trace.name, {})
+            for phase, ms in trace.phase_totals().items():
+                phases.setdefault(phase, []).append(ms)
+        return {
+            trace_name: {
+                phase: {
+                    'count': len(values),
+                    **{f'p{q}': round(float(v), 2) for q, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))},
+                }
+                for phase, values in phases.items()
+            }
+            for trace_name, phases in by_name.items()
+        }
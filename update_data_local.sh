@@ -1,6 +1,6 @@
 #!/bin/bash
 
-scp app.py Trinity:/home/trinity/mma-ai-swift-app/app.py
+scp app.py serialization.py datasets.py aggregates.py ratings.py fight_graph.py event_queries.py search.py simulation.py predictions.py previews.py chat_runtime.py chat_jobs.py response_cache.py image_cache.py history_store.py thread_store.py intents.py chat_tools.py run_coalescer.py admission.py tracing.py thread_pool.py runtime_state.py gunicorn.conf.py Trinity:/home/trinity/mma-ai-swift-app/
 scp mma-ai-swift/mma-ai-swift/* Trinity:/home/trinity/mma-ai-swift-app/mma-ai-swift/mma-ai-swift/
 scp responses-api-news.py Trinity:/home/trinity/mma-ai-swift-app/
 scp data/* Trinity:/home/trinity/mma-ai-swift-app/data/
\ No newline at end of file